@@ -1,10 +1,23 @@
 #!/usr/bin/env python
 
+import os
 import csv
-import hashlib
+import sys
+import json
+import shutil
+import tempfile
+import contextlib
 
 import click
 from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from genome_mapping import checksums
+from genome_mapping import sequences
+from genome_mapping.mappers import MIN_BLAT_SEQ_LEN
 
 
 class ReadableBioFile(click.File):
@@ -27,6 +40,27 @@ class WriteableBioFile(click.File):
         return lambda s: SeqIO.write(s, fileobj, self._format)
 
 
+@contextlib.contextmanager
+def local_file(handle):
+    """Get the name of the file handle reads from. Input from stdin is copied
+    to a temporary file first, for commands which need to map or index it.
+    """
+
+    filename = getattr(handle, 'name', '-')
+    if not filename.startswith('<'):
+        yield filename
+        return
+
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'input.fasta')
+        with open(filename, 'wb') as out:
+            shutil.copyfileobj(handle, out)
+        yield filename
+    finally:
+        shutil.rmtree(directory)
+
+
 @click.group()
 def main():
     pass
@@ -38,26 +72,47 @@ def md5():
 
 
 @md5.command('display')
-@click.argument('fasta', type=ReadableBioFile('fasta'))
+@click.argument('fasta', type=click.File(mode='rb'))
 @click.argument('save', type=click.File(mode='wb'))
-def md5_display(fasta, save):
+@click.option('--processes', type=int, default=None,
+              help='The number of processes to hash with')
+def md5_display(fasta, save, processes=None):
+    """
+    Write the id and md5 of the sequence of each record, in file order. The
+    file is scanned as raw bytes and hashed in parallel. Input from stdin is
+    copied to a temporary file first.
+    """
     writer = csv.writer(save, delimiter='\t')
-    for record in fasta:
-        seq = str(record.seq).strip()
-        md5 = hashlib.md5(seq).hexdigest()
-        writer.writerow([record.id, md5])
+    with local_file(fasta) as filename:
+        writer.writerows(sequences.md5s(filename, processes=processes))
 
 
 @md5.command('validate')
 @click.argument('filename', type=click.File(mode='rb'))
-@click.argument('correct', type=click.File(mode='rb'))
+@click.argument('correct', type=click.Path(exists=True, dir_okay=False))
 @click.argument('save', type=click.File(mode='wb'))
-def md5_validate(filename, correct, save):
-    correct = {r[0]: r[1] for r in csv.reader(correct, delimiter='\t')}
+@click.option('--sort-merge', is_flag=True, default=False,
+              help='Sort the rows and merge them with the table')
+def md5_validate(filename, correct, save, sort_merge=False):
+    """
+    Check the md5 of each row of a TSV, like the output of md5 display,
+    against the correct TSV. A binary table of the correct md5's is built
+    next to it once and reused. Each row is looked up in it, or with
+    --sort-merge, all rows are sorted and read along with it, which uses
+    constant memory for any number of rows. Ids without a correct md5 are
+    MISSING.
+    """
+    try:
+        table = checksums.Md5Table(correct)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    rows = ((r[0], r[1]) for r in csv.reader(filename, delimiter='\t'))
+    if sort_merge:
+        results = checksums.validate_sorted(rows, table)
+    else:
+        results = checksums.validate(rows, table)
     writer = csv.writer(save, delimiter='\t')
-    for row in csv.reader(filename, delimiter='\t'):
-        status = 'OK' if row[1] == correct[row[0]] else 'NOT OK'
-        writer.writerow((row[0], status))
+    writer.writerows(results)
 
 
 @main.command('dna-to-rna')
@@ -70,52 +125,70 @@ def dna_to_rna(fasta, save):
 
 
 @main.command('merge-by-id')
-@click.argument('fasta', type=ReadableBioFile('fasta'))
+@click.argument('fasta', type=click.File(mode='rb'))
 @click.argument('save', type=WriteableBioFile('fasta'))
 def merge_by_id(fasta, save):
-    unique = {}
-    for record in fasta:
-        if record.id not in unique:
-            unique[record.id] = record
-            continue
-
-        rest = record.description.replace(record.id, '')
-        unique[record.id].description += ',%s' % rest
-
-    for record in unique.itervalues():
-        save(record)
+    """
+    Merge records with the same id into one, in the order ids first appear.
+    Memory use does not grow with the size of the file. Input from stdin is
+    copied to a temporary file first, since the merge needs to index it.
+    """
+    with local_file(fasta) as filename:
+        merged = sequences.merged(filename)
+        save(SeqRecord(Seq(s), id=n, description=d) for (n, d, s) in merged)
 
 
 @main.command('extract-by-ids')
-@click.argument('fasta', type=ReadableBioFile('fasta'))
+@click.argument('fasta', type=click.Path(exists=True, dir_okay=False))
 @click.argument('targets', nargs=-1)
-@click.argument('save', type=WriteableBioFile('fasta'))
+@click.argument('save', type=click.File(mode='wb'))
 def extract_by_ids(fasta, targets, save):
-    required = set(t.strip() for t in targets)
-    for record in fasta:
-        if record.id in required:
-            save(record)
+    """
+    Copy the records with the given ids, using the id index of the file
+    which is built or rebuilt as needed.
+    """
+    index = sequences.IdIndex(fasta)
+    index.extract((t.strip() for t in targets), save)
 
 
 @main.command('extract-by-id-file')
-@click.argument('fasta', type=ReadableBioFile('fasta'))
+@click.argument('fasta', type=click.Path(exists=True, dir_okay=False))
 @click.argument('targets', type=click.File(mode='rb'))
-@click.argument('save', type=WriteableBioFile('fasta'))
+@click.argument('save', type=click.File(mode='wb'))
 def extract_by_id_file(fasta, targets, save):
-    required = set(t.strip() for t in targets)
-    for record in fasta:
-        if record.id in required:
-            save(record)
+    """
+    Copy the records with the ids listed in targets, one per line, using
+    the id index of the file.
+    """
+    index = sequences.IdIndex(fasta)
+    index.extract((t.strip() for t in targets), save)
 
 
 @main.command('count')
-@click.argument('fasta', type=ReadableBioFile('fasta'))
+@click.argument('fasta', type=click.Path(exists=True, dir_okay=False))
 @click.argument('save', type=click.File(mode='wb'))
 def count(fasta, save):
-    count = 0
-    for seq in fasta:
-        count += 1
-    save.write(count + "\n")
+    """
+    Write the number of records in the file.
+    """
+    buffer = sequences.mapped(fasta)
+    count = sum(1 for _ in sequences.spans(buffer))
+    save.write('%i\n' % count)
+
+
+@main.command('stats')
+@click.argument('fasta', type=click.Path(exists=True, dir_okay=False))
+@click.argument('save', default='-', type=click.File(mode='wb'))
+def stats(fasta, save):
+    """
+    Write statistics of the file as JSON, computed in one pass over it. This
+    includes the number of records, their total and N50 length, a histogram
+    of lengths, GC and ambiguous content, and the number of records which
+    are at most MIN_BLAT_SEQ_LEN long, which BLAT does not search.
+    """
+    summary = sequences.stats(fasta, short=MIN_BLAT_SEQ_LEN)
+    json.dump(summary, save, indent=2, sort_keys=True)
+    save.write('\n')
 
 
 @main.command('uppercase')
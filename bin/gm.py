@@ -4,7 +4,9 @@ import os
 import csv
 import sys
 import cPickle
+import cProfile
 import json
+import time
 import itertools as it
 from pprint import pprint
 import collections as coll
@@ -13,11 +15,24 @@ import click
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from genome_mapping import utils
+from genome_mapping import bgzf
+from genome_mapping import joins
+from genome_mapping import metrics
+from genome_mapping import aggregates
+from genome_mapping import benchmarks
+from genome_mapping import checkpoints
+from genome_mapping import pileup
+from genome_mapping import grouping
+from genome_mapping import loaders
+from genome_mapping import pipeline
+from genome_mapping import scheduler
+from genome_mapping import predicates
+from genome_mapping import validators
 from genome_mapping import mappers
 from genome_mapping import matchers
 from genome_mapping import formatters
 from genome_mapping.intervals import Tree
+from genome_mapping.data import Overlap
 from genome_mapping.data import RESULT_TYPE
 
 
@@ -29,11 +44,14 @@ class ReadableDataFile(click.File):
 
     def convert(self, value, param, ctx):
         fileobj = super(ReadableDataFile, self).convert(value, param, ctx)
+        return metrics.stream('parse', self.load(fileobj))
+
+    def load(self, fileobj):
         try:
             while True:
                 yield cPickle.load(fileobj)
         except EOFError:
-            raise StopIteration
+            return
 
 
 class WritableDataFile(click.File):
@@ -44,7 +62,7 @@ class WritableDataFile(click.File):
 
     def convert(self, value, param, ctx):
         fileobj = super(WritableDataFile, self).convert(value, param, ctx)
-        return lambda d: cPickle.dump(d, fileobj)
+        return metrics.call('serialize', lambda d: cPickle.dump(d, fileobj))
 
 
 class KeyValue(click.ParamType):
@@ -57,21 +75,75 @@ class KeyValue(click.ParamType):
         return {key: value}
 
 
+def command_name(ctx):
+    """Find the full name, like 'hits compare', of the command being run.
+    Click has already consumed the arguments when the group callback runs so
+    this looks at the command line after the invoked subcommand.
+    """
+
+    name = ctx.invoked_subcommand
+    names = [name]
+    command = ctx.command.get_command(ctx, name)
+    args = sys.argv[sys.argv.index(name) + 1:] if name in sys.argv else []
+    for arg in args:
+        if not isinstance(command, click.MultiCommand):
+            break
+        command = command.get_command(ctx, arg)
+        if command is None:
+            break
+        names.append(arg)
+    return ' '.join(names)
+
+
 @click.group()
-def cli():
-    pass
+@click.option('--metrics', 'metrics_file', type=click.File(mode='wb'),
+              default=None,
+              help='Write the records, time and memory of each stage as JSON')
+@click.option('--profile', type=click.Path(dir_okay=False), default=None,
+              help='Write cProfile stats of the command to this file')
+@click.option('--progress', type=int, default=None,
+              help='Report progress every N records of each stage')
+@click.pass_context
+def cli(ctx, metrics_file=None, profile=None, progress=None):
+    if metrics_file or progress:
+        recorder = metrics.enable()
+        name = command_name(ctx)
+        if progress:
+            def report(stage, direction, count, elapsed):
+                click.echo('%s: %s %i records %s at %.1fs' %
+                           (name, stage, count, direction, elapsed), err=True)
+            recorder.add_hook(report, progress)
+        if metrics_file:
+            ctx.call_on_close(lambda: recorder.write(metrics_file, name))
+
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def dump():
+            profiler.disable()
+            profiler.dump_stats(profile)
+        ctx.call_on_close(dump)
 
 
 @cli.command('find')
 @click.argument('genome', type=click.Path(readable=True))
 @click.argument('targets', type=click.Path(exists=True, readable=True))
-@click.argument('save', type=WritableDataFile())
+@click.argument('save', type=click.Path(dir_okay=False, writable=True))
 @click.option('--method', default='blat',
               type=click.Choice(mappers.known()))
 @click.option('--organism', default='UNKNOWN')
-def find(genome, targets, save, method='blat', organism='UNKNOWN'):
+@click.option('--chunk-size', type=int, default=checkpoints.CHUNK_SIZE,
+              help='The number of targets to search at once')
+@click.option('--journal', type=click.Path(dir_okay=False), default=None,
+              help='The progress journal, defaults to SAVE.journal')
+def find(genome, targets, save, method='blat', organism='UNKNOWN',
+         chunk_size=checkpoints.CHUNK_SIZE, journal=None):
     """
     Search the genome for the given targets using the specified program.
+    Targets are searched in chunks and the progress is recorded in a journal
+    so an interrupted run can be restarted with the same arguments and will
+    only search the chunks that were not done.
 
     Parameters
     ----------
@@ -87,7 +159,12 @@ def find(genome, targets, save, method='blat', organism='UNKNOWN'):
     """
     mapper_class = mappers.fetch(method)
     mapper = mapper_class()
-    save(mapper(genome, targets))
+    log = lambda message: click.echo(message, err=True)
+    try:
+        checkpoints.find(mapper, genome, targets, save, journal_file=journal,
+                         chunk_size=chunk_size, log=log)
+    except ValueError as err:
+        raise click.ClickException(str(err))
 
 
 @cli.group('hits')
@@ -107,10 +184,7 @@ def hits():
               default=None)
 def format_to_hits(data, targets, save, format=None):
     if not format:
-        _, ext = os.path.splitext(data)
-        format = ext[1:]
-        if format not in mappers.known_formats():
-            raise ValueError("Unknown inferred format %s" % format)
+        format = mappers.infer_format(data)
 
     for hit in mappers.from_format(data, targets, format):
         save(hit)
@@ -132,7 +206,7 @@ def hits_select(hits, matcher, save, define={}):
 
     matcher_class = matchers.fetch(matcher)
     matcher = matcher_class(**definitions)
-    for filtered in matcher.filter_matches(hits):
+    for filtered in metrics.wrap('filter', matcher.filter_matches, hits):
         save(filtered)
 
 
@@ -146,14 +220,8 @@ def hits_select_spec(hits, spec_file, save):
     object with a matcher entry that is the name of the matcher to use. It may
     also contain a JSON object of definitions to build the matcher with.
     """
-    spec = json.load(spec_file)
-    matcher = spec['matcher']
-    if matcher not in matchers.known():
-        raise ValueError("Unknown Matcher")
-    definitions = spec.get('definitions', {})
-    matcher_class = matchers.fetch(matcher)
-    matcher = matcher_class(**definitions)
-    for filtered in matcher.filter_matches(hits):
+    matcher = matchers.from_spec(json.load(spec_file))
+    for filtered in metrics.wrap('filter', matcher.filter_matches, hits):
         save(filtered)
 
 
@@ -161,12 +229,15 @@ def hits_select_spec(hits, spec_file, save):
 @click.argument('hits', type=ReadableDataFile())
 @click.argument('correct', type=click.Path(exists=True, readable=True))
 @click.argument('save', type=WritableDataFile())
-def compare_matches(hits, correct, save):
+@click.option('--strand', default='both', type=click.Choice(joins.STRANDS))
+def compare_matches(hits, correct, save, strand='both'):
     """
-    Compare some hits to known examples to see how well they overlap.
+    Compare some hits to known examples to see how well they overlap. By
+    default features on either strand are compared, use --strand to compare
+    only to features on the same or opposite strand of each hit.
     """
     tree = Tree(correct)
-    for compared in tree.compare_to_known(hits):
+    for compared in tree.compare_to_known(hits, strand=strand):
         save(compared)
 
 
@@ -175,15 +246,97 @@ def compare_matches(hits, correct, save):
 @click.argument('features', type=click.Path(exists=True, readable=True))
 @click.argument('max-range', type=int)
 @click.argument('save', type=WritableDataFile())
-def best_within(hits, features, max_range, save):
+@click.option('--strand', default='both', type=click.Choice(joins.STRANDS))
+def best_within(hits, features, max_range, save, strand='both'):
     """
     Find the best hits within some distance of the given features.
     """
     tree = Tree(features)
-    for best in tree.best_hits_within(hits, max_range):
+    for best in tree.best_hits_within(hits, max_range, strand=strand):
         save(best)
 
 
+@hits.command('nearest')
+@click.argument('hits', type=ReadableDataFile())
+@click.argument('features', type=click.Path(exists=True, readable=True))
+@click.argument('save', type=click.File(mode='wb'))
+@click.option('--max-range', type=int, default=None)
+@click.option('--count', type=int, default=None)
+@click.option('--strand', default='both', type=click.Choice(joins.STRANDS))
+def nearest(hits, features, save, max_range=None, count=None, strand='both'):
+    """
+    Write the distance from each feature to the hits near it. Hits can be
+    limited to those within some range, the count closest or both.
+    """
+    tree = Tree(features)
+    writer = csv.writer(save)
+    writer.writerow(['feature_urs', 'chromosome', 'feature_start',
+                     'feature_stop', 'feature_strand', 'hit_urs', 'hit_start',
+                     'hit_stop', 'hit_strand', 'distance', 'identity'])
+    near = tree.nearest_hits(hits, max_range=max_range, count=count,
+                             strand=strand)
+    for neighbor in near:
+        feature = neighbor.feature
+        hit = neighbor.hit
+        writer.writerow([feature.urs, feature.chromosome, feature.start,
+                         feature.stop, feature.strand, hit.urs, hit.start,
+                         hit.stop, hit.strand, neighbor.distance,
+                         hit.query_identity])
+
+
+@hits.command('distance-to-expected')
+@click.argument('hits', type=ReadableDataFile())
+@click.argument('features', type=click.Path(exists=True, readable=True))
+@click.argument('save', type=click.File(mode='wb'))
+def distance_to_expected(hits, features, save):
+    """
+    Write the distance from each hit to the closest known location of the same
+    URS. The distance and overlap are empty if the URS is not known on the
+    chromosome of the hit.
+    """
+    tree = Tree(features)
+    writer = csv.writer(save)
+    writer.writerow(['urs', 'chromosome', 'hit_start', 'hit_stop',
+                     'hit_strand', 'expected_loci', 'expected_start',
+                     'expected_stop', 'expected_strand', 'distance',
+                     'overlap'])
+    for hit, loci, neighbor in tree.distance_to_expected(hits):
+        row = [hit.urs, hit.chromosome, hit.start, hit.stop, hit.strand,
+               len(loci)]
+        if neighbor:
+            feature = neighbor.feature
+            overlap = Overlap.build(hit, feature)
+            row.extend([feature.start, feature.stop, feature.strand,
+                        neighbor.distance, overlap.bases])
+        else:
+            row.extend([''] * 5)
+        writer.writerow(row)
+
+
+@hits.command('pileup')
+@click.argument('hits', type=ReadableDataFile())
+@click.argument('save', type=click.File(mode='wb'))
+@click.option('--min-depth', type=int, default=1)
+@click.option('--max-gap', type=int, default=0)
+@click.option('--stranded', is_flag=True, default=False)
+def hits_pileup(hits, save, min_depth=1, max_gap=0, stranded=False):
+    """
+    Find the loci where many hits pile up. This computes the coverage of all
+    hit fragments and merges the covered regions into clusters, writing each
+    cluster and the URS's of the hits in it as CSV.
+    """
+    writer = csv.writer(save)
+    writer.writerow(['chromosome', 'strand', 'start', 'stop', 'depth', 'hits',
+                     'urs_count', 'urs'])
+    found = pileup.clusters(hits, min_depth=min_depth, max_gap=max_gap,
+                            stranded=stranded)
+    for cluster in found:
+        writer.writerow([cluster.chromosome, cluster.strand or '.',
+                         cluster.start, cluster.stop, cluster.depth,
+                         cluster.hits, len(cluster.urs),
+                         ' '.join(cluster.urs)])
+
+
 @cli.group('comparisons')
 def comparisons():
     """Group of commands dealing with maninpulating comparisons.
@@ -197,24 +350,18 @@ def comparisons():
 @click.argument('save', type=WritableDataFile())
 def comparisons_select(comparisons, filter, save):
     """
-    Filter comparisons to only those of the given type(s).
+    Filter comparisons to only those which match the given expression, for
+    example 'type.pretty is missing'. See genome_mapping.predicates for the
+    expression language.
     """
 
-    replace = {'is': '=='}
-    processed = ' '.join(replace.get(w, w) for w in filter)
-    ast = compile(processed, '<string>', mode='eval')
+    try:
+        predicate = predicates.compile(' '.join(filter))
+    except predicates.InvalidExpression as err:
+        raise click.BadParameter(str(err), param_hint='filter')
 
-    def checker(obj):
-        def hashable(name):
-            return isinstance(getattr(obj, name), coll.Hashable)
-
-        fields = utils.properities_of(obj.__class__)
-        locals = {(f, getattr(obj, f)) for f in fields if hashable(f)}
-        each = it.chain.from_iterable(t.split('_') for t in RESULT_TYPE)
-        locals.update((t, t) for t in it.chain(RESULT_TYPE, each))
-        return eval(ast, {}, dict(locals))
-
-    save(comp for comp in comparisons if checker(comp))
+    for comparision in predicate.filter(comparisons):
+        save(comparision)
 
 
 @comparisons.command('extract')
@@ -232,24 +379,77 @@ def comparisons_extract(comparisons, property, save, skip_missing=False):
         save(entry)
 
 
+@comparisons.command('overlaps')
+@click.argument('comparisons', type=ReadableDataFile())
+@click.argument('save', type=click.File(mode='wb'))
+def comparisons_overlaps(comparisons, save):
+    """
+    Write the exon level overlap of each hit and feature that were compared.
+    Comparisons which are novel or missing have no overlap and are skipped.
+    """
+    writer = csv.writer(save)
+    writer.writerow(['hit_urs', 'feature_urs', 'type', 'bases', 'hit_bases',
+                     'feature_bases', 'jaccard', 'hit_fraction',
+                     'feature_fraction', 'intron_chain_match'])
+    for comparision in comparisons:
+        overlap = comparision.overlap
+        if not overlap:
+            continue
+        writer.writerow([comparision.hit.urs, comparision.feature.urs,
+                         comparision.type.pretty, overlap.bases,
+                         overlap.hit_bases, overlap.feature_bases,
+                         overlap.jaccard, overlap.hit_fraction,
+                         overlap.feature_fraction, overlap.intron_chain_match])
+
+
 @comparisons.command('summary')
 @click.argument('comparisons', type=ReadableDataFile())
 @click.argument('save', type=click.File(mode='wb'))
-def comparisons_summarize(comparisons, save):
+@click.option('--by', multiple=True)
+@click.option('--distributions', is_flag=True, default=False)
+def comparisons_summarize(comparisons, save, by=None, distributions=False):
     """
-    Compute a summary of the number of each type of comparisons.
+    Compute a summary of the number of each type of comparisons. This may
+    instead be grouped by any fields, like type.pretty, and can include the
+    distribution of identity and shift in each group.
     """
-    pretty_counts = dict(coll.Counter(c.type.pretty for c in comparisons))
-    match_counts = dict(coll.Counter(c.type.match for c in comparisons))
-    counts = dict(pretty_counts)
-    counts.update(match_counts)
-    keys = sorted(RESULT_TYPE)
-    writer = csv.DictWriter(save, ['type', 'count'])
-    writer.writeheader()
-    writer.writerows([{'type': k, 'count': counts[k]} for k in keys])
-    writer.writerow({'type': 'total', 'count': len(comparisons)})
+    by = by or aggregates.DEFAULT_GROUPS
+    aggregate = aggregates.Aggregate(by=by, distributions=distributions)
+    aggregates.write(aggregate.update(comparisons), save)
 
 
+@comparisons.command('aggregate')
+@click.argument('comparisons', type=ReadableDataFile())
+@click.argument('save', type=WritableDataFile())
+@click.option('--by', multiple=True)
+@click.option('--distributions', is_flag=True, default=False)
+def comparisons_aggregate(comparisons, save, by=None, distributions=False):
+    """
+    Compute a partial summary of some comparisons. Partial summaries of
+    several files can be combined with 'comparisons combine'.
+    """
+    by = by or aggregates.DEFAULT_GROUPS
+    aggregate = aggregates.Aggregate(by=by, distributions=distributions)
+    save(aggregate.update(comparisons))
+
+
+@comparisons.command('combine')
+@click.argument('partials', type=ReadableDataFile(), nargs=-1, required=True)
+@click.argument('save', type=click.File(mode='wb'))
+def comparisons_combine(partials, save):
+    """
+    Merge the partial summaries of several files into one summary.
+    """
+    aggregate = None
+    for partial in it.chain.from_iterable(partials):
+        if aggregate is None:
+            aggregate = partial
+        else:
+            aggregate.merge(partial)
+    if aggregate is None:
+        raise click.ClickException("No partial summaries to combine")
+    aggregates.write(aggregate, save)
+
 
 @comparisons.group('group')
 def comparisons_group():
@@ -259,27 +459,42 @@ def comparisons_group():
 @comparisons_group.command('by-hit-urs')
 @click.argument('comparisons', type=ReadableDataFile())
 @click.argument('save', type=WritableDataFile())
-def comparisons_group_hit_urs(comparisons, save):
+@click.option('--buffer-size', type=int, default=grouping.BUFFER_SIZE)
+@click.option('--tmpdir', type=click.Path(file_okay=False), default=None)
+def comparisons_group_hit_urs(comparisons, save,
+                              buffer_size=grouping.BUFFER_SIZE, tmpdir=None):
+    """
+    Group comparisons by the URS of the hit. This writes a stream of (urs,
+    comparisons) entries and keeps at most buffer-size comparisons in memory
+    while sorting, spilling the rest to temporary files. A group larger than
+    buffer-size, like that of all comparisons without a hit, whose urs is
+    None, is written as several consecutive entries with the same urs.
+    """
     def key(comparision):
         if comparision.hit:
             return comparision.hit.urs
         return None
-    ordered = sorted(comparisons, key=key)
-    groups = it.groupby(ordered, key)
-    save({urs: list(comps) for urs, comps in groups})
+
+    groups = grouping.group_by(comparisons, key, buffer_size=buffer_size,
+                               directory=tmpdir)
+    for urs, entries in groups:
+        for batch in iter(lambda: list(it.islice(entries, buffer_size)), []):
+            save((urs, batch))
 
 
 @comparisons_group.command('summarize-types')
 @click.argument('grouped', type=ReadableDataFile())
 @click.argument('save', type=click.File(mode='wb'))
 def comparisons_group_summary_type(grouped, save):
-    header = ['urs'] + list(RESULT_TYPE)
+    header = ['urs'] + sorted(RESULT_TYPE)
     writer = csv.DictWriter(save, header)
     writer.writeheader()
-    for urs, hits in grouped.iteritems():
-        entry = coll.defaultdict(int)
+    # Large groups are split over consecutive entries with the same urs.
+    for urs, parts in it.groupby(grouped, lambda g: g[0]):
+        entry = {t: 0 for t in RESULT_TYPE}
         entry['urs'] = urs
-        entry.update(coll.Counter(h.type.pretty for h in hits))
+        entry.update(coll.Counter(h.type.result for (_, hits) in parts
+                                  for h in hits))
         writer.writerow(entry)
 
 
@@ -298,9 +513,249 @@ def format(format, data, save):
     data : path
         The path to the data to read, '-' means stdin.
     save : path
-         The path of where to save data, '-' means stdout.
+         The path of where to save data, '-' means stdout. The copy-tsv
+         format writes a manifest here and its shards next to it. The
+         gff3-bgzf and bed12-bgzf formats write their region index next to
+         it.
+    """
+    data = metrics.stream('serialize', data, 'in')
+    with metrics.timed('serialize'):
+        try:
+            formatters.format(data, format, save)
+        except ValueError as err:
+            raise click.ClickException(str(err))
+
+
+@cli.command('region')
+@click.argument('filename', type=click.Path(exists=True, dir_okay=False))
+@click.argument('chromosome')
+@click.argument('start', type=int)
+@click.argument('stop', type=int)
+@click.argument('save', default='-', type=click.File(mode='wb'))
+def region(filename, chromosome, start, stop, save):
+    """
+    Write all lines of a file written with the gff3-bgzf or bed12-bgzf
+    format which overlap the region from start to stop, 1 based and
+    inclusive. Only the blocks of the file which the region is in are read.
+    """
+    if start < 1 or stop < start:
+        raise click.BadParameter("Invalid region %i-%i" % (start, stop))
+    for line in bgzf.fetch(filename, chromosome, start - 1, stop):
+        save.write(line + '\n')
+
+
+@cli.command('load-sqlite')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.argument('database', type=click.Path(dir_okay=False))
+@click.option('--table', default=loaders.TABLE)
+@click.option('--batch-size', type=int, default=loaders.BATCH_SIZE)
+def load_sqlite(manifest, database, table=loaders.TABLE,
+                batch_size=loaders.BATCH_SIZE):
+    """
+    Load the shards written by 'gm as copy-tsv' into a SQLite database and
+    report how long it took.
+    """
+    start = time.time()
+    try:
+        rows = loaders.load_sqlite(manifest, database, table=table,
+                                   batch_size=batch_size)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    elapsed = time.time() - start
+    click.echo('Loaded %i rows in %.2fs (%.0f rows/s)' %
+               (rows, elapsed, rows / elapsed if elapsed else 0), err=True)
+
+
+@cli.command('run')
+@click.argument('spec', type=click.File(mode='rb'))
+@click.option('--define', multiple=True, default={}, type=KeyValue())
+def run(spec, define={}):
+    """
+    Run the pipeline(s) in the given spec file in this process. The stages
+    are streamed into each other and intermediate files are only written if
+    the spec asks for them. Each --define name=value fills in {name} in the
+    spec. See genome_mapping.pipeline for the spec format.
+    """
+    definitions = {}
+    for definition in define:
+        definitions.update(definition)
+
+    for step in pipeline.load(spec, definitions):
+        step()
+
+
+@cli.command('release')
+@click.argument('spec', type=click.File(mode='rb'))
+@click.option('--organism', multiple=True)
+@click.option('--cpus', type=int, default=None)
+@click.option('--memory', type=int, default=None,
+              help='Memory limit in MB')
+@click.option('--state', default=scheduler.STATE_FILE)
+@click.option('--dry-run', is_flag=True, default=False)
+def release(spec, organism=None, cpus=None, memory=None,
+            state=scheduler.STATE_FILE, dry_run=False):
+    """
+    Run the stages of a release for all organisms at once. Stages are
+    started when their inputs are ready and there are enough free cpus and
+    memory for them. Stages whose inputs have not changed since they last ran
+    are skipped. See genome_mapping.scheduler for the spec format.
+    """
+    stages = scheduler.load(spec, organisms=list(organism))
+    runner = scheduler.Scheduler(stages, cpus=cpus, memory=memory,
+                                 state_file=state)
+    if dry_run:
+        for stage, current in runner.plan():
+            status = 'skip' if current else 'run'
+            click.echo('%s\t%s\t%s' % (status, stage.key,
+                                         ' '.join(stage.command)))
+        return
+
+    log = lambda message: click.echo(message, err=True)
+    try:
+        runner.run(log=log)
+    except scheduler.StageFailed as err:
+        raise click.ClickException(str(err))
+
+
+@cli.command('validate')
+@click.argument('hits', type=click.Path(dir_okay=False))
+@click.argument('known', type=click.Path(exists=True, readable=True))
+@click.argument('grid', type=click.File(mode='rb'))
+@click.argument('save', type=click.File(mode='wb'))
+@click.option('--genome', type=click.Path(readable=True), default=None,
+              help='Genome to search if HITS does not exist yet')
+@click.option('--targets', type=click.Path(exists=True, readable=True),
+              default=None, help='Targets to search if HITS does not exist')
+@click.option('--method', default='blat', type=click.Choice(mappers.known()))
+@click.option('--processes', type=int, default=None)
+def validate(hits, known, grid, save, genome=None, targets=None,
+             method='blat', processes=None):
+    """
+    Score every matcher spec in a grid against the known locations. The
+    hits are read from HITS, if it does not exist the targets are searched
+    for once, as gm find does, and saved there for later runs. The known
+    locations are loaded once and the specs are evaluated in parallel,
+    producing a CSV of precision, recall and counts of each result type per
+    spec. See genome_mapping.validators for the grid format.
+    """
+    if not os.path.exists(hits):
+        if not genome or not targets:
+            raise click.BadParameter("Must give --genome and --targets "
+                                     "to search for missing hits",
+                                     param_hint='hits')
+        log = lambda message: click.echo(message, err=True)
+        checkpoints.find(mappers.fetch(method)(), genome, targets, hits,
+                         log=log)
+
+    specs = validators.expand_grid(json.load(grid))
+    sweep = validators.Sweep(Tree(known), validators.load_hits(hits),
+                             processes=processes)
+    try:
+        scores = sweep(specs)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    validators.write(scores, save)
+
+
+@cli.group('benchmark')
+def benchmark_group():
+    """
+    Time the main steps on synthetic data.
+    """
+    pass
+
+
+@benchmark_group.command('run')
+@click.option('--scale', type=click.Choice(sorted(benchmarks.SCALES)),
+              default='small')
+@click.option('--seed', type=int, default=1)
+@click.option('--repeat', type=int, default=3)
+@click.option('--directory', type=click.Path(file_okay=False),
+              default=benchmarks.DIRECTORY)
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='Defaults to results/<commit>-<scale>.json in directory')
+def benchmark_run(scale='small', seed=1, repeat=3,
+                  directory=benchmarks.DIRECTORY, output=None):
+    """
+    Generate synthetic data, if needed, and time each step on it. The
+    results are written as JSON so runs of different commits can be
+    compared.
+    """
+    log = lambda message: click.echo(message, err=True)
+    results = benchmarks.run(scale, directory=directory, seed=seed,
+                             repeat=repeat, log=log)
+    output = output or benchmarks.results_path(results, directory=directory)
+    if not os.path.exists(os.path.dirname(output) or '.'):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'wb') as out:
+        json.dump(results, out, indent=2, sort_keys=True)
+    log("Wrote results to %s" % output)
+
+
+@benchmark_group.command('startup')
+@click.option('--budget', type=float, default=benchmarks.STARTUP_BUDGET,
+              help='The number of seconds startup may take')
+@click.option('--repeat', type=int, default=5)
+def benchmark_startup(budget=benchmarks.STARTUP_BUDGET, repeat=5):
+    """
+    Check that gm starts within the budget.
+    """
+    seconds = benchmarks.startup(repeat=repeat)
+    click.echo('%.4f' % seconds)
+    if seconds > budget:
+        raise click.ClickException("Startup took %.4fs, over the budget of "
+                                   "%.4fs" % (seconds, budget))
+
+
+@benchmark_group.command('merge')
+@click.option('--records', type=int, multiple=True)
+@click.option('--directory', type=click.Path(file_okay=False),
+              default=benchmarks.DIRECTORY)
+def benchmark_merge(records=None, directory=benchmarks.DIRECTORY):
+    """
+    Measure the peak memory of fasta.py merge-by-id on files of each number
+    of --records, 10000, 100000 and 1000000 by default. Peak anonymous
+    memory, which leaves out the memory mapped input, is what should stay
+    bounded.
+    """
+    records = records or (10000, 100000, 1000000)
+    log = lambda message: click.echo(message, err=True)
+    try:
+        results = benchmarks.merging(records=records, directory=directory,
+                                     log=log)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['records', 'seconds', 'peak_rss_kb',
+                     'peak_anonymous_kb'])
+    for count in records:
+        writer.writerow([count, results[count]['seconds'],
+                         results[count]['peak_rss'],
+                         results[count]['peak_anonymous']])
+
+
+@benchmark_group.command('compare')
+@click.argument('old', type=click.File(mode='rb'))
+@click.argument('new', type=click.File(mode='rb'))
+@click.option('--threshold', type=float, default=benchmarks.THRESHOLD,
+              help='The fractional slow down that counts as a regression')
+def benchmark_compare(old, new, threshold=benchmarks.THRESHOLD):
+    """
+    Compare two benchmark results and fail if any step got slower by more
+    than the threshold.
     """
-    formatters.format(data, format, save)
+    try:
+        rows = benchmarks.compare(json.load(old), json.load(new),
+                                  threshold=threshold)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['case', 'old', 'new', 'ratio', 'regressed'])
+    writer.writerows(rows)
+    regressed = [r[0] for r in rows if r[4]]
+    if regressed:
+        raise click.ClickException("Regressed: %s" % ', '.join(regressed))
 
 
 @cli.command('pp')
@@ -0,0 +1,190 @@
+"""This module contains a streaming aggregation of comparisons. An Aggregate
+counts comparisons, and optionally the distribution of hit identity and shift,
+grouped by any fields of the comparisons in a single pass. Aggregates of the
+same grouping can be merged, so shards of a large comparison file can be
+summarized in parallel and then combined into one summary.
+"""
+
+import csv
+import math
+import collections as coll
+
+from genome_mapping import predicates
+from genome_mapping.data import RESULT_TYPE
+
+DEFAULT_GROUPS = ('type.result',)
+"""The default grouping, which counts each entry in RESULT_TYPE."""
+
+DISTRIBUTIONS = (
+    ('identity', 'hit.query_identity', 1),
+    ('shift', 'shift.total', 0),
+)
+"""The name, path and number of decimals kept for each distribution."""
+
+
+class Distribution(object):
+    """A mergeable summary of a set of numbers. The values are stored as a
+    histogram of rounded values, which allows computing the median of merged
+    distributions exactly at the given precision.
+    """
+
+    def __init__(self, digits=0):
+        self.digits = digits
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.histogram = coll.Counter()
+
+    def add(self, value):
+        if value is None or math.isinf(value) or math.isnan(value):
+            return
+        self.count += 1
+        self.total += value
+        self.__extend__(value)
+        self.histogram[round(value, self.digits)] += 1
+
+    def __extend__(self, value):
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        if other.digits != self.digits:
+            raise ValueError("Can only merge distributions of one precision")
+        self.count += other.count
+        self.total += other.total
+        for value in (other.minimum, other.maximum):
+            if value is not None:
+                self.__extend__(value)
+        self.histogram.update(other.histogram)
+        return self
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    @property
+    def median(self):
+        if not self.count:
+            return None
+        seen = 0
+        for value in sorted(self.histogram):
+            seen += self.histogram[value]
+            if 2 * seen >= self.count:
+                return value
+
+    def summary(self):
+        return [self.minimum, self.median, self.mean, self.maximum]
+
+
+class Aggregate(object):
+    """Count comparisons grouped by the values of some fields.
+
+    Parameters
+    ----------
+    by : tuple
+        The dotted paths, like type.pretty, of the fields to group by.
+
+    distributions : bool
+        If True the identity and shift distributions of each group are also
+        computed.
+    """
+
+    def __init__(self, by=DEFAULT_GROUPS, distributions=False):
+        self.by = tuple(by)
+        self.distributions = distributions
+        self.counts = coll.Counter()
+        self.values = coll.defaultdict(self.__distributions__)
+        self.__build_accessors__()
+
+    def __build_accessors__(self):
+        for path in self.by:
+            predicates.check_path(path)
+        self.accessors = [predicates.accessor(p) for p in self.by]
+        self.measures = [predicates.accessor(p) for (_, p, _) in DISTRIBUTIONS]
+
+    def __distributions__(self):
+        return [Distribution(digits=d) for (_, _, d) in DISTRIBUTIONS]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['accessors']
+        del state['measures']
+        state['values'] = dict(self.values)
+        return state
+
+    def __setstate__(self, state):
+        values = state.pop('values')
+        self.__dict__.update(state)
+        self.values = coll.defaultdict(self.__distributions__, values)
+        self.__build_accessors__()
+
+    def add(self, comparision):
+        key = tuple(f(comparision) for f in self.accessors)
+        self.counts[key] += 1
+        if self.distributions:
+            distributions = self.values[key]
+            for measure, distribution in zip(self.measures, distributions):
+                distribution.add(measure(comparision))
+
+    def update(self, comparisons):
+        for comparision in comparisons:
+            self.add(comparision)
+        return self
+
+    def merge(self, other):
+        if other.by != self.by or other.distributions != self.distributions:
+            raise ValueError("Can only merge aggregates with the same fields")
+        self.counts.update(other.counts)
+        for key, distributions in other.values.iteritems():
+            for current, given in zip(self.values[key], distributions):
+                current.merge(given)
+        return self
+
+    @property
+    def total(self):
+        return sum(self.counts.itervalues())
+
+    def header(self):
+        header = list(self.by)
+        if self.by == DEFAULT_GROUPS:
+            header = ['type']
+        header.append('count')
+        if self.distributions:
+            for (name, _, _) in DISTRIBUTIONS:
+                header.extend('%s_%s' % (name, s) for s in
+                              ['min', 'median', 'mean', 'max'])
+        return header
+
+    def rows(self):
+        """Produce the rows of the summary, one per group and a final total
+        row. With the default grouping there is a row for every entry in
+        RESULT_TYPE, even those with no comparisons.
+        """
+
+        keys = sorted(self.counts)
+        if self.by == DEFAULT_GROUPS:
+            keys = [(k,) for k in sorted(RESULT_TYPE)]
+
+        for key in keys:
+            row = list(key)
+            row.append(self.counts.get(key, 0))
+            if self.distributions:
+                distributions = self.values.get(key) or \
+                    self.__distributions__()
+                for distribution in distributions:
+                    row.extend(distribution.summary())
+            yield row
+
+        total = ['total'] + [''] * (len(self.by) - 1) + [self.total]
+        yield total
+
+
+def write(aggregate, stream):
+    writer = csv.writer(stream)
+    writer.writerow(aggregate.header())
+    writer.writerows(aggregate.rows())
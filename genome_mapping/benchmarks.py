@@ -0,0 +1,561 @@
+"""This module contains a benchmark suite for the main steps of mapping
+sequences. It generates a synthetic genome, spliced and unspliced queries
+sampled from it, a PSL file of their alignments and a GFF3 file of known
+locations, then times parsing the alignments, building and searching the
+Tree, each matcher, each formatter and the pickle I/O on them. No aligner is
+needed, so the suite runs anywhere.
+
+All data is generated from a seeded random number generator, so the same
+scale and seed always produce identical files and timings of different
+commits can be compared. The results are JSON like:
+
+    {
+        "commit": "bb8639d",
+        "scale": "small",
+        "seed": 1,
+        "cases": {
+            "tree": {"seconds": 0.12, "records": 1000},
+            ...
+        }
+    }
+"""
+
+from __future__ import division
+
+import os
+import gc
+import sys
+import json
+import time
+import random
+import shutil
+import contextlib
+import cPickle
+import tempfile
+import subprocess as sp
+
+from genome_mapping import mappers
+from genome_mapping import matchers
+from genome_mapping import formatters
+from genome_mapping.intervals import Tree
+
+SCALES = {
+    'tiny': {'chromosomes': 2, 'length': 20000, 'queries': 50},
+    'small': {'chromosomes': 3, 'length': 200000, 'queries': 1000},
+    'medium': {'chromosomes': 5, 'length': 2000000, 'queries': 10000},
+    'large': {'chromosomes': 10, 'length': 10000000, 'queries': 100000},
+}
+"""The number of chromosomes, length of each chromosome and number of queries
+at each scale."""
+
+DIRECTORY = 'data/benchmarks'
+"""The default directory for generated data and results."""
+
+TAXID = 32630
+"""The taxid used in the ids of all synthetic queries."""
+
+VERSION = 2
+"""The version of the synthetic data, so data generated by older code is
+never reused."""
+
+MAX_RANGE = 100
+"""The range used when benchmarking Tree.best_hits_within."""
+
+THRESHOLD = 0.1
+"""The default fractional slow down which counts as a regression."""
+
+MIN_SECONDS = 0.01
+"""Cases faster than this are too noisy to count as regressions."""
+
+STARTUP_BUDGET = 0.25
+"""The number of seconds a trivial gm command may take to start."""
+
+GM = os.path.join(os.path.dirname(__file__), '..', 'bin', 'gm.py')
+"""The path to the gm script."""
+
+FASTA = os.path.join(os.path.dirname(__file__), '..', 'bin', 'fasta.py')
+"""The path to the fasta script."""
+
+
+class Synthetic(object):
+    """Generate a synthetic data set.
+
+    Each query is sampled from the genome as one to four exons separated by
+    introns. About a quarter of queries align with a few mismatches, a fifth
+    have a second, shifted and worse, alignment and a tenth are missing from
+    the known annotations.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to write the files to.
+
+    chromosomes : int
+        The number of chromosomes in the genome.
+
+    length : int
+        The length of each chromosome.
+
+    queries : int
+        The number of query sequences.
+
+    seed : int
+        The seed of the random number generator.
+    """
+
+    def __init__(self, directory, chromosomes, length, queries, seed=1):
+        self.directory = directory
+        self.chromosomes = chromosomes
+        self.length = length
+        self.queries = queries
+        self.seed = seed
+
+    @property
+    def parameters(self):
+        return {
+            'chromosomes': self.chromosomes,
+            'length': self.length,
+            'queries': self.queries,
+            'seed': self.seed,
+            'version': VERSION,
+        }
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    @property
+    def paths(self):
+        return {
+            'genome': self.path('genome.fasta'),
+            'queries': self.path('targets.fasta'),
+            'results': self.path('targets.psl'),
+            'known': self.path('known.gff3'),
+        }
+
+    def is_current(self):
+        """Check if the files were already generated with the same
+        parameters.
+        """
+
+        if not all(os.path.exists(p) for p in self.paths.itervalues()):
+            return False
+        filename = self.path('parameters.json')
+        if not os.path.exists(filename):
+            return False
+        with open(filename, 'rb') as raw:
+            return json.load(raw) == self.parameters
+
+    def genome(self, rand):
+        names = ['chr%i' % (i + 1) for i in xrange(self.chromosomes)]
+        return [(n, ''.join(rand.choice('ACGT') for _ in xrange(self.length)))
+                for n in names]
+
+    def blocks(self, rand, length):
+        """Pick the exons, as (start, size) pairs, of a single query.
+        """
+
+        count = rand.choice([1, 1, 2, 3, 4])
+        sizes = [rand.randint(25, 300) for _ in xrange(count)]
+        introns = [rand.randint(60, 2000) for _ in xrange(count - 1)]
+        span = sum(sizes) + sum(introns)
+        start = rand.randint(0, length - span - 1)
+        blocks = []
+        for index, size in enumerate(sizes):
+            blocks.append((start, size))
+            if index < len(introns):
+                start += size + introns[index]
+        return blocks
+
+    def psl_line(self, name, size, chromosome, length, strand, starts,
+                 blocks, mismatches):
+        query_starts = []
+        current = 0
+        for (_, block_size) in blocks:
+            query_starts.append(current)
+            current += block_size
+        gaps = len(blocks) - 1
+        gap_bases = starts[-1] - starts[0] - sum(s for (_, s) in blocks[:-1])
+        return '\t'.join(str(v) for v in [
+            size - mismatches, mismatches, 0, 0, 0, 0, gaps, gap_bases,
+            strand, name, size, 0, size, chromosome, length, starts[0],
+            starts[-1] + blocks[-1][1], len(blocks),
+            ''.join('%i,' % s for (_, s) in blocks),
+            ''.join('%i,' % s for s in query_starts),
+            ''.join('%i,' % s for s in starts),
+        ])
+
+    def gff_lines(self, index, name, chromosome, strand, blocks):
+        parent = 'transcript%i' % index
+        start = blocks[0][0] + 1
+        stop = blocks[-1][0] + blocks[-1][1]
+        lines = ['\t'.join([chromosome, 'RNAcentral', 'transcript', str(start),
+                            str(stop), '.', strand, '.',
+                            'ID=%s;Name=%s' % (parent, name)])]
+        for exon, (block_start, size) in enumerate(blocks):
+            lines.append('\t'.join([
+                chromosome, 'RNAcentral', 'noncoding_exon',
+                str(block_start + 1), str(block_start + size), '.', strand,
+                '.', 'ID=%s_exon%i;Name=%s;Parent=%s' %
+                (parent, exon + 1, name, parent)]))
+        return lines
+
+    def generate(self):
+        """Write all files of the data set, unless they already exist with
+        the same parameters.
+        """
+
+        if self.is_current():
+            return self.paths
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        rand = random.Random(self.seed)
+        genome = self.genome(rand)
+        paths = self.paths
+        with open(paths['genome'], 'wb') as out:
+            for name, sequence in genome:
+                out.write('>%s\n' % name)
+                for start in xrange(0, len(sequence), 60):
+                    out.write(sequence[start:start + 60] + '\n')
+
+        with open(paths['queries'], 'wb') as fasta, \
+                open(paths['results'], 'wb') as psl, \
+                open(paths['known'], 'wb') as gff:
+            gff.write('##gff-version 3\n')
+            for index in xrange(self.queries):
+                chromosome, sequence = rand.choice(genome)
+                strand = rand.choice('+-')
+                blocks = self.blocks(rand, len(sequence))
+                query = ''.join(sequence[s:s + l] for (s, l) in blocks)
+                query = query.replace('T', 'U')
+                size = len(query)
+                urs = 'URS%010X' % index
+                name = '%s_%i' % (urs, TAXID)
+                fasta.write('>%s synthetic RNA %i\n%s\n' % (name, index, query))
+
+                mismatches = 0
+                if rand.random() < 0.25:
+                    mismatches = rand.randint(1, max(size // 50, 1))
+                starts = [s for (s, _) in blocks]
+                psl.write(self.psl_line(name, size, chromosome, len(sequence),
+                                        strand, starts, blocks, mismatches))
+                psl.write('\n')
+
+                if rand.random() < 0.2:
+                    shift = rand.randint(1, 50)
+                    if starts[-1] + blocks[-1][1] + shift < len(sequence):
+                        shifted = [s + shift for s in starts]
+                        psl.write(self.psl_line(name, size, chromosome,
+                                                len(sequence), strand, shifted,
+                                                blocks, mismatches + 2))
+                        psl.write('\n')
+
+                if rand.random() >= 0.1:
+                    for line in self.gff_lines(index, urs, chromosome, strand,
+                                               blocks):
+                        gff.write(line + '\n')
+
+        with open(self.path('parameters.json'), 'wb') as out:
+            json.dump(self.parameters, out, indent=2, sort_keys=True)
+        return paths
+
+
+def synthetic(scale, directory=DIRECTORY, seed=1):
+    if scale not in SCALES:
+        raise ValueError("Unknown scale %s" % scale)
+    return Synthetic(os.path.join(directory, scale), seed=seed,
+                     **SCALES[scale])
+
+
+def commit():
+    """Get the short hash of the current git commit, if there is one.
+    """
+
+    try:
+        with open(os.devnull, 'wb') as null:
+            return sp.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                   cwd=os.path.dirname(GM),
+                                   stderr=null).strip()
+    except (OSError, sp.CalledProcessError):
+        return None
+
+
+def timeit(function, repeat):
+    """Run a function several times and return the fastest time and the last
+    result. Garbage collection is turned off while timing, like the timeit
+    module does.
+    """
+
+    best = None
+    result = None
+    for _ in xrange(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.time()
+            result = function()
+            elapsed = time.time() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+@contextlib.contextmanager
+def scratch():
+    """Open a file in a temporary directory which is removed afterwards, for
+    formats that write companion files next to their output.
+    """
+
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, 'output'), 'wb') as out:
+            yield out
+    finally:
+        shutil.rmtree(directory)
+
+
+def cases(paths):
+    """Generate the (name, function) pairs of all benchmarks. The functions
+    for later cases use the results of earlier ones, so they must be run in
+    order. Each function returns the records it produced.
+    """
+
+    state = {}
+
+    def parse():
+        mapper = mappers.known_formats()['blat-psl']()
+        state['hits'] = list(mapper.parse_result_file(paths['results'],
+                                                      paths['queries']))
+        return state['hits']
+
+    def tree():
+        state['tree'] = Tree(paths['known'])
+        return state['tree'].features
+
+    def compare():
+        return state['tree'].compare_to_known(state['hits'])
+
+    def best_within():
+        return state['tree'].best_hits_within(state['hits'], MAX_RANGE)
+
+    def matcher(name):
+        def select():
+            return list(matchers.fetch(name)().filter_matches(state['hits']))
+        return select
+
+    def formatter(name):
+        def format():
+            with scratch() as out:
+                formatters.format(state['hits'], name, out)
+            return state['hits']
+        return format
+
+    def pickle_dump():
+        handle = tempfile.TemporaryFile()
+        for hit in state['hits']:
+            cPickle.dump(hit, handle)
+        state['pickled'] = handle
+        return state['hits']
+
+    def pickle_load():
+        handle = state['pickled']
+        handle.seek(0)
+        loaded = []
+        try:
+            while True:
+                loaded.append(cPickle.load(handle))
+        except EOFError:
+            return loaded
+
+    yield 'create_mappings', parse
+    yield 'tree', tree
+    yield 'compare_to_known', compare
+    yield 'best_hits_within', best_within
+    for name in sorted(matchers.known()):
+        yield 'matcher:%s' % name, matcher(name)
+    for name in sorted(formatters.known()):
+        yield 'formatter:%s' % name, formatter(name)
+    yield 'pickle:dump', pickle_dump
+    yield 'pickle:load', pickle_load
+
+
+def startup(arguments=('--help',), repeat=5):
+    """Time how long gm takes to run a trivial command in a new process.
+    This is the fastest of several runs, so it is the time of importing
+    everything a command needs rather than a cold disk cache.
+    """
+
+    command = [sys.executable, '-W', 'ignore', GM] + list(arguments)
+    best = None
+    with open(os.devnull, 'wb') as null:
+        for _ in xrange(repeat):
+            start = time.time()
+            sp.check_call(command, stdout=null)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+
+def run(scale, directory=DIRECTORY, seed=1, repeat=3, log=None):
+    """Generate the data of the given scale, if needed, and time all cases.
+
+    Returns
+    -------
+    results : dict
+        The results, as described in the module documentation.
+    """
+
+    log = log or (lambda message: None)
+    data = synthetic(scale, directory=directory, seed=seed)
+    log("Generating %s data in %s" % (scale, data.directory))
+    paths = data.generate()
+
+    results = {'startup': {'seconds': startup(), 'records': 0}}
+    log("startup: %.4fs" % results['startup']['seconds'])
+    for name, function in cases(paths):
+        seconds, records = timeit(function, repeat)
+        results[name] = {'seconds': seconds, 'records': len(records)}
+        log("%s: %.4fs for %i records" % (name, seconds, len(records)))
+
+    return {
+        'commit': commit(),
+        'scale': scale,
+        'seed': seed,
+        'repeat': repeat,
+        'parameters': data.parameters,
+        'cases': results,
+    }
+
+
+def duplicated_fasta(filename, records, duplicates=0.3, seed=1):
+    """Write a FASTA file of random sequences where about the given fraction
+    of records repeat the id of an earlier one.
+    """
+
+    rand = random.Random(seed)
+    with open(filename, 'wb') as out:
+        for index in xrange(records):
+            number = index
+            if index and rand.random() < duplicates:
+                number = rand.randrange(index)
+            sequence = ''.join(rand.choice('ACGU') for _ in
+                               xrange(rand.randint(20, 300)))
+            out.write('>URS%010X_%i copy %i\n' % (number, TAXID, index))
+            for start in xrange(0, len(sequence), 60):
+                out.write(sequence[start:start + 60] + '\n')
+
+
+def anonymous_memory(pid):
+    """Get the resident memory, in KB, of a process which is not backed by a
+    file. Unlike the full resident size this does not count pages of memory
+    mapped files, which the kernel can drop at any time. This is None where
+    /proc does not report it.
+    """
+
+    try:
+        with open('/proc/%i/status' % pid, 'rb') as raw:
+            for line in raw:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def peak_memory(command, interval=0.01):
+    """Run a command and return the seconds it took, its peak resident
+    memory and its peak anonymous memory, sampled every interval seconds,
+    both in KB.
+    """
+
+    start = time.time()
+    peak_anonymous = None
+    with open(os.devnull, 'wb') as null:
+        process = sp.Popen(command, stdout=null)
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            anonymous = anonymous_memory(process.pid)
+            if anonymous is not None:
+                peak_anonymous = max(peak_anonymous, anonymous)
+            time.sleep(interval)
+    elapsed = time.time() - start
+    process.returncode = status
+    if status:
+        raise ValueError("Failed to run %s" % ' '.join(command))
+    return elapsed, usage.ru_maxrss, peak_anonymous
+
+
+def merging(records=(10000, 100000, 1000000), duplicates=0.3,
+            directory=DIRECTORY, seed=1, log=None):
+    """Measure the time and peak memory of fasta.py merge-by-id for files of
+    each number of records. The file is memory mapped, so the peak resident
+    size includes the pages of it which were read. The anonymous memory, the
+    memory of the process itself, should stop growing once the sort buffer
+    of grouping is full. The id index is removed first, so building it is
+    included.
+
+    Returns
+    -------
+    results : dict
+        The seconds, peak_rss and peak_anonymous, in KB, for each number of
+        records.
+    """
+
+    log = log or (lambda message: None)
+    results = {}
+    for count in records:
+        filename = os.path.join(directory, 'merge-%i-%i.fasta' % (count, seed))
+        if not os.path.exists(filename):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            duplicated_fasta(filename, count, duplicates=duplicates,
+                             seed=seed)
+        if os.path.exists(filename + '.ids'):
+            os.remove(filename + '.ids')
+
+        command = [sys.executable, FASTA, 'merge-by-id', filename, os.devnull]
+        seconds, peak, anonymous = peak_memory(command)
+        results[count] = {
+            'seconds': seconds,
+            'peak_rss': peak,
+            'peak_anonymous': anonymous,
+        }
+        log("merge-by-id of %i records: %.2fs, %s KB anonymous" %
+            (count, seconds, anonymous))
+    return results
+
+
+def results_path(results, directory=DIRECTORY):
+    name = '%s-%s.json' % (results['commit'] or 'working', results['scale'])
+    return os.path.join(directory, 'results', name)
+
+
+def compare(old, new, threshold=THRESHOLD):
+    """Compare the results of two runs.
+
+    Returns
+    -------
+    rows : list
+        A list of (case, old seconds, new seconds, ratio, regressed) tuples,
+        one for each case in both runs. A case has regressed if it got slower
+        by more than the threshold fraction and takes at least MIN_SECONDS.
+    """
+
+    if old['parameters'] != new['parameters']:
+        raise ValueError("Can only compare results of the same data")
+
+    rows = []
+    for name in sorted(set(old['cases']) & set(new['cases'])):
+        before = old['cases'][name]['seconds']
+        after = new['cases'][name]['seconds']
+        ratio = after / before if before else None
+        regressed = ratio is not None and ratio > 1 + threshold and \
+            after >= MIN_SECONDS
+        rows.append((name, before, after, ratio, regressed))
+    return rows
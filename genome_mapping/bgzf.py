@@ -0,0 +1,249 @@
+"""This module contains a writer and reader of BGZF, the block compressed
+format used by samtools and tabix. A BGZF file is a series of gzip members
+of at most 64KB of data each, so any gzip reader can read it in full, but it
+is also possible to seek to the start of any block and decompress only from
+there. A position in the file is a virtual offset, the offset of a block in
+the file shifted left by 16 bits plus the offset within the uncompressed
+block.
+
+Sorted files of features, like GFF3 or BED, are written with a companion
+region index in a JSON file next to them, named like the file with .idx
+added. The index records the kind of file, gff3 or bed, which tells how to
+find the location of each line. Like the linear index of tabix, it records
+for each chromosome and each window of WINDOW bases the virtual offset of the
+first line which overlaps the window. Fetching a region seeks to the window
+of its start and reads lines until they start after the region ends.
+"""
+
+import json
+import zlib
+import heapq
+import struct
+
+from genome_mapping import grouping
+
+BLOCK_SIZE = 65280
+"""The most uncompressed data in one block, as samtools uses."""
+
+WINDOW = 16384
+"""The size of the windows of the region index."""
+
+HEADER = struct.Struct('<4BI2BH2BHH')
+TRAILER = struct.Struct('<2I')
+
+
+def gff3_location(line):
+    parts = line.split('\t', 5)
+    return (parts[0], int(parts[3]) - 1, int(parts[4]))
+
+
+def bed_location(line):
+    parts = line.split('\t', 3)
+    return (parts[0], int(parts[1]), int(parts[2]))
+
+
+LOCATIONS = {'gff3': gff3_location, 'bed': bed_location}
+"""How to get the 0 based half open location of a line of each kind of
+file."""
+
+EOF = ('\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00'
+       '\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+"""The empty block which marks the end of a BGZF file."""
+
+
+def compress_block(data, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    size = HEADER.size + len(compressed) + TRAILER.size
+    header = HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, size - 1)
+    crc = zlib.crc32(data) & 0xffffffff
+    return header + compressed + TRAILER.pack(crc, len(data))
+
+
+class Writer(object):
+    """Write data to a file as BGZF blocks.
+    """
+
+    def __init__(self, handle, level=6):
+        self.handle = handle
+        self.level = level
+        self.buffer = []
+        self.buffered = 0
+        self.block_start = 0
+
+    def tell(self):
+        """The virtual offset of the next byte to be written.
+        """
+        return (self.block_start << 16) | self.buffered
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= BLOCK_SIZE:
+            data = ''.join(self.buffer)
+            while len(data) >= BLOCK_SIZE:
+                self.__block__(data[:BLOCK_SIZE])
+                data = data[BLOCK_SIZE:]
+            self.buffer = [data]
+            self.buffered = len(data)
+
+    def __block__(self, data):
+        block = compress_block(data, level=self.level)
+        self.handle.write(block)
+        self.block_start += len(block)
+
+    def close(self):
+        if self.buffered:
+            self.__block__(''.join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+        self.handle.write(EOF)
+
+
+class Reader(object):
+    """Read a BGZF file starting from any virtual offset.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+
+    def block(self, offset):
+        """Read and decompress the block at the given file offset. This
+        returns the data and the offset of the next block.
+        """
+
+        self.handle.seek(offset)
+        header = self.handle.read(HEADER.size)
+        if not header:
+            return None, offset
+        fields = HEADER.unpack(header)
+        if fields[:2] != (31, 139) or fields[8:10] != (66, 67):
+            raise ValueError("Not a BGZF block at %i" % offset)
+        size = fields[-1] + 1
+        compressed = self.handle.read(size - HEADER.size - TRAILER.size)
+        data = zlib.decompress(compressed, -15)
+        return data, offset + size
+
+    def lines(self, virtual_offset=0):
+        """Yield the lines of the file starting at the virtual offset.
+        """
+
+        offset = virtual_offset >> 16
+        within = virtual_offset & 0xffff
+        pending = ''
+        while True:
+            data, offset = self.block(offset)
+            if data is None:
+                break
+            data = pending + data[within:]
+            within = 0
+            lines = data.split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line
+        if pending:
+            yield pending
+
+
+def build_index(locations):
+    """Build the region index from the (chromosome, start, stop, offset) of
+    each line, in file order, with 0 based half open coordinates.
+    """
+
+    index = {}
+    for chromosome, start, stop, offset in locations:
+        windows = index.setdefault(chromosome, {})
+        last = max(stop - 1, start) // WINDOW
+        for window in xrange(start // WINDOW, last + 1):
+            windows.setdefault(window, offset)
+
+    # A window without any line overlapping it starts at the first line of
+    # a later window, since lines are sorted by start.
+    linears = {}
+    for chromosome, windows in index.iteritems():
+        linear = [None] * (max(windows) + 1)
+        for window, offset in windows.iteritems():
+            linear[window] = offset
+        following = None
+        for window in reversed(xrange(len(linear))):
+            if linear[window] is None:
+                linear[window] = following
+            following = linear[window]
+        linears[chromosome] = {'linear': linear}
+    return linears
+
+
+def write_sorted(lines, kind, handle, index_handle, header='',
+                 buffer_size=grouping.BUFFER_SIZE):
+    """Sort lines by their location and write them as BGZF with a region
+    index.
+
+    Parameters
+    ----------
+    lines : iterable
+        The lines to write, without their newlines.
+
+    kind : str
+        The kind of lines, one of LOCATIONS.
+
+    handle : file
+        The file to write the compressed lines to.
+
+    index_handle : file
+        The file to write the JSON region index to.
+
+    header : str
+        Text, like the GFF3 version line, to write before all lines.
+
+    buffer_size : int
+        The number of lines to sort in memory before spilling to disk.
+    """
+
+    writer = Writer(handle)
+    writer.write(header)
+    runs = grouping.sorted_runs(lines, LOCATIONS[kind],
+                                buffer_size=buffer_size)
+
+    def written():
+        for (location, _, line) in heapq.merge(*runs):
+            offset = writer.tell()
+            writer.write(line + '\n')
+            yield location + (offset,)
+
+    chromosomes = build_index(written())
+    writer.close()
+    json.dump({'kind': kind, 'chromosomes': chromosomes}, index_handle,
+              sort_keys=True)
+
+
+def index_path(filename):
+    return filename + '.idx'
+
+
+def fetch(filename, chromosome, start, stop):
+    """Get all lines of an indexed file which overlap a region, given with 0
+    based half open coordinates, by decompressing only the blocks the region
+    is in.
+    """
+
+    with open(index_path(filename), 'rb') as raw:
+        index = json.load(raw)
+    if chromosome not in index['chromosomes']:
+        return
+
+    locate = LOCATIONS[index['kind']]
+    linear = index['chromosomes'][chromosome]['linear']
+    window = start // WINDOW
+    if window >= len(linear):
+        return
+    offset = linear[window]
+
+    with open(filename, 'rb') as raw:
+        for line in Reader(raw).lines(offset):
+            if not line or line.startswith('#'):
+                continue
+            location = locate(line)
+            if location[0] != chromosome or location[1] >= stop:
+                return
+            if location[2] > start:
+                yield line
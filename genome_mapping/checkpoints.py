@@ -0,0 +1,222 @@
+"""This module contains a checkpointed version of running a Mapper. The
+queries are split into chunks of a fixed number of sequences and each chunk
+is searched on its own. Once a chunk is done its hits are appended to the
+output and an entry is added to a journal file recording the chunk and the
+size of the output after it. If the run is interrupted it can be restarted
+with the same arguments, the output is truncated to the end of the last
+completed chunk and only the remaining chunks are searched. Since chunks are
+always split the same way the final output is identical to that of an
+uninterrupted run.
+
+The journal is a file of JSON lines. The first line records what the run is
+for, the genome, queries, method and chunk size, so a journal is never
+resumed for a different run. Each later line is one completed chunk.
+"""
+
+import os
+import json
+import hashlib
+import cPickle
+import tempfile
+import itertools as it
+
+from genome_mapping import utils as ut
+from genome_mapping import metrics
+
+SeqIO = ut.lazy('Bio.SeqIO')
+
+CHUNK_SIZE = 1000
+"""The default number of query sequences in each chunk."""
+
+
+def chunks(query_file, size=CHUNK_SIZE):
+    """Split the sequences in a FASTA file into lists of at most size
+    sequences.
+    """
+
+    records = SeqIO.parse(query_file, 'fasta')
+    while True:
+        chunk = list(it.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def digest(chunk):
+    return hashlib.md5('\n'.join(r.id for r in chunk)).hexdigest()
+
+
+def describe(filename):
+    """Describe a file by its size and modification time. Some genomes, like
+    BLAST databases, are not a single file so only the name is used for them.
+    """
+
+    if not os.path.isfile(filename):
+        return [filename]
+    info = os.stat(filename)
+    return [filename, info.st_size, info.st_mtime]
+
+
+def signature(method, genome_file, query_file, chunk_size):
+    return {
+        'method': method,
+        'genome': describe(genome_file),
+        'queries': describe(query_file),
+        'chunk_size': chunk_size,
+    }
+
+
+def durable(handle):
+    handle.flush()
+    os.fsync(handle.fileno())
+
+
+class Journal(object):
+    """The record of the completed chunks of a run.
+
+    Parameters
+    ----------
+    path : str
+        The path to the journal file.
+
+    signature : dict
+        A description of the run. If the journal exists it must be for a run
+        with the same signature.
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        self.entries = []
+        if os.path.exists(path):
+            self.entries = self.__load__()
+
+    def __load__(self):
+        with open(self.path, 'rb') as raw:
+            lines = raw.readlines()
+
+        if not lines:
+            return []
+        if json.loads(lines[0]) != {'signature': self.signature}:
+            raise ValueError("Journal %s is for a different run" % self.path)
+
+        entries = []
+        for line in lines[1:]:
+            # An interrupted write can leave a partial final line, that chunk
+            # is treated as not done.
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if entry.get('chunk') != len(entries):
+                raise ValueError("Journal %s is out of order at %s" %
+                                 (self.path, line.strip()))
+            entries.append(entry)
+        return entries
+
+    @property
+    def offset(self):
+        """The size of the output after the last completed chunk.
+        """
+
+        if not self.entries:
+            return 0
+        return self.entries[-1]['offset']
+
+    def is_done(self, index, chunk):
+        if index >= len(self.entries):
+            return False
+        if self.entries[index]['digest'] != digest(chunk):
+            raise ValueError("Chunk %i does not match the journal" % index)
+        return True
+
+    def write(self):
+        """Rewrite the journal with only the complete entries, dropping any
+        partial last line.
+        """
+
+        with open(self.path, 'wb') as out:
+            out.write(json.dumps({'signature': self.signature}) + '\n')
+            for entry in self.entries:
+                out.write(json.dumps(entry, sort_keys=True) + '\n')
+            durable(out)
+
+    def record(self, index, chunk, hits, offset):
+        entry = {
+            'chunk': index,
+            'digest': digest(chunk),
+            'sequences': len(chunk),
+            'hits': hits,
+            'offset': offset,
+        }
+        self.entries.append(entry)
+        with open(self.path, 'ab') as out:
+            out.write(json.dumps(entry, sort_keys=True) + '\n')
+            durable(out)
+
+
+def find(mapper, genome_file, query_file, output, journal_file=None,
+         chunk_size=CHUNK_SIZE, log=None):
+    """Search the genome for all queries, one chunk at a time, pickling each
+    hit to output.
+
+    Parameters
+    ----------
+    mapper : Mapper
+        The mapper to search with.
+
+    genome_file : str
+        The path to the genome to search.
+
+    query_file : str
+        The path to the FASTA file of queries.
+
+    output : str
+        The path to write the pickled hits to.
+
+    journal_file : str
+        The path of the journal, defaults to output with .journal added.
+
+    chunk_size : int
+        The number of sequences to search at once.
+
+    Returns
+    -------
+    counts : tuple
+        The number of chunks which were searched and which were skipped
+        because they were already done.
+    """
+
+    log = log or (lambda message: None)
+    journal = Journal(journal_file or output + '.journal',
+                      signature(mapper.name, genome_file, query_file,
+                                chunk_size))
+    journal.write()
+
+    mode = 'r+b' if journal.entries and os.path.exists(output) else 'wb'
+    if mode == 'wb' and journal.entries:
+        raise ValueError("Output %s of the journaled run is missing" % output)
+
+    searched = 0
+    skipped = 0
+    with open(output, mode) as out:
+        out.seek(journal.offset)
+        out.truncate()
+        save = metrics.call('serialize', lambda h: cPickle.dump(h, out))
+        for index, chunk in enumerate(chunks(query_file, size=chunk_size)):
+            if journal.is_done(index, chunk):
+                skipped += 1
+                continue
+
+            hits = 0
+            with tempfile.NamedTemporaryFile(suffix='.fasta') as queries:
+                SeqIO.write(chunk, queries, 'fasta')
+                queries.flush()
+                for hit in mapper(genome_file, queries.name):
+                    save(hit)
+                    hits += 1
+            durable(out)
+            journal.record(index, chunk, hits, out.tell())
+            searched += 1
+            log("Finished chunk %i with %i hits" % (index, hits))
+    return searched, skipped
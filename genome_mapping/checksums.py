@@ -0,0 +1,197 @@
+"""This module contains a disk backed table of known md5's of sequences, like
+the RNAcentral wide data/md5.tsv, for checking the md5's of extracted
+sequences against. The TSV has tens of millions of rows, so rather than read
+it into a dict for every check, it is converted once into a file next to it,
+named like it with .bin added, which is memory mapped when checking.
+
+The table starts with a line of the size and modification time of the TSV
+it was built from, so it is rebuilt when the TSV changes, and the width of
+ids. Each following entry is an id, padded with spaces to that width, then
+the 16 bytes of the md5, and entries are sorted by id. If an id is in the
+TSV several times, the last md5 is used. A TSV with any md5 which is not 32
+hex digits is rejected, rather than building a table it would not fit.
+
+There are two ways to check. Looking up each row does a binary search of the
+table, which is best for a few rows. Sort merging sorts the rows by id and
+reads them along with the table, then sorts the results back into the order
+of the rows, so it reads the table once and uses constant memory however
+many rows there are.
+"""
+
+import os
+import re
+import csv
+import heapq
+import binascii
+import operator as op
+import itertools as it
+
+from genome_mapping import grouping
+from genome_mapping import sequences
+
+MD5_SIZE = 16
+"""The number of bytes of a binary md5."""
+
+OK = 'OK'
+NOT_OK = 'NOT OK'
+MISSING = 'MISSING'
+
+
+def describe(filename, width):
+    info = os.stat(filename)
+    return '#%i\t%r\t%i\n' % (info.st_size, info.st_mtime, width)
+
+
+IS_MD5 = re.compile(r'^[0-9a-fA-F]{32}$')
+
+
+def read_tsv(filename):
+    """Read the (id, md5) rows of a TSV, failing on any row that does not
+    have an md5 of 32 hex digits, since it would not fit in the table.
+    """
+
+    with open(filename, 'rb') as raw:
+        for number, row in enumerate(csv.reader(raw, delimiter='\t'), 1):
+            if len(row) < 2 or not IS_MD5.match(row[1]):
+                raise ValueError("Row %i of %s does not have a valid md5: %s"
+                                 % (number, filename, '\t'.join(row)))
+            yield row[0], row[1]
+
+
+class Md5Table(object):
+    """A sorted, memory mapped table of the md5 of each id in a TSV file.
+
+    Parameters
+    ----------
+    filename : str
+        The TSV of ids and md5's, the table is built if it is missing or was
+        built from a different version of it.
+
+    buffer_size : int
+        The number of rows to sort in memory when building the table.
+    """
+
+    def __init__(self, filename, buffer_size=grouping.BUFFER_SIZE):
+        self.filename = filename
+        self.path = filename + '.bin'
+        if not self.is_current():
+            self.build(buffer_size=buffer_size)
+        self.buffer = sequences.mapped(self.path)
+        self.first = self.buffer.find('\n') + 1
+        self.width = int(self.buffer[:self.first].split('\t')[2])
+        self.size = self.width + MD5_SIZE
+        self.count = (len(self.buffer) - self.first) // self.size
+
+    def is_current(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'rb') as raw:
+            header = raw.readline()
+        width = header.rstrip('\n').split('\t')[-1]
+        return width.isdigit() and \
+            header == describe(self.filename, int(width))
+
+    def build(self, buffer_size=grouping.BUFFER_SIZE):
+        widths = [0]
+
+        def rows():
+            for (name, md5) in read_tsv(self.filename):
+                widths[0] = max(widths[0], len(name))
+                yield name, binascii.unhexlify(md5)
+
+        # Reading every row into the sorted runs finds the width of ids
+        # before anything is written.
+        runs = grouping.sorted_runs(rows(), op.itemgetter(0),
+                                    buffer_size=buffer_size)
+        width = widths[0]
+        entries = (e[-1] for e in heapq.merge(*runs))
+        with sequences.replacing(self.path) as out:
+            out.write(describe(self.filename, width))
+            for (name, group) in it.groupby(entries, op.itemgetter(0)):
+                md5 = list(group)[-1][1]
+                out.write(name.ljust(width) + md5)
+
+    def entry(self, index):
+        start = self.first + index * self.size
+        name = self.buffer[start:start + self.width].rstrip(' ')
+        return name, self.buffer[start + self.width:start + self.size]
+
+    def entries(self):
+        for index in xrange(self.count):
+            yield self.entry(index)
+
+    def get(self, name):
+        """Get the hex md5 of an id, or None if it is not in the table.
+        """
+
+        if len(name) > self.width:
+            return None
+
+        # Ids never contain spaces, so padded ids sort like the ids do and
+        # can be compared with the table without stripping each entry.
+        key = name.ljust(self.width)
+        buffer = self.buffer
+        first = self.first
+        size = self.size
+        width = self.width
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = first + middle * size
+            if buffer[start:start + width] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        start = first + low * size
+        if low < self.count and buffer[start:start + width] == key:
+            return binascii.hexlify(buffer[start + width:start + size])
+        return None
+
+
+def status(expected, md5):
+    if expected is None:
+        return MISSING
+    if expected == md5.lower():
+        return OK
+    return NOT_OK
+
+
+def validate(rows, table):
+    """Check the (id, md5) rows against the table by looking up each one.
+
+    Yields
+    ------
+    result : tuple
+        The id and status, OK, NOT OK or MISSING, of each row in order.
+    """
+
+    for (name, md5) in rows:
+        yield name, status(table.get(name), md5)
+
+
+def validate_sorted(rows, table, buffer_size=grouping.BUFFER_SIZE):
+    """Check the (id, md5) rows against the table by sorting them by id and
+    merging them with the table, in constant memory. The results are the
+    same, and in the same order, as validate.
+    """
+
+    runs = grouping.sorted_runs(rows, op.itemgetter(0),
+                                buffer_size=buffer_size)
+
+    def checked():
+        known = table.entries()
+        entry = next(known, None)
+        for (name, position, (_, md5)) in heapq.merge(*runs):
+            while entry is not None and entry[0] < name:
+                entry = next(known, None)
+            expected = None
+            if entry is not None and entry[0] == name:
+                expected = binascii.hexlify(entry[1])
+            yield position, name, status(expected, md5)
+
+    results = grouping.sorted_runs(checked(), op.itemgetter(0),
+                                   buffer_size=buffer_size)
+    for (_, _, (_, name, state)) in heapq.merge(*results):
+        yield name, state
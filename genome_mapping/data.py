@@ -1,11 +1,14 @@
 import attr
 
-import gffutils as gff
-import intervaltree as itt
-
 from attr.validators import optional
 from attr.validators import instance_of as is_a
 
+from genome_mapping import overlaps
+from genome_mapping import utils as ut
+
+gff = ut.lazy('gffutils')
+itt = ut.lazy('intervaltree')
+
 UNKNOWN = 'UNKNOWN'
 
 RESULT_TYPE = frozenset([
@@ -129,6 +132,10 @@ class Hit(object):
     def query_identity(self):
         return 100 * float(self.stats.identical) / self.stats.length.query
 
+    @property
+    def strand(self):
+        return '+' if self.is_forward else '-'
+
     def __attrs_post_init__(self):
         assert 0 <= self.query_identity <= 100
 
@@ -230,6 +237,13 @@ class ComparisionType(object):
             hit_type=hit.sequence_type,
         )
 
+    @property
+    def result(self):
+        """The entry in RESULT_TYPE for this type of comparison, this ignores
+        the feature and hit types.
+        """
+        return '_'.join(p for p in (self.match, self.location) if p)
+
 
 @attr.s(frozen=True, slots=True)
 class Shift(object):
@@ -359,12 +373,65 @@ class FeatureData(object):
         return UNKNOWN
 
 
+@attr.s(frozen=True, slots=True)
+class Overlap(object):
+    bases = attr.ib(validator=IS_INT)
+    hit_bases = attr.ib(validator=IS_INT)
+    feature_bases = attr.ib(validator=IS_INT)
+    intron_chain_match = attr.ib(validator=IS_BOOL)
+
+    @classmethod
+    def build(cls, hit, feature):
+        """Compare the exons of the hit and feature. This counts the bases
+        which are covered by both and checks if they have the same introns.
+        Two unspliced sequences are considered to have matching intron chains.
+        """
+
+        hit_blocks = overlaps.hit_blocks(hit)
+        feature_blocks = overlaps.feature_blocks(feature)
+        bases = 0
+        if hit.chromosome == feature.chromosome:
+            bases = overlaps.intersection(hit_blocks, feature_blocks)
+        matching = hit.chromosome == feature.chromosome and \
+            overlaps.introns(hit_blocks) == overlaps.introns(feature_blocks)
+
+        return cls(
+            bases=bases,
+            hit_bases=overlaps.size(hit_blocks),
+            feature_bases=overlaps.size(feature_blocks),
+            intron_chain_match=matching,
+        )
+
+    @property
+    def union(self):
+        return self.hit_bases + self.feature_bases - self.bases
+
+    @property
+    def jaccard(self):
+        if not self.union:
+            return 0.0
+        return float(self.bases) / self.union
+
+    @property
+    def hit_fraction(self):
+        if not self.hit_bases:
+            return 0.0
+        return float(self.bases) / self.hit_bases
+
+    @property
+    def feature_fraction(self):
+        if not self.feature_bases:
+            return 0.0
+        return float(self.bases) / self.feature_bases
+
+
 @attr.s(frozen=True, slots=True)
 class Comparision(object):
     hit = attr.ib(validator=optional(is_a(Hit)))
     feature = attr.ib(validator=optional(is_a(FeatureData)))
     shift = attr.ib(validator=is_a(Shift))
     type = attr.ib(validator=is_a(ComparisionType))
+    overlap = attr.ib(validator=optional(is_a(Overlap)), default=None)
 
     @classmethod
     def build(cls, hit, feature):
@@ -373,4 +440,45 @@ class Comparision(object):
 
         shift = Shift.build(hit, feature)
         type = ComparisionType.build(shift, hit, feature)
-        return cls(hit=hit, feature=feature, shift=shift, type=type)
+        overlap = None
+        if hit and feature:
+            overlap = Overlap.build(hit, feature)
+        return cls(hit=hit, feature=feature, shift=shift, type=type,
+                   overlap=overlap)
+
+
+@attr.s(frozen=True, slots=True)
+class Neighbor(object):
+    hit = attr.ib(validator=is_a(Hit))
+    feature = attr.ib(validator=is_a(FeatureData))
+    distance = attr.ib(validator=IS_INT)
+
+    @classmethod
+    def build(cls, hit, feature):
+        """Create a Neighbor. The distance is the number of bases between the
+        hit and feature, it is negative if the hit is before the feature, 0 if
+        they overlap and positive if the hit is after the feature.
+        """
+
+        if hit.stop < feature.start:
+            distance = hit.stop - feature.start
+        elif hit.start > feature.stop:
+            distance = hit.start - feature.stop
+        else:
+            distance = 0
+        return cls(hit=hit, feature=feature, distance=distance)
+
+
+@attr.s(frozen=True, slots=True)
+class Cluster(object):
+    chromosome = attr.ib(validator=IS_STR)
+    strand = attr.ib(validator=optional(IS_STR))
+    start = attr.ib(validator=IS_INT)
+    stop = attr.ib(validator=IS_INT)
+    depth = attr.ib(validator=IS_INT)
+    hits = attr.ib(validator=IS_INT)
+    urs = attr.ib(validator=IS_LIST, hash=False)
+
+    @property
+    def length(self):
+        return self.stop - self.start
@@ -1,12 +1,14 @@
+import os
+import re
 import abc
-import csv
 import sys
 import json
+import hashlib
 import itertools as it
 
 import attr
-from gffutils import Feature
 
+from genome_mapping import bgzf
 from genome_mapping import data as dat
 from genome_mapping import utils as ut
 
@@ -25,6 +27,141 @@ def format(data, name, stream):
     return obj(data, stream)
 
 
+def write_array(entries, stream):
+    """Write the entries as a JSON array, one entry at a time. This produces
+    the same output as json.dump of a list of the entries without ever
+    holding the list.
+    """
+
+    stream.write('[')
+    for index, entry in enumerate(entries):
+        if index:
+            stream.write(', ')
+        stream.write(json.dumps(entry))
+    stream.write(']')
+
+
+def write_lines(entries, stream):
+    """Write the entries as newline delimited JSON, one entry per line.
+    """
+
+    for entry in entries:
+        stream.write(json.dumps(entry))
+        stream.write('\n')
+
+
+BATCH_SIZE = 10000
+"""The number of rows to join and write at once."""
+
+GFF3_ATTRIBUTE_ORDER = ('ID', 'Name', 'Alias', 'Parent')
+"""Attributes which are written first, in this order, if present."""
+
+GFF3_COLUMN = ''.join(chr(c) for c in range(32)) + '\x7f%'
+"""The characters which must be escaped in any GFF3 column."""
+
+GFF3_ATTRIBUTE = GFF3_COLUMN + ';=&,'
+"""The characters which must be escaped in GFF3 attribute tags and values."""
+
+COPY_ESCAPES = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r'))
+"""The characters to escape in the text format of COPY, backslash first."""
+
+GFF3_SEQID = ''.join(chr(c) for c in range(256)
+                     if not re.match(r'[a-zA-Z0-9.:^*$@!+_?|-]', chr(c)))
+"""The characters which must be escaped in a GFF3 seqid."""
+
+
+def escape(unsafe, value):
+    """Percent encode all characters of value which are in unsafe. Most
+    values need no escaping, which translate detects quickly.
+    """
+
+    value = str(value)
+    if len(value.translate(None, unsafe)) == len(value):
+        return value
+    return ''.join('%%%02X' % ord(c) if c in unsafe else c for c in value)
+
+
+def gff3_attributes(attributes):
+    if isinstance(attributes, dict):
+        first = [k for k in GFF3_ATTRIBUTE_ORDER if k in attributes]
+        rest = sorted(k for k in attributes if k not in GFF3_ATTRIBUTE_ORDER)
+        attributes = [(k, attributes[k]) for k in first + rest]
+
+    parts = []
+    for key, value in attributes:
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        value = ','.join(escape(GFF3_ATTRIBUTE, v) for v in value)
+        parts.append('%s=%s' % (escape(GFF3_ATTRIBUTE, key), value))
+    return ';'.join(parts) or '.'
+
+
+def gff3_row(seqid, source, feature_type, start, stop, score, strand, frame,
+             attributes):
+    """Build a single GFF3 line, escaping each column as the GFF3
+    specification requires.
+    """
+
+    return '\t'.join([
+        escape(GFF3_SEQID, seqid),
+        escape(GFF3_COLUMN, source or '.'),
+        escape(GFF3_COLUMN, feature_type),
+        str(start),
+        str(stop),
+        str(score or '.'),
+        strand or '.',
+        str(frame or '.'),
+        gff3_attributes(attributes),
+    ])
+
+
+def output_name(formatter, stream):
+    """Get the name of the file a stream writes to, for formats which write
+    companion files next to it.
+    """
+
+    name = getattr(stream, 'name', '')
+    if not name or name.startswith('<'):
+        raise ValueError("The %s format must be written to a file" %
+                         formatter.name)
+    return name
+
+
+def taxid(hit):
+    """Get the taxid of a hit from the id of its query, like
+    URS0000000001_9606, since the urs of a hit does not include it.
+    """
+
+    match = re.search(r'_(\d+)$', hit.input_sequence.id)
+    if not match:
+        raise ValueError("No taxid in the id %s" % hit.input_sequence.id)
+    return int(match.group(1))
+
+
+def copy_escape(value):
+    """Escape a value for the text format of PostgreSQL's COPY.
+    """
+
+    if value is None:
+        return '\\N'
+    value = str(value)
+    for raw, escaped in COPY_ESCAPES:
+        value = value.replace(raw, escaped)
+    return value
+
+
+def write_rows(rows, stream, size=BATCH_SIZE):
+    """Write rows, as lines, in batches of size rows at a time.
+    """
+
+    while True:
+        batch = list(it.islice(rows, size))
+        if not batch:
+            return
+        batch.append('')
+        stream.write('\n'.join(batch))
+
+
 class Base(object):
     __metaclass__ = abc.ABCMeta
 
@@ -47,46 +184,60 @@ class Json(Base):
         raise ValueError("Cannot handle this data type")
 
     def __call__(self, data, stream):
-        return json.dump(self.format(data), stream)
+        write_array((self.format(d) for d in data), stream)
+
+
+class JsonLines(Json):
+    name = 'ndjson'
+
+    def __call__(self, data, stream):
+        write_lines((self.format(d) for d in data), stream)
 
 
 class Gff3(Base):
     name = 'gff3'
+    header = '##gff-version 3\n'
 
     def format_feature(self, feature):
-        return feature.pretty
+        return '\n'.join(self.format_fragment(f) for f in feature.fragments)
 
-    def format_hit(self, hit, hit_type=None, **extra):
-        attributes = {
-            'Name': hit.input_sequence.urs,
-            'Header': hit.input_sequence.header,
-            'HitSize': hit.stats.length.hit,
-            'QuerySize': hit.stats.length.query,
-        }
-        attributes.update(extra or {})
+    def format_fragment(self, fragment):
+        return gff3_row(
+            seqid=fragment.seqid,
+            source=fragment.source,
+            feature_type=fragment.feature_type,
+            start=fragment.start,
+            stop=fragment.stop,
+            score=fragment.score,
+            strand=fragment.strand,
+            frame=fragment.frame,
+            attributes=fragment.attributes,
+        )
 
-        normalized = {}
-        for key, value in attributes.items():
-            if not isinstance(value, list):
-                normalized[key] = [str(value)]
-            else:
-                normalized[key] = [str(e) for e in value]
+    def format_hit(self, hit, hit_type=None, **extra):
+        attributes = [
+            ('Name', hit.input_sequence.urs),
+            ('Header', hit.input_sequence.header),
+            ('HitSize', hit.stats.length.hit),
+            ('QuerySize', hit.stats.length.query),
+        ]
+        attributes.extend(sorted((extra or {}).items()))
 
         feature_type = 'hit'
         if hit_type:
             feature_type = '%s-hit' % hit_type
 
-        return str(Feature(
+        return gff3_row(
             seqid=hit.chromosome,
             source='map_sequences.py',
-            featuretype=feature_type,
+            feature_type=feature_type,
             start=hit.start + 1,
-            end=hit.stop,
-            score='',
-            strand='+' if hit.is_forward else '-',
+            stop=hit.stop,
+            score='.',
+            strand=hit.strand,
             frame='.',
-            attributes=normalized,
-        ))
+            attributes=attributes,
+        )
 
     def format(self, entry):
         if isinstance(entry, dat.Hit):
@@ -99,16 +250,112 @@ class Gff3(Base):
                                       hit_type=entry.type.match,
                                       type=entry.type.pretty)
 
-                if entry.feature:
-                    yield self.format_feature(entry.feature)
+            if entry.feature:
+                yield self.format_feature(entry.feature)
+        else:
             raise ValueError('Cannot format all data to gff')
 
     def __call__(self, data, stream):
-        assert isinstance(data, (list, tuple))
-        stream.write('##gff-version 3\n')
+        stream.write(self.header)
+        rows = it.chain.from_iterable(self.format(e) for e in data)
+        write_rows(rows, stream)
+
+
+class Bed12(Base):
+    """Write hits and features as BED12, with each fragment as a block.
+    Comparisons are written as the hit, named with the urs and result type,
+    followed by the feature.
+    """
+
+    name = 'bed12'
+    header = ''
+
+    def row(self, chromosome, start, stop, name, score, strand, blocks):
+        blocks = sorted(blocks)
+        return '\t'.join([
+            chromosome,
+            str(start),
+            str(stop),
+            name,
+            str(score),
+            strand,
+            str(start),
+            str(stop),
+            '0',
+            str(len(blocks)),
+            ''.join('%i,' % (b - a) for (a, b) in blocks),
+            ''.join('%i,' % (a - start) for (a, _) in blocks),
+        ])
+
+    def format_hit(self, hit, name=None):
+        return self.row(
+            hit.chromosome,
+            hit.start,
+            hit.stop,
+            name or hit.urs,
+            int(round(10 * hit.query_identity)),
+            hit.strand,
+            [(f.start, f.stop) for f in hit.fragments],
+        )
+
+    def format_feature(self, feature):
+        return self.row(
+            feature.chromosome,
+            feature.start - 1,
+            feature.stop,
+            feature.urs,
+            0,
+            feature.strand,
+            [(f.start - 1, f.stop) for f in feature.fragments],
+        )
+
+    def format(self, entry):
+        if isinstance(entry, dat.Hit):
+            yield self.format_hit(entry)
+        elif isinstance(entry, dat.FeatureData):
+            yield self.format_feature(entry)
+        elif isinstance(entry, dat.Comparision):
+            if entry.hit:
+                name = '%s:%s' % (entry.hit.urs, entry.type.result)
+                yield self.format_hit(entry.hit, name=name)
+            if entry.feature:
+                yield self.format_feature(entry.feature)
+        else:
+            raise ValueError('Cannot format all data to bed12')
+
+    def __call__(self, data, stream):
+        rows = it.chain.from_iterable(self.format(e) for e in data)
+        write_rows(rows, stream)
+
+
+class Indexed(object):
+    """Write a line based format sorted by location and block compressed,
+    with a region index written next to it. See genome_mapping.bgzf for
+    fetching regions from it. Classes using this must set kind to one of
+    bgzf.LOCATIONS.
+    """
+
+    def lines(self, data):
         for entry in data:
-            for row in self.format(data):
-                stream.write(row + '\n')
+            for text in self.format(entry):
+                for line in text.split('\n'):
+                    yield line
+
+    def __call__(self, data, stream):
+        index_name = bgzf.index_path(output_name(self, stream))
+        with open(index_name, 'wb') as index:
+            bgzf.write_sorted(self.lines(data), self.kind, stream, index,
+                              header=self.header)
+
+
+class Gff3Indexed(Indexed, Gff3):
+    name = 'gff3-bgzf'
+    kind = 'gff3'
+
+
+class Bed12Indexed(Indexed, Bed12):
+    name = 'bed12-bgzf'
+    kind = 'bed'
 
 
 class Insertable(Base):
@@ -118,10 +365,9 @@ class Insertable(Base):
         if isinstance(data, (tuple, list)):
             return [self.format(d) for d in data]
         elif isinstance(data, dat.Hit):
-            urs, taxid = data.urs.split('_')
             return {
-                'upi': urs,
-                'taxid': int(taxid),
+                'upi': data.urs,
+                'taxid': taxid(data),
                 'exons': self.format(data.fragments)
             }
         elif isinstance(data, dat.Fragment):
@@ -134,4 +380,91 @@ class Insertable(Base):
         raise ValueError("Cannot handle given data")
 
     def __call__(self, data, stream):
-        return json.dump(self.format(data), stream)
+        write_array((self.format(d) for d in data), stream)
+
+
+class InsertableLines(Insertable):
+    name = 'insertable-ndjson'
+
+    def __call__(self, data, stream):
+        write_lines((self.format(d) for d in data), stream)
+
+
+class CopyRows(Insertable):
+    """Write the insertable coordinates as sharded, tab separated files in
+    the text format of PostgreSQL's COPY, one row per exon. The stream given
+    gets a JSON manifest of the columns and shards, and the shards are
+    written next to it, named like the manifest with -00000.tsv and so on in
+    place of its extension. See genome_mapping.loaders for loading them.
+    """
+
+    name = 'copy-tsv'
+
+    columns = ('region', 'upi', 'taxid', 'chromosome', 'strand', 'exon',
+               'primary_start', 'primary_end')
+
+    shard_size = 1000000
+
+    def rows(self, hit):
+        entry = self.format(hit)
+        exons = sorted(entry['exons'], key=lambda e: e['primary_start'])
+        region = '%s_%i@%s/%s:%s' % (
+            entry['upi'],
+            entry['taxid'],
+            hit.chromosome,
+            ','.join('%i-%i' % (e['primary_start'], e['primary_end'])
+                     for e in exons),
+            hit.strand,
+        )
+        for index, exon in enumerate(exons):
+            yield '\t'.join([
+                copy_escape(region),
+                copy_escape(entry['upi']),
+                str(entry['taxid']),
+                copy_escape(exon['chromosome']),
+                str(exon['strand']),
+                str(index + 1),
+                str(exon['primary_start']),
+                str(exon['primary_end']),
+            ])
+
+    def shard_names(self, stream):
+        base = os.path.splitext(output_name(self, stream))[0]
+        return ('%s-%05i.tsv' % (base, i) for i in it.count())
+
+    def write_shard(self, filename, rows):
+        digest = hashlib.md5()
+        count = 0
+        with open(filename, 'wb') as out:
+            for batch in iter(lambda: list(it.islice(rows, BATCH_SIZE)), []):
+                batch.append('')
+                text = '\n'.join(batch)
+                digest.update(text)
+                out.write(text)
+                count += len(batch) - 1
+        return {
+            'path': os.path.basename(filename),
+            'rows': count,
+            'md5': digest.hexdigest(),
+        }
+
+    def __call__(self, data, stream):
+        rows = it.chain.from_iterable(self.rows(d) for d in data)
+        rows = iter(rows)
+        shards = []
+        for filename in self.shard_names(stream):
+            first = next(rows, None)
+            if first is None:
+                break
+            shard_rows = it.islice(it.chain([first], rows), self.shard_size)
+            shards.append(self.write_shard(filename, shard_rows))
+
+        json.dump({
+            'format': 'copy-text',
+            'delimiter': '\t',
+            'null': '\\N',
+            'columns': list(self.columns),
+            'rows': sum(s['rows'] for s in shards),
+            'shards': shards,
+        }, stream, indent=2, sort_keys=True)
+        stream.write('\n')
@@ -0,0 +1,88 @@
+"""This module contains an external sort based grouping. This groups a stream
+of objects by some key while keeping at most a fixed number of objects in
+memory. Once the buffer is full it is sorted and spilled to a temporary file,
+and at the end all spilled runs are merged to produce the groups in key order.
+"""
+
+import heapq
+import cPickle
+import tempfile
+import itertools as it
+import operator as op
+
+BUFFER_SIZE = 100000
+"""The default number of objects to hold in memory before spilling."""
+
+
+def spill(entries, directory=None):
+    """Write the sorted entries to a temporary file and return it, rewound
+    to the start.
+    """
+
+    handle = tempfile.TemporaryFile(dir=directory)
+    for entry in entries:
+        cPickle.dump(entry, handle, cPickle.HIGHEST_PROTOCOL)
+    handle.seek(0)
+    return handle
+
+
+def read_run(handle):
+    try:
+        while True:
+            yield cPickle.load(handle)
+    except EOFError:
+        handle.close()
+
+
+def sorted_runs(data, key, buffer_size=BUFFER_SIZE, directory=None):
+    """Split the data into sorted runs of at most buffer_size entries. If
+    everything fits in a single run it is kept in memory, otherwise each run
+    is spilled to disk. Entries are decorated with their key and position so
+    sorting never compares the objects themselves and is stable.
+    """
+
+    runs = []
+    decorated = ((key(d), i, d) for (i, d) in enumerate(data))
+    while True:
+        buffer = list(it.islice(decorated, buffer_size))
+        if not buffer:
+            break
+        buffer.sort(key=op.itemgetter(0, 1))
+        if len(buffer) < buffer_size and not runs:
+            return [iter(buffer)]
+        runs.append(read_run(spill(buffer, directory=directory)))
+    return runs
+
+
+def group_by(data, key, buffer_size=BUFFER_SIZE, directory=None):
+    """Group the data by the given key function.
+
+    Parameters
+    ----------
+    data : iterable
+        The objects to group.
+
+    key : function
+        A function to compute the key to group by.
+
+    buffer_size : int
+        The maximum number of objects to keep in memory while sorting.
+
+    directory : str
+        The directory to write temporary files to, defaults to the system
+        temporary directory.
+
+    Returns
+    -------
+    groups : generator
+        Yields (key, entries) tuples in order of key. Entries within a group
+        keep their input order. Like itertools.groupby, entries is an
+        iterator which is read from the merged runs, so a group is never
+        held in memory, and it must be consumed before the next group.
+    """
+
+    runs = sorted_runs(data, key, buffer_size=buffer_size,
+                       directory=directory)
+    merged = heapq.merge(*runs)
+    for group_key, group in it.groupby(merged, op.itemgetter(0)):
+        yield group_key, it.imap(op.itemgetter(2), group)
@@ -2,18 +2,30 @@ import operator as op
 import itertools as it
 import collections as coll
 
-import gffutils as gff
-from intervaltree import IntervalTree
-
+from genome_mapping import joins
+from genome_mapping import metrics
+from genome_mapping import utils as ut
 from genome_mapping.data import urs_of
+from genome_mapping.data import Neighbor
 from genome_mapping.data import Comparision
 from genome_mapping.data import FeatureData
 
+gff = ut.lazy('gffutils')
+itt = ut.lazy('intervaltree')
+
 
 class Tree(object):
     def __init__(self, filename):
-        self.db = gff.create_db(filename, ':memory:')
-        self.trees = self.__build_tree__(self.intervals())
+        with metrics.timed('tree build'):
+            self.db = gff.create_db(filename, ':memory:')
+            self.features = list(self.intervals())
+            self.trees = self.__build_tree__(self.features)
+            self.chromosomes = coll.defaultdict(list)
+            for key in sorted(self.trees):
+                self.chromosomes[key[0]].append(self.trees[key])
+            self.chromosomes = dict(self.chromosomes)
+            self.by_urs = self.__build_index__(self.features)
+        metrics.count('tree build', len(self.features))
 
     def intervals(self):
         def as_key(feature):
@@ -32,21 +44,69 @@ class Tree(object):
         for subfeatures in grouped.itervalues():
             yield FeatureData.build(subfeatures)
 
-    def search(self, start, stop):
-        return {i.data for i in self.tree.search(start, stop)}
+    def expected(self, urs):
+        """Get all known features for the given URS.
+        """
+        return self.by_urs.get(urs, [])
+
+    def distance_to_expected(self, hits):
+        """For each hit find the closest known feature with the same URS on
+        the same chromosome. This yields a (hit, loci, neighbor) tuple for each
+        hit, where loci is all known features of the hit's URS and neighbor is
+        the Neighbor of the hit and the closest one, or None if the URS is not
+        known on the chromosome of the hit.
+        """
 
+        for hit in hits:
+            loci = self.expected(hit.urs)
+            possible = [Neighbor.build(hit, f) for f in loci
+                        if f.chromosome == hit.chromosome]
+            if not possible:
+                yield hit, loci, None
+                continue
+            yield hit, loci, min(possible, key=joins.closeness)
+
+    def search(self, chromosome, start, stop, strand=None):
+        """Find all features which overlap the given range. If strand is given
+        only features on that strand are found.
+        """
+
+        if strand is None:
+            trees = self.chromosomes.get(chromosome, [])
+        else:
+            trees = [self.trees.get((chromosome, strand), itt.IntervalTree())]
+        return {i.data for t in trees for i in t.search(start, stop)}
+
+    def trees_for(self, hit, strand='both'):
+        """Get the trees which contain the features that should be compared
+        to the given hit. With 'both' this is all trees for the hit's
+        chromosome, with 'same' or 'opposite' it is only the tree of features
+        on the same or opposite strand.
+        """
+
+        if strand == 'both':
+            return self.chromosomes[hit.chromosome]
+        key = joins.partition_key(hit, strand=strand,
+                                  flip=(strand == 'opposite'))
+        if key not in self.trees:
+            return []
+        return [self.trees[key]]
+
+    @metrics.measured('search')
     def compare_to_known(self, hits, reduce_duplicates=True,
-                         ignore_missing_chromosome=True):
+                         ignore_missing_chromosome=True, strand='both'):
         seen = set()
         compared = []
         for hit in hits:
-            if hit.chromosome not in self.trees:
+            if hit.chromosome not in self.chromosomes:
                 if ignore_missing_chromosome:
                     continue
                 raise ValueError("No tree for chromosome %s" % hit.chromosome)
 
-            tree = self.trees[hit.chromosome]
-            intervals = tree.search(hit.start, hit.stop)
+            trees = self.trees_for(hit, strand=strand)
+            intervals = set()
+            for tree in trees:
+                intervals.update(tree.search(hit.start, hit.stop))
             if not intervals:
                 compared.append(Comparision.build(hit, None))
                 continue
@@ -69,39 +129,38 @@ class Tree(object):
         compared.extend(rest)
         return compared
 
-    def best_hits_within(self, hits, max_range):
-        # For each feature search for all hits within max_range of the feature.
-        # Then select only the 'best' hits, ie max similarity/completeness
+    @metrics.measured('search')
+    def best_hits_within(self, hits, max_range, strand='both'):
+        # For each feature find all hits within max_range of the feature. Then
+        # select only the 'best' hits, ie max identity.
         comparisions = []
-        hit_trees = self.__build_tree__(hits)
-        found = set()
-        for chromosome, tree in self.trees.iteritems():
-            hit_tree = hit_trees[chromosome]
-            for interval in tree:
-                feature = interval.data
-                start = interval.begin - max_range
-                end = interval.end + max_range
-                hits = [i.data for i in hit_tree.search(start, end)]
-                if not hits:
-                    continue
-
-                similarity = max(h.stats.identity for h in hits)
-                best = (h for h in hits if h.stats.identity == similarity)
-                best = [Comparision.build(h, feature) for h in best]
-                if best:
-                    found.add(feature)
-                comparisions.extend(best)
+        near = joins.nearest(self.features, hits, max_range=max_range,
+                             strand=strand)
+        for feature, neighbors in near:
+            if not neighbors:
+                comparisions.append(Comparision.build(None, feature))
+                continue
 
-        for tree in self.trees.itervalues():
-            for interval in tree:
-                if interval.data not in found:
-                    comparisions.append(Comparision.build(None, feature))
+            identity = max(n.hit.query_identity for n in neighbors)
+            best = (n.hit for n in neighbors
+                    if n.hit.query_identity == identity)
+            comparisions.extend(Comparision.build(h, feature) for h in best)
 
         return comparisions
 
+    def nearest_hits(self, hits, max_range=None, count=None, strand='both'):
+        near = joins.nearest(self.features, hits, max_range=max_range,
+                             count=count, strand=strand)
+        return it.chain.from_iterable(n for (_, n) in near)
+
+    def __build_index__(self, features):
+        index = coll.defaultdict(list)
+        for feature in features:
+            index[feature.urs].append(feature)
+        return dict(index)
+
     def __build_tree__(self, data):
-        as_tree = IntervalTree.from_tuples
-        by_chromosome = sorted(data, key=op.attrgetter('chromosome'))
-        by_chromosome = it.imap(lambda m: (m.start, m.stop, m), by_chromosome)
-        by_chromosome = it.groupby(by_chromosome, lambda i: i[2].chromosome)
-        return {k: as_tree(v) for (k, v) in by_chromosome}
+        as_tree = itt.IntervalTree.from_tuples
+        grouped = joins.partition(data, strand='same')
+        return {k: as_tree((d.start, d.stop, d) for d in v)
+                for (k, v) in grouped.iteritems()}
@@ -0,0 +1,149 @@
+"""This module contains a windowed join between coordinate sorted hits and
+features. Instead of building an IntervalTree of hits and searching it once per
+feature, both sides are sorted by start and swept in a single merge pass per
+chromosome (or per chromosome and strand). This supports finding all hits
+within some range of a feature, the k nearest hits to a feature, or both.
+"""
+
+import bisect
+import heapq
+import operator as op
+import itertools as it
+import collections as coll
+
+from genome_mapping.data import Neighbor
+
+STRANDS = frozenset(['both', 'same', 'opposite'])
+"""The known ways to restrict the strand of hits matched to a feature."""
+
+FLIPPED = {'+': '-', '-': '+'}
+
+
+def partition_key(entry, strand='both', flip=False):
+    """Compute the key to partition a hit or feature by. If strand is 'both'
+    this is only the chromosome, otherwise it is the chromosome and strand. If
+    flip is True the strand will be reversed, this is used to match hits
+    against features on the opposite strand.
+    """
+
+    if strand not in STRANDS:
+        raise ValueError("Unknown strand restriction %s" % strand)
+    if strand == 'both':
+        return (entry.chromosome,)
+    value = entry.strand
+    if flip:
+        value = FLIPPED.get(value, value)
+    return (entry.chromosome, value)
+
+
+def partition(data, strand='both', flip=False):
+    """Group the given data by the partition_key and sort each group by
+    start, stop.
+    """
+
+    grouped = coll.defaultdict(list)
+    for entry in data:
+        grouped[partition_key(entry, strand=strand, flip=flip)].append(entry)
+    for entries in grouped.itervalues():
+        entries.sort(key=op.attrgetter('start', 'stop'))
+    return grouped
+
+
+def sweep(features, hits, max_range):
+    """Merge join two start sorted lists. This yields each feature and the
+    list of hits which are within max_range of it. The active window only
+    holds the hits that may still reach the current or a later feature, so
+    each hit is added and dropped exactly once.
+    """
+
+    pending = iter(hits)
+    upcoming = next(pending, None)
+    active = []
+    for feature in features:
+        low = feature.start - max_range
+        high = feature.stop + max_range
+        while upcoming is not None and upcoming.start <= high:
+            active.append(upcoming)
+            upcoming = next(pending, None)
+
+        # Features are sorted by start so low never decreases and a hit which
+        # ends before it can not be near any later feature either.
+        active = [h for h in active if h.stop >= low]
+        yield feature, [h for h in active if h.start <= high]
+
+
+def flanking(features, hits, count):
+    """Find up to count hits on either side of each feature which do not
+    overlap it. Together with the overlapping hits these must contain the
+    count nearest hits.
+    """
+
+    by_stop = sorted(hits, key=op.attrgetter('stop'))
+    stops = [h.stop for h in by_stop]
+    starts = [h.start for h in hits]
+    for feature in features:
+        left = bisect.bisect_left(stops, feature.start)
+        right = bisect.bisect_right(starts, feature.stop)
+        yield by_stop[max(0, left - count):left] + hits[right:right + count]
+
+
+def closeness(neighbor):
+    hit = neighbor.hit
+    return (abs(neighbor.distance), hit.start, hit.stop)
+
+
+def nearest(features, hits, max_range=None, count=None, strand='both'):
+    """Join the given features to the hits near them.
+
+    Parameters
+    ----------
+    features : iterable
+        The FeatureData objects to find hits near.
+
+    hits : iterable
+        The Hit objects to search.
+
+    max_range : int
+        If given only hits within this many bases of a feature are found.
+
+    count : int
+        If given only the count nearest hits to each feature are found. Ties
+        are broken by the hit position.
+
+    strand : str
+        One of 'both', 'same' or 'opposite' to control what strand hits must
+        be on relative to the feature.
+
+    Returns
+    -------
+    neighbors : generator
+        Yields a (feature, neighbors) tuple for each feature, where neighbors
+        is a list of Neighbor objects sorted by absolute distance.
+    """
+
+    if max_range is None and count is None:
+        raise ValueError("Must give at least one of max_range and count")
+    if max_range is not None and max_range < 0:
+        raise ValueError("max_range must not be negative")
+    if count is not None and count < 1:
+        raise ValueError("count must be positive")
+
+    grouped_hits = partition(hits, strand=strand, flip=(strand == 'opposite'))
+    grouped_features = partition(features, strand=strand)
+    for key in sorted(grouped_features):
+        features = grouped_features[key]
+        hits = grouped_hits.get(key, [])
+        if max_range is not None:
+            found = sweep(features, hits, max_range)
+        else:
+            overlaps = sweep(features, hits, 0)
+            sides = flanking(features, hits, count)
+            found = ((f, o + s) for ((f, o), s) in it.izip(overlaps, sides))
+
+        for feature, near in found:
+            neighbors = [Neighbor.build(h, feature) for h in near]
+            if count is not None:
+                neighbors = heapq.nsmallest(count, neighbors, key=closeness)
+            else:
+                neighbors.sort(key=closeness)
+            yield feature, neighbors
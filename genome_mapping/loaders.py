@@ -0,0 +1,132 @@
+"""This module contains a loader for the sharded files of the copy-tsv
+format. The real target is the RNAcentral PostgreSQL database, which can
+COPY the shards directly. This loads them into SQLite instead, which needs
+no server, so the format and the time it takes to load can be checked
+anywhere.
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import itertools as it
+
+BATCH_SIZE = 50000
+"""The number of rows inserted at once."""
+
+TABLE = 'genome_coordinates'
+"""The default table to load into."""
+
+TYPES = {
+    'taxid': 'INTEGER',
+    'strand': 'INTEGER',
+    'exon': 'INTEGER',
+    'primary_start': 'INTEGER',
+    'primary_end': 'INTEGER',
+}
+"""The SQL type of each column which is not text."""
+
+UNESCAPES = {'\\\\': '\\', '\\t': '\t', '\\n': '\n', '\\r': '\r'}
+
+
+def unescape(value):
+    """Undo the escaping of a single value of the COPY text format.
+    """
+
+    if value == '\\N':
+        return None
+    if '\\' not in value:
+        return value
+    parts = []
+    index = 0
+    while index < len(value):
+        pair = value[index:index + 2]
+        if pair in UNESCAPES:
+            parts.append(UNESCAPES[pair])
+            index += 2
+        else:
+            parts.append(value[index])
+            index += 1
+    return ''.join(parts)
+
+
+def read_manifest(filename):
+    with open(filename, 'rb') as raw:
+        manifest = json.load(raw)
+    if manifest.get('format') != 'copy-text':
+        raise ValueError("%s is not a copy-tsv manifest" % filename)
+    return manifest
+
+
+def shard_rows(filename, expected_md5=None):
+    """Read the rows of a single shard, checking its md5 once it has been
+    read completely.
+    """
+
+    digest = hashlib.md5()
+    with open(filename, 'rb') as raw:
+        for line in raw:
+            digest.update(line)
+            values = line.rstrip('\n').split('\t')
+            yield [unescape(v) for v in values]
+    if expected_md5 and digest.hexdigest() != expected_md5:
+        raise ValueError("Shard %s does not match its manifest" % filename)
+
+
+def create_table(connection, table, columns):
+    definitions = ['%s %s' % (c, TYPES.get(c, 'TEXT')) for c in columns]
+    connection.execute('CREATE TABLE IF NOT EXISTS %s (%s)' %
+                       (table, ', '.join(definitions)))
+
+
+def load_sqlite(manifest_file, database, table=TABLE, batch_size=BATCH_SIZE):
+    """Load all shards of a manifest into a SQLite database.
+
+    Parameters
+    ----------
+    manifest_file : str
+        The path to the manifest written by the copy-tsv format.
+
+    database : str
+        The path to the SQLite database, it is created if needed.
+
+    table : str
+        The table to load into, it is created if needed.
+
+    batch_size : int
+        The number of rows inserted at once. Each shard is loaded in a single
+        transaction, which is rolled back if the shard does not match its
+        manifest, so a corrupt or short shard loads nothing.
+
+    Returns
+    -------
+    rows : int
+        The number of rows loaded.
+    """
+
+    manifest = read_manifest(manifest_file)
+    columns = manifest['columns']
+    directory = os.path.dirname(manifest_file)
+    insert = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        table, ', '.join(columns), ', '.join('?' for _ in columns))
+
+    connection = sqlite3.connect(database)
+    try:
+        create_table(connection, table, columns)
+        loaded = 0
+        for shard in manifest['shards']:
+            path = os.path.join(directory, shard['path'])
+            rows = shard_rows(path, expected_md5=shard['md5'])
+            count = 0
+            with connection:
+                batches = iter(lambda: list(it.islice(rows, batch_size)), [])
+                for batch in batches:
+                    connection.executemany(insert, batch)
+                    count += len(batch)
+                if count != shard['rows']:
+                    raise ValueError("Shard %s has %i rows not %i" %
+                                     (path, count, shard['rows']))
+            loaded += count
+    finally:
+        connection.close()
+    return loaded
@@ -4,18 +4,20 @@ Mappers are expected to be callable objects. """
 
 from __future__ import division
 
+import os
 import re
 import abc
 import sys
 import tempfile
 
-from Bio import SeqIO
-from Bio import SearchIO
-
 import subprocess as sp
 
 from genome_mapping import data as gm
 from genome_mapping import utils as ut
+from genome_mapping import metrics
+
+SeqIO = ut.lazy('Bio.SeqIO')
+SearchIO = ut.lazy('Bio.SearchIO')
 
 MIN_BLAT_SEQ_LEN = 25
 """The minimum length for sequences to use with BLAT."""
@@ -33,6 +35,14 @@ def known_formats():
     return {m.format: m for m in ut.children_of(sys.modules[__name__], Mapper)}
 
 
+def infer_format(filename):
+    _, ext = os.path.splitext(filename)
+    format = ext[1:]
+    if format not in known_formats():
+        raise ValueError("Unknown inferred format %s" % format)
+    return format
+
+
 def from_format(filename, target_file, format):
     mappers = known_formats()
     mapper = mappers[format]()
@@ -67,8 +77,10 @@ class Mapper(object):
                 yield sequence
 
     def parse_result_file(self, result_file, target_file):
-        data = SearchIO.index(result_file, self.format)
-        return self.create_mappings(target_file, data)
+        with metrics.timed('parse'):
+            data = SearchIO.index(result_file, self.format)
+        hits = self.create_mappings(target_file, data)
+        return metrics.stream('construct', hits)
 
     def create_mappings(self, query_file, result_index):
         """Create the mappings from the given raw data. The mapping objects in
@@ -100,6 +112,10 @@ class Mapper(object):
                 length=len(record),
             )
 
+            # Queries without any alignment are not in the results.
+            if sequence.id not in result_index:
+                continue
+
             for hit in result_index[sequence.id]:
                 for hsp_index, hsp in enumerate(hit):
                     subhits = []
@@ -117,7 +133,14 @@ class Mapper(object):
                             hit=-1,
                         )
 
-                        start, end = sorted([hsp.hit_start, hsp.hit_end])
+                        start, end = sorted([fragment.hit_start,
+                                             fragment.hit_end])
+
+                        # BLAT's PSL puts the strand on the query and always
+                        # gives the hit strand as 1, so the strand on the
+                        # genome is the product of both.
+                        strand = (fragment.query_strand or 1) * \
+                            (fragment.hit_strand or 1)
 
                         name = "{urs} ({cur_hsp}/{total_hsp}) ({cur_frag}/{total_frag})".format(
                             urs=sequence.urs,
@@ -131,7 +154,7 @@ class Mapper(object):
                             chromosome=hit.id,
                             start=start,
                             stop=end,
-                            is_forward=fragment.hit_strand == 1,
+                            is_forward=strand == 1,
                             stats=gm.FragmentStats(
                                 length=frag_length,
                                 completeness=frag_completeness,
@@ -185,7 +208,8 @@ class Mapper(object):
         """
 
         output = self.run(genome_file, query_file)
-        return self.create_mappings(query_file, output)
+        hits = self.create_mappings(query_file, output)
+        return metrics.stream('construct', hits)
 
 
 class BlatMapper(Mapper):
@@ -256,7 +280,7 @@ class BlatMapper(Mapper):
         options = sorted(set(options + self.default_options))
         with tempfile.NamedTemporaryFile(suffix='.psl') as psl:
             with tempfile.NamedTemporaryFile(suffix='.fa') as query:
-                sequences = list(self.sequences(query_path))
+                sequences = list(self.valid_sequences(query_path))
                 SeqIO.write(sequences, query, 'fasta')
                 query.flush()
                 cmd = [
@@ -310,7 +334,7 @@ class BlastMapper(Mapper):
         options = self.default_options
         with tempfile.NamedTemporaryFile(suffix='.%s' % self.format) as tmp:
             with tempfile.NamedTemporaryFile(suffix='.fasta', mode='wb') as qtmp:
-                SeqIO.write(self.sequences(query_path), qtmp, 'fasta')
+                SeqIO.write(self.valid_sequences(query_path), qtmp, 'fasta')
                 cmd = [
                     self.path,
                 ] + options + [
@@ -346,7 +370,7 @@ class ExonerateMapper(Mapper):
         options = self.default_options
         with tempfile.NamedTemporaryFile(suffix='.%s' % self.format) as tmp:
             with tempfile.NamedTemporaryFile(suffix='.fasta') as qtmp:
-                SeqIO.write(self.sequences(query_path, as_dna=True), qtmp, 'fasta')
+                SeqIO.write(self.valid_sequences(query_path, as_dna=True), qtmp, 'fasta')
                 cmd = [
                     self.path,
                 ] + options + [
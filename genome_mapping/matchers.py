@@ -26,6 +26,18 @@ def fetch(name):
     return ut.get_child(sys.modules[__name__], Base, name)
 
 
+def from_spec(spec):
+    """Create a matcher from a specification. This is a dict with a
+    'matcher' entry that is the name of the matcher and an optional
+    'definitions' entry of the arguments to build the matcher with.
+    """
+
+    name = spec['matcher']
+    if name not in known():
+        raise ValueError("Unknown Matcher %s" % name)
+    return fetch(name)(**spec.get('definitions', {}))
+
+
 class Base(object):
     """This is the base class that all other mappers should inherit from. It
     does not contain any logic to detect if a match is valid or not, but
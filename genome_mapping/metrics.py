@@ -0,0 +1,209 @@
+"""This module contains optional instrumentation of the stages of gm. When
+enabled it records, for each named stage, the number of records going in and
+out, the time spent and the peak memory use of the process. Stages are
+measured by wrapping the generators that connect them, so the time of a
+stage excludes the time spent waiting on the stages before it.
+
+Nothing is recorded unless enable has been called, and all helpers return
+their input unchanged in that case, so the instrumented code pays almost
+nothing when metrics are not wanted.
+"""
+
+import json
+import time
+import resource
+import functools
+import contextlib
+import collections as coll
+
+_recorder = None
+
+
+class StageMetrics(object):
+    def __init__(self, name):
+        self.name = name
+        self.records_in = 0
+        self.records_out = 0
+        self.input_time = 0.0
+        self.output_time = 0.0
+        self.timed = 0.0
+        self.peak_rss = 0
+
+    @property
+    def elapsed(self):
+        """The time spent in this stage. This is the time spent producing
+        output or in timed blocks, minus the time spent waiting for input.
+        """
+
+        return max(self.output_time + self.timed - self.input_time, 0.0)
+
+    @property
+    def records_per_second(self):
+        records = max(self.records_in, self.records_out)
+        if not self.elapsed:
+            return None
+        return records / self.elapsed
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'records_in': self.records_in,
+            'records_out': self.records_out,
+            'elapsed': self.elapsed,
+            'records_per_second': self.records_per_second,
+            'peak_rss_kb': self.peak_rss,
+        }
+
+
+def peak_rss():
+    """The peak resident set size of this process in KB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Recorder(object):
+    def __init__(self):
+        self.started = time.time()
+        self.stages = coll.OrderedDict()
+        self.hooks = []
+
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name)
+        return self.stages[name]
+
+    def add_hook(self, function, every):
+        """Call function(name, direction, count, elapsed) every time a
+        streamed stage has seen another 'every' records.
+        """
+        self.hooks.append((function, every))
+
+    def stream(self, name, iterable, direction):
+        stage = self.stage(name)
+        iterator = iter(iterable)
+        count_name = 'records_%s' % direction
+        time_name = '%sput_time' % direction
+        count = 0
+        while True:
+            start = time.time()
+            try:
+                entry = next(iterator)
+            except StopIteration:
+                setattr(stage, time_name,
+                        getattr(stage, time_name) + time.time() - start)
+                stage.peak_rss = peak_rss()
+                return
+            setattr(stage, time_name,
+                    getattr(stage, time_name) + time.time() - start)
+            setattr(stage, count_name, getattr(stage, count_name) + 1)
+            count += 1
+            for function, every in self.hooks:
+                if count % every == 0:
+                    elapsed = time.time() - self.started
+                    function(name, direction, count, elapsed)
+            yield entry
+
+    def report(self, command=None):
+        return {
+            'command': command,
+            'elapsed': time.time() - self.started,
+            'peak_rss_kb': peak_rss(),
+            'stages': [s.as_dict() for s in self.stages.itervalues()],
+        }
+
+    def write(self, handle, command=None):
+        json.dump(self.report(command=command), handle, indent=2)
+        handle.write('\n')
+
+
+def enable():
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+
+def disable():
+    global _recorder
+    _recorder = None
+
+
+def recorder():
+    return _recorder
+
+
+def stream(name, iterable, direction='out'):
+    """Count and time the records passing through an iterable. The direction
+    is 'in' for records a stage consumes and 'out' for those it produces.
+    """
+
+    if _recorder is None:
+        return iterable
+    return _recorder.stream(name, iterable, direction)
+
+
+def wrap(name, function, data):
+    """Apply a function that transforms one iterable into another, like
+    Matcher.filter_matches, recording its input and output as one stage.
+    """
+
+    return stream(name, function(stream(name, data, 'in')), 'out')
+
+
+def count(name, records, direction='out'):
+    if _recorder is not None:
+        stage = _recorder.stage(name)
+        setattr(stage, 'records_%s' % direction,
+                getattr(stage, 'records_%s' % direction) + records)
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Time a block of code as part of the given stage.
+    """
+
+    if _recorder is None:
+        yield
+        return
+
+    stage = _recorder.stage(name)
+    start = time.time()
+    try:
+        yield
+    finally:
+        stage.timed += time.time() - start
+        stage.peak_rss = peak_rss()
+
+
+def call(name, function):
+    """Wrap a function that handles one record at a time, like the save
+    function of a WritableDataFile, so that each call counts as one record
+    into the given stage.
+    """
+
+    if _recorder is None:
+        return function
+
+    def timed_call(*args, **kwargs):
+        with timed(name):
+            count(name, 1, 'in')
+            return function(*args, **kwargs)
+    return timed_call
+
+
+def measured(name):
+    """Decorate a method which takes an iterable of records as its first
+    argument and returns a list, recording both as the given stage.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def measured_method(self, data, *args, **kwargs):
+            if _recorder is None:
+                return method(self, data, *args, **kwargs)
+            with timed(name):
+                result = method(self, stream(name, data, 'in'), *args,
+                                **kwargs)
+            count(name, len(result))
+            return result
+        return measured_method
+    return decorator
@@ -0,0 +1,55 @@
+"""This module contains functions for computing the base level overlap between
+the exons of hits and features. All functions work on lists of 0-based, half
+open (start, stop) blocks which are sorted and do not overlap, this lets all
+comparisons be done in a single linear merge of the two lists.
+"""
+
+
+def merge(intervals):
+    """Sort the given (start, stop) intervals and merge any which overlap or
+    touch to produce a list of blocks.
+    """
+
+    merged = []
+    for start, stop in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if stop > merged[-1][1]:
+                merged[-1] = (merged[-1][0], stop)
+            continue
+        merged.append((start, stop))
+    return merged
+
+
+def hit_blocks(hit):
+    return merge((f.start, f.stop) for f in hit.fragments)
+
+
+def feature_blocks(feature):
+    return merge((f.start - 1, f.stop) for f in feature.fragments)
+
+
+def size(blocks):
+    return sum(stop - start for (start, stop) in blocks)
+
+
+def intersection(first, second):
+    """Compute the number of bases covered by both lists of blocks.
+    """
+
+    total = 0
+    index = 0
+    other = 0
+    while index < len(first) and other < len(second):
+        start = max(first[index][0], second[other][0])
+        stop = min(first[index][1], second[other][1])
+        if start < stop:
+            total += stop - start
+        if first[index][1] < second[other][1]:
+            index += 1
+        else:
+            other += 1
+    return total
+
+
+def introns(blocks):
+    return [(left[1], right[0]) for (left, right) in zip(blocks, blocks[1:])]
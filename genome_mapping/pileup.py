@@ -0,0 +1,110 @@
+"""This module contains the logic for a pile up analysis of hits. This finds
+the regions of a genome which are covered by many hits, for example where
+many similar sequences like rRNA's all align. The coverage is computed with a
+difference array over the sorted fragment boundaries, so the work is a sort
+and a few vectorized passes over the fragments of each chromosome.
+"""
+
+import collections as coll
+
+from genome_mapping import joins
+from genome_mapping import utils as ut
+from genome_mapping.data import Cluster
+
+np = ut.lazy('numpy')
+
+
+def coverage(starts, stops):
+    """Compute the depth of coverage of the given 0-based, half open
+    intervals. This returns a pair of arrays, positions and depth, such that
+    depth[i] is the coverage of [positions[i], positions[i + 1]).
+    """
+
+    positions, index = np.unique(np.concatenate([starts, stops]),
+                                 return_inverse=True)
+    signs = np.concatenate([np.ones(len(starts)), -np.ones(len(stops))])
+    delta = np.bincount(index, weights=signs, minlength=len(positions))
+    return positions, np.cumsum(delta).astype(np.int64)
+
+
+def regions(positions, depth, min_depth=1, max_gap=0):
+    """Merge the segments with at least min_depth coverage into regions.
+    Segments which are separated by at most max_gap bases are merged. This
+    returns the arrays of region starts, stops and maximum depth.
+    """
+
+    covered = depth[:-1] >= min_depth
+    starts = positions[:-1][covered]
+    stops = positions[1:][covered]
+    depth = depth[:-1][covered]
+    if not len(starts):
+        return starts, stops, depth
+
+    breaks = np.flatnonzero(starts[1:] - stops[:-1] > max_gap) + 1
+    first = np.concatenate([[0], breaks])
+    last = np.concatenate([breaks, [len(starts)]]) - 1
+    return starts[first], stops[last], np.maximum.reduceat(depth, first)
+
+
+def clusters(hits, min_depth=1, max_gap=0, stranded=False):
+    """Find the clusters of hits in the given hits.
+
+    Parameters
+    ----------
+    hits : iterable
+        The Hit objects to pile up.
+
+    min_depth : int
+        The minimum number of fragments that must cover a base for it to be
+        part of a cluster.
+
+    max_gap : int
+        Covered regions separated by at most this many bases are merged into
+        one cluster.
+
+    stranded : bool
+        If True hits on each strand are piled up separately.
+
+    Returns
+    -------
+    clusters : generator
+        A generator of the Cluster objects, ordered by chromosome, strand and
+        start.
+    """
+
+    strand = 'same' if stranded else 'both'
+    grouped = joins.partition(hits, strand=strand)
+    for key in sorted(grouped):
+        hits = grouped[key]
+        fragments = [(f.start, f.stop, index)
+                     for (index, hit) in enumerate(hits)
+                     for f in hit.fragments]
+        if not fragments:
+            continue
+
+        starts, stops, owners = (np.array(v) for v in zip(*fragments))
+        positions, depth = coverage(starts, stops)
+        found = regions(positions, depth, min_depth=min_depth,
+                        max_gap=max_gap)
+        cluster_starts, cluster_stops, cluster_depth = found
+
+        # Each fragment belongs to all clusters between the first one that
+        # ends after it starts and the last one that starts before it ends.
+        first = np.searchsorted(cluster_stops, starts, side='right')
+        last = np.searchsorted(cluster_starts, stops, side='left')
+        members = coll.defaultdict(set)
+        for owner, lower, upper in zip(owners, first, last):
+            for cluster in xrange(lower, upper):
+                members[cluster].add(owner)
+
+        for index in xrange(len(cluster_starts)):
+            found = [hits[i] for i in sorted(members[index])]
+            yield Cluster(
+                chromosome=key[0],
+                strand=key[1] if stranded else None,
+                start=int(cluster_starts[index]),
+                stop=int(cluster_stops[index]),
+                depth=int(cluster_depth[index]),
+                hits=len(found),
+                urs=sorted({h.urs for h in found}),
+            )
@@ -0,0 +1,270 @@
+"""This module contains an in process version of the pipeline in the
+Makefile. A Pipeline reads the hits from an alignment result file, selects
+them with a matcher, optionally compares them to known features and writes
+the results in some formats. The stages are chained as generators so nothing
+is pickled between them unless an intermediate file is requested.
+
+A pipeline is described by a spec like:
+
+    {
+        "input": {
+            "results": "data/{organism}/targets.psl",
+            "queries": "data/{organism}/targets.fasta",
+            "format": "blat-psl"
+        },
+        "select": "data/{organism}/select-spec.json",
+        "compare": {"known": "data/{organism}/known.gff3"},
+        "save": {"compared": "data/{organism}/targets-compared.pickle"},
+        "outputs": [
+            {"format": "gff3", "path": "data/{organism}/compared.gff3"},
+            {"format": "gff3", "path": "data/{organism}/missing.gff3",
+             "where": "type.pretty is missing"},
+            {"format": "summary", "path": "data/{organism}/summary.csv"}
+        ]
+    }
+
+Only input is required. The select entry may be the path to a select spec
+file or the spec itself. The save entry may have any of hits, selected and
+compared. All strings may contain {name} placeholders which are filled in
+from the given definitions. A spec file may contain a single pipeline or a
+list of them.
+
+When there are several outputs the results are read once and handed to a
+writer thread per output through a bounded queue, so the stages run once
+without the results ever being held in memory.
+"""
+
+import sys
+import json
+import Queue
+import cPickle
+import threading
+import itertools as it
+
+from genome_mapping import metrics
+from genome_mapping import mappers
+from genome_mapping import matchers
+from genome_mapping import formatters
+from genome_mapping import aggregates
+from genome_mapping import predicates
+from genome_mapping.intervals import Tree
+
+STAGES = ('hits', 'selected', 'compared')
+"""The stages which may be saved as intermediate files."""
+
+SUMMARY = 'summary'
+"""The output format name used for comparison summaries."""
+
+BATCH_SIZE = 1000
+"""The number of results passed to each writer thread at once."""
+
+QUEUE_SIZE = 4
+"""The number of batches which may wait for each writer thread."""
+
+
+def expand(value, definitions):
+    """Fill in all placeholders in the strings of the given JSON value.
+    """
+
+    if isinstance(value, basestring):
+        return value.format(**definitions)
+    if isinstance(value, list):
+        return [expand(v, definitions) for v in value]
+    if isinstance(value, dict):
+        return {k: expand(v, definitions) for (k, v) in value.iteritems()}
+    return value
+
+
+def load(handle, definitions={}):
+    """Load all pipelines from the given spec file.
+    """
+
+    spec = expand(json.load(handle), definitions)
+    if isinstance(spec, dict):
+        spec = [spec]
+    return [Pipeline(s) for s in spec]
+
+
+def saving(data, path):
+    """Pickle each entry to the given path as it passes through.
+    """
+
+    with open(path, 'wb') as out:
+        for entry in data:
+            cPickle.dump(entry, out)
+            yield entry
+
+
+class Channel(object):
+    """A bounded queue of batches that is read as one iterable of entries.
+    """
+
+    def __init__(self, size=QUEUE_SIZE):
+        self.queue = Queue.Queue(maxsize=size)
+        self.closed = False
+
+    def put(self, batch):
+        self.queue.put(batch)
+
+    def close(self):
+        self.queue.put(None)
+
+    def __iter__(self):
+        while not self.closed:
+            batch = self.queue.get()
+            if batch is None:
+                self.closed = True
+                return
+            for entry in batch:
+                yield entry
+
+    def drain(self):
+        for _ in self:
+            pass
+
+
+def broadcast(data, consumers, size=BATCH_SIZE):
+    """Pass all entries of data to each of the consumers, functions which
+    take an iterable, reading data only once. Each consumer runs in its own
+    thread and at most QUEUE_SIZE batches of size entries are waiting for
+    it. The first error of any consumer is raised once all are done.
+    """
+
+    errors = []
+
+    def consume(consumer, channel):
+        try:
+            consumer(iter(channel))
+        except Exception:
+            errors.append(sys.exc_info())
+        # Keep reading so a failed consumer never blocks the others.
+        channel.drain()
+
+    channels = [Channel() for _ in consumers]
+    threads = [threading.Thread(target=consume, args=pair)
+               for pair in zip(consumers, channels)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    data = iter(data)
+    try:
+        for batch in iter(lambda: list(it.islice(data, size)), []):
+            for channel in channels:
+                channel.put(batch)
+    finally:
+        for channel in channels:
+            channel.close()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        kind, error, traceback = errors[0]
+        raise kind, error, traceback
+
+
+class Pipeline(object):
+    def __init__(self, spec):
+        if 'input' not in spec:
+            raise ValueError("A pipeline must have an input")
+        unknown = set(spec.get('save', {})) - set(STAGES)
+        if unknown:
+            raise ValueError("Cannot save unknown stages %s" %
+                             ', '.join(sorted(unknown)))
+
+        self.spec = spec
+        self.outputs = spec.get('outputs', [])
+        for output in self.outputs:
+            if output['format'] not in formatters.known() and \
+                    output['format'] != SUMMARY:
+                raise ValueError("Unknown output format %s" %
+                                 output['format'])
+        # Build the matcher and predicates now so a bad spec fails before
+        # any work is done.
+        self.matcher = self.__matcher__()
+        self.predicates = [self.__predicate__(o) for o in self.outputs]
+
+    def __matcher__(self):
+        select = self.spec.get('select')
+        if select is None:
+            return None
+        if isinstance(select, basestring):
+            with open(select, 'rb') as raw:
+                select = json.load(raw)
+        return matchers.from_spec(select)
+
+    def __predicate__(self, output):
+        if 'where' not in output:
+            return None
+        return predicates.compile(output['where'])
+
+    def hits(self):
+        spec = self.spec['input']
+        format = spec.get('format') or mappers.infer_format(spec['results'])
+        return mappers.from_format(spec['results'], spec['queries'], format)
+
+    def stages(self):
+        """Chain all stages of the pipeline and return the generator of the
+        final results.
+        """
+
+        saves = self.spec.get('save', {})
+        data = self.hits()
+        if 'hits' in saves:
+            data = saving(data, saves['hits'])
+
+        if self.matcher:
+            data = metrics.wrap('filter', self.matcher.filter_matches, data)
+            if 'selected' in saves:
+                data = saving(data, saves['selected'])
+
+        compare = self.spec.get('compare')
+        if compare:
+            tree = Tree(compare['known'])
+            data = tree.compare_to_known(
+                data,
+                strand=compare.get('strand', 'both'),
+            )
+            if 'compared' in saves:
+                data = saving(data, saves['compared'])
+        return data
+
+    def write(self, data, output):
+        with open(output['path'], 'wb') as out:
+            if output['format'] == SUMMARY:
+                aggregate = aggregates.Aggregate(
+                    by=output.get('by', aggregates.DEFAULT_GROUPS),
+                    distributions=output.get('distributions', False),
+                )
+                aggregates.write(aggregate.update(data), out)
+            else:
+                formatters.format(data, output['format'], out)
+
+    def writer(self, output, predicate):
+        """Create a function which writes an iterable of results to the
+        given output.
+        """
+
+        def write(data):
+            if predicate:
+                data = predicate.filter(data)
+            self.write(data, output)
+        return write
+
+    def __call__(self):
+        data = self.stages()
+        if not self.outputs:
+            for _ in data:
+                pass
+            return
+
+        # Several outputs are written in a single pass over the results
+        # instead of rerunning the stages or keeping them in memory.
+        data = metrics.stream('serialize', data, 'in')
+        writers = [self.writer(o, p)
+                   for (o, p) in zip(self.outputs, self.predicates)]
+        with metrics.timed('serialize'):
+            if len(writers) == 1:
+                writers[0](data)
+            else:
+                broadcast(data, writers)
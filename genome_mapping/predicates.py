@@ -0,0 +1,288 @@
+"""This module contains a small expression language for selecting
+comparisons. An expression is parsed and checked once, then compiled into a
+Predicate which evaluates it over batches of comparisons. Each field used in
+the expression is extracted once per comparison into a column and all
+operators work on whole columns.
+
+Expressions look like:
+
+    type.pretty is missing
+    type.match is correct and overlap.jaccard >= 0.9
+    not (hit.urs == 'URS0000000001_4896' or shift.total > 10)
+
+Names are either dotted paths into a Comparision, like type.pretty, a word
+from the known result types, like missing or 5p_shift, or a literal number,
+quoted string, True, False or None.
+"""
+
+import re
+import operator as op
+import itertools as it
+
+import attr
+
+from genome_mapping import data as dat
+
+BATCH_SIZE = 1000
+"""The default number of comparisons evaluated at once."""
+
+ROOTS = {
+    'hit': dat.Hit,
+    'feature': dat.FeatureData,
+    'shift': dat.Shift,
+    'type': dat.ComparisionType,
+    'overlap': dat.Overlap,
+}
+"""The top level fields of a Comparision and the class of each."""
+
+WORDS = frozenset(it.chain(
+    dat.RESULT_TYPE,
+    it.chain.from_iterable(t.split('_') for t in dat.RESULT_TYPE),
+    ['5p_shift', '3p_shift', '5p_disjoint', '3p_disjoint', 'spliced',
+     'unspliced'],
+))
+"""Bare words which are treated as strings."""
+
+CONSTANTS = {'True': True, 'False': False, 'None': None}
+
+OPERATORS = {
+    'is': op.eq,
+    'is not': op.ne,
+    '==': op.eq,
+    '!=': op.ne,
+    '<': op.lt,
+    '<=': op.le,
+    '>': op.gt,
+    '>=': op.ge,
+}
+
+TOKENS = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+\.\d*|-?\d*\.\d+|-?\d+(?![\w.]))|
+        (?P<string>'[^']*'|"[^"]*")|
+        (?P<operator>==|!=|<=|>=|<|>)|
+        (?P<paren>[()])|
+        (?P<name>[\w.]+)
+    )""", re.VERBOSE)
+
+
+class InvalidExpression(ValueError):
+    pass
+
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKENS.match(text, position)
+        if not match:
+            raise InvalidExpression("Cannot parse '%s' at position %i" %
+                                    (text, position))
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+def accessor(path):
+    """Create a function to get the value of a dotted path from an object.
+    If any part of the path is None then the value is None.
+    """
+
+    names = path.split('.')
+
+    def getter(obj):
+        for name in names:
+            if obj is None:
+                return None
+            obj = getattr(obj, name)
+        return obj
+    return getter
+
+
+def field_class(klass, name):
+    """Get the class of the values of a field of an attrs class, from its
+    instance_of validator, or None if it has no such validator.
+    """
+
+    for field in attr.fields(klass):
+        if field.name == name:
+            validator = field.validator
+            while hasattr(validator, 'validator'):
+                validator = validator.validator
+            return getattr(validator, 'type', None)
+    return None
+
+
+def check_path(path):
+    """Check that every part of a dotted path names a field or property of
+    the class reached so far. Paths can only continue through fields which
+    hold another attrs class, since the type of other values, including
+    properties, is unknown.
+    """
+
+    names = path.split('.')
+    if names[0] not in ROOTS:
+        raise InvalidExpression("Unknown name '%s', must be one of %s or a "
+                                "known result type" %
+                                (names[0], ', '.join(sorted(ROOTS))))
+
+    klass = ROOTS[names[0]]
+    walked = names[0]
+    for name in names[1:]:
+        if klass is None:
+            raise InvalidExpression("'%s' has no fields, so '%s' is invalid"
+                                    % (walked, path))
+        fields = {f.name for f in attr.fields(klass)}
+        if name in fields:
+            found = field_class(klass, name)
+            klass = found if isinstance(found, type) and attr.has(found) \
+                else None
+        elif isinstance(getattr(klass, name, None), property):
+            klass = None
+        else:
+            raise InvalidExpression("%s has no field '%s'" %
+                                    (klass.__name__, name))
+        walked = '%s.%s' % (walked, name)
+
+
+class Parser(object):
+    """A recursive descent parser for the expression language. Each parse
+    method returns a function which takes a dict of columns and the number of
+    rows and returns the column of values for that part of the expression.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.index = 0
+        self.paths = set()
+
+    def peek(self):
+        if self.index < len(self.tokens):
+            return self.tokens[self.index]
+        return (None, None)
+
+    def advance(self):
+        token = self.peek()
+        self.index += 1
+        return token
+
+    def expect(self, kind, value):
+        if self.peek() != (kind, value):
+            raise InvalidExpression("Expected '%s' in '%s'" %
+                                    (value, self.text))
+        self.advance()
+
+    def parse(self):
+        if not self.tokens:
+            raise InvalidExpression("Empty expression")
+        node = self.disjunction()
+        if self.index != len(self.tokens):
+            raise InvalidExpression("Unexpected '%s' in '%s'" %
+                                    (self.peek()[1], self.text))
+        return node
+
+    def disjunction(self):
+        nodes = [self.conjunction()]
+        while self.peek() == ('name', 'or'):
+            self.advance()
+            nodes.append(self.conjunction())
+        if len(nodes) == 1:
+            return nodes[0]
+        return lambda cols, n: [any(v) for v in
+                                it.izip(*[f(cols, n) for f in nodes])]
+
+    def conjunction(self):
+        nodes = [self.negation()]
+        while self.peek() == ('name', 'and'):
+            self.advance()
+            nodes.append(self.negation())
+        if len(nodes) == 1:
+            return nodes[0]
+        return lambda cols, n: [all(v) for v in
+                                it.izip(*[f(cols, n) for f in nodes])]
+
+    def negation(self):
+        if self.peek() == ('name', 'not'):
+            self.advance()
+            node = self.negation()
+            return lambda cols, n: [not v for v in node(cols, n)]
+        return self.comparision()
+
+    def comparision(self):
+        left = self.operand()
+        kind, value = self.peek()
+        if kind == 'operator' or (kind, value) == ('name', 'is'):
+            self.advance()
+            if value == 'is' and self.peek() == ('name', 'not'):
+                self.advance()
+                value = 'is not'
+            right = self.operand()
+            compare = OPERATORS[value]
+            return lambda cols, n: map(compare, left(cols, n), right(cols, n))
+        return left
+
+    def operand(self):
+        kind, value = self.advance()
+        if kind == 'paren' and value == '(':
+            node = self.disjunction()
+            self.expect('paren', ')')
+            return node
+        if kind == 'number':
+            return self.literal(float(value) if '.' in value else int(value))
+        if kind == 'string':
+            return self.literal(value[1:-1])
+        if kind == 'name':
+            if value in CONSTANTS:
+                return self.literal(CONSTANTS[value])
+            if value in WORDS:
+                return self.literal(value)
+            check_path(value)
+            self.paths.add(value)
+            return lambda cols, n: cols[value]
+        if kind is None:
+            raise InvalidExpression("Unexpected end of '%s'" % self.text)
+        raise InvalidExpression("Unexpected '%s' in '%s'" % (value, self.text))
+
+    def literal(self, value):
+        return lambda cols, n: [value] * n
+
+
+class Predicate(object):
+    def __init__(self, text):
+        parser = Parser(text)
+        self.text = text
+        self.node = parser.parse()
+        self.accessors = {p: accessor(p) for p in parser.paths}
+
+    def evaluate(self, batch):
+        """Evaluate the predicate on a list of comparisons, returning a list
+        of booleans.
+        """
+
+        columns = {p: [f(c) for c in batch]
+                   for (p, f) in self.accessors.iteritems()}
+        return [bool(v) for v in self.node(columns, len(batch))]
+
+    def filter(self, comparisons, size=BATCH_SIZE):
+        """Select the comparisons that match the predicate. The comparisons
+        are read and evaluated in batches of the given size.
+        """
+
+        comparisons = iter(comparisons)
+        while True:
+            batch = list(it.islice(comparisons, size))
+            if not batch:
+                break
+            for comparision, valid in it.izip(batch, self.evaluate(batch)):
+                if valid:
+                    yield comparision
+
+    def __call__(self, comparision):
+        return self.evaluate([comparision])[0]
+
+
+def compile(text):
+    return Predicate(text)
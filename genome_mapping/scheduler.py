@@ -0,0 +1,343 @@
+"""This module contains a small scheduler for running the per organism stages
+of a release at the same time. Each stage declares the number of CPU's and
+the memory it needs and stages are only started when there are enough free
+resources for them. Stages which other stages depend on, through their
+inputs and outputs, are started as soon as possible, and the ready stage with
+the longest chain of work after it goes first. This way the heaviest
+organisms, like a zebrafish BLAT search, start early while the small ones
+fill in around them.
+
+A stage is skipped if all of its outputs exist and neither its command nor
+the size and modification time of any of its inputs changed since it last
+ran. This is recorded in a JSON state file.
+
+A release is described by a spec like:
+
+    {
+        "organisms": ["pombe", "zebrafish"],
+        "stages": [
+            {
+                "name": "targets-psl",
+                "command": ["bin/blat", "data/{organism}/genome.fasta",
+                            "data/{organism}/targets.fasta", "{cpus}",
+                            "data/{organism}/targets.psl", "{cpus}"],
+                "inputs": ["data/{organism}/genome.fasta",
+                           "data/{organism}/targets.fasta"],
+                "outputs": ["data/{organism}/targets.psl"],
+                "cpus": 1,
+                "memory": 1024,
+                "weight": 10
+            }
+        ],
+        "shared": [
+            {
+                "name": "md5",
+                "command": ["make", "data/md5.tsv"],
+                "outputs": ["data/md5.tsv"]
+            }
+        ],
+        "overrides": {
+            "zebrafish": {"targets-psl": {"cpus": 4, "weight": 100}}
+        }
+    }
+
+All strings in a stage may use {organism}, and commands may also use {cpus}
+and {memory}. The cpus of a stage are only reserved, not enforced, so a
+command should be told to use no more than {cpus}, as bin/blat is above by
+splitting the targets into that many parts and searching that many at once.
+
+Shared stages are run once for all organisms, with the organism shared, for
+files that several organisms need, like data/md5.tsv. Organism stages which
+list their outputs as inputs wait for them, so they are never built by two
+stages at once.
+"""
+
+import os
+import json
+import time
+import hashlib
+import subprocess as sp
+import multiprocessing as mp
+
+import attr
+
+from genome_mapping.data import IS_INT
+from genome_mapping.data import IS_STR
+from genome_mapping.data import IS_NUM
+from genome_mapping.data import IS_TUPLE
+
+POLL_INTERVAL = 0.5
+"""The number of seconds between checks for finished stages."""
+
+STATE_FILE = 'data/release-state.json'
+"""The default file to record the state of stages in."""
+
+SHARED = 'shared'
+"""The organism of stages run once for all organisms."""
+
+
+class StageFailed(Exception):
+    pass
+
+
+@attr.s(frozen=True, slots=True)
+class Stage(object):
+    organism = attr.ib(validator=IS_STR)
+    name = attr.ib(validator=IS_STR)
+    command = attr.ib(validator=IS_TUPLE)
+    inputs = attr.ib(validator=IS_TUPLE)
+    outputs = attr.ib(validator=IS_TUPLE)
+    cpus = attr.ib(validator=IS_INT)
+    memory = attr.ib(validator=IS_INT)
+    weight = attr.ib(validator=IS_NUM)
+
+    @classmethod
+    def build(cls, organism, spec):
+        def fill(value, **extra):
+            return value.format(organism=organism, **extra)
+
+        cpus = int(spec.get('cpus', 1))
+        memory = int(spec.get('memory', 0))
+        return cls(
+            organism=organism,
+            name=spec['name'],
+            command=tuple(fill(c, cpus=cpus, memory=memory)
+                          for c in spec['command']),
+            inputs=tuple(fill(i) for i in spec.get('inputs', [])),
+            outputs=tuple(fill(o) for o in spec.get('outputs', [])),
+            cpus=cpus,
+            memory=memory,
+            weight=spec.get('weight', 1),
+        )
+
+    @property
+    def key(self):
+        return '%s/%s' % (self.organism, self.name)
+
+    def signature(self):
+        """Compute a hash of the command and the size and modification time of
+        all inputs.
+        """
+
+        digest = hashlib.md5(json.dumps(self.command))
+        for filename in self.inputs:
+            info = os.stat(filename)
+            digest.update('%s:%i:%f' % (filename, info.st_size, info.st_mtime))
+        return digest.hexdigest()
+
+
+def stages_from_spec(spec, organisms=None):
+    organisms = organisms or spec['organisms']
+    overrides = spec.get('overrides', {})
+    stages = [Stage.build(SHARED, s) for s in spec.get('shared', [])]
+    for organism in organisms:
+        for stage_spec in spec['stages']:
+            stage_spec = dict(stage_spec)
+            stage_spec.update(
+                overrides.get(organism, {}).get(stage_spec['name'], {}))
+            stages.append(Stage.build(organism, stage_spec))
+    return stages
+
+
+def load(handle, organisms=None):
+    return stages_from_spec(json.load(handle), organisms=organisms)
+
+
+def dependencies(stages):
+    """Compute the stages each stage depends on. A stage depends on any stage
+    which produces one of its inputs.
+    """
+
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError("Both %s and %s produce %s" %
+                                 (producers[output].key, stage.key, output))
+            producers[output] = stage
+    return {s: {producers[i] for i in s.inputs if i in producers}
+            for s in stages}
+
+
+def priorities(stages, depends):
+    """Compute the priority of each stage, which is the largest total weight
+    of any chain of stages starting with it.
+    """
+
+    children = {s: set() for s in stages}
+    for stage, parents in depends.iteritems():
+        for parent in parents:
+            children[parent].add(stage)
+
+    computed = {}
+
+    def priority(stage, visiting=()):
+        if stage in visiting:
+            raise ValueError("Cycle in stages at %s" % stage.key)
+        if stage not in computed:
+            after = [priority(c, visiting + (stage,)) for c in children[stage]]
+            computed[stage] = stage.weight + max(after or [0])
+        return computed[stage]
+
+    return {s: priority(s) for s in stages}
+
+
+def total_memory():
+    pages = os.sysconf('SC_PHYS_PAGES')
+    return pages * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+
+
+class Scheduler(object):
+    """Run stages concurrently within some resource limits.
+
+    Parameters
+    ----------
+    stages : list
+        The Stage objects to run.
+
+    cpus : int
+        The number of CPU's that may be used at once, defaults to all.
+
+    memory : int
+        The memory, in MB, that may be used at once, defaults to all.
+
+    state_file : str
+        The path to the file recording the state of finished stages.
+    """
+
+    def __init__(self, stages, cpus=None, memory=None, state_file=STATE_FILE):
+        self.stages = list(stages)
+        self.cpus = cpus or mp.cpu_count()
+        self.memory = memory or total_memory()
+        self.state_file = state_file
+        self.depends = dependencies(self.stages)
+        self.priorities = priorities(self.stages, self.depends)
+        self.state = {}
+        if os.path.exists(state_file):
+            with open(state_file, 'rb') as raw:
+                self.state = json.load(raw)
+
+    def save_state(self):
+        with open(self.state_file, 'wb') as out:
+            json.dump(self.state, out, indent=2, sort_keys=True)
+
+    def is_current(self, stage):
+        if not all(os.path.exists(o) for o in stage.outputs):
+            return False
+        return self.state.get(stage.key) == stage.signature()
+
+    def demands(self, stage):
+        """The cpus and memory a stage will use. A stage which needs more than
+        is available is clamped to the limits so it runs alone instead of
+        never running.
+        """
+
+        return min(stage.cpus, self.cpus), min(stage.memory, self.memory)
+
+    def ordered(self):
+        """Get the stages sorted by the order they would be considered in.
+        """
+
+        key = lambda s: (-self.priorities[s], s.organism, s.name)
+        return sorted(self.stages, key=key)
+
+    def plan(self):
+        """Determine which stages would be run or skipped. A stage is only
+        skipped if everything it depends on is also skipped.
+        """
+
+        rerun = set()
+        plan = []
+        for stage in self.__topological__():
+            if self.depends[stage] & rerun or not self.__inputs_exist__(stage) \
+                    or not self.is_current(stage):
+                rerun.add(stage)
+            plan.append((stage, stage not in rerun))
+        return plan
+
+    def __inputs_exist__(self, stage):
+        return all(os.path.exists(i) for i in stage.inputs)
+
+    def __topological__(self):
+        done = set()
+        ordered = []
+        pending = self.ordered()
+        while pending:
+            ready = [s for s in pending if self.depends[s] <= done]
+            if not ready:
+                raise ValueError("Cycle in stages")
+            ordered.extend(ready)
+            done.update(ready)
+            pending = [s for s in pending if s not in done]
+        return ordered
+
+    def start(self, stage):
+        return sp.Popen(list(stage.command))
+
+    def run(self, log=None):
+        """Run all stages, returning the list of stages which were run and the
+        list which were skipped.
+        """
+
+        log = log or (lambda message: None)
+        pending = self.ordered()
+        running = {}
+        done = set()
+        ran = []
+        skipped = []
+        failure = None
+        free_cpus = self.cpus
+        free_memory = self.memory
+
+        while pending or running:
+            if failure is None:
+                for stage in list(pending):
+                    if not self.depends[stage] <= done:
+                        continue
+                    missing = [i for i in stage.inputs
+                               if not os.path.exists(i)]
+                    if missing:
+                        failure = "Stage %s is missing inputs %s" % \
+                            (stage.key, ', '.join(missing))
+                        log(failure)
+                        break
+                    if stage.outputs and self.is_current(stage):
+                        pending.remove(stage)
+                        done.add(stage)
+                        skipped.append(stage)
+                        log("Skipping %s, it is up to date" % stage.key)
+                        continue
+                    cpus, memory = self.demands(stage)
+                    if cpus > free_cpus or memory > free_memory:
+                        continue
+                    log("Starting %s" % stage.key)
+                    pending.remove(stage)
+                    running[stage] = self.start(stage)
+                    free_cpus -= cpus
+                    free_memory -= memory
+
+            if failure is not None and not running:
+                break
+
+            time.sleep(POLL_INTERVAL if running else 0)
+            for stage, process in running.items():
+                if process.poll() is None:
+                    continue
+                del running[stage]
+                cpus, memory = self.demands(stage)
+                free_cpus += cpus
+                free_memory += memory
+                if process.returncode != 0:
+                    log("Stage %s failed with %i" %
+                        (stage.key, process.returncode))
+                    failure = failure or "Stage %s failed" % stage.key
+                    continue
+                log("Finished %s" % stage.key)
+                done.add(stage)
+                ran.append(stage)
+                self.state[stage.key] = stage.signature()
+                self.save_state()
+
+        if failure is not None:
+            raise StageFailed(failure)
+        return ran, skipped
@@ -0,0 +1,490 @@
+"""This module contains tools for working with large FASTA files directly as
+bytes, without building a SeqRecord for each sequence. Files are memory
+mapped and split at record boundaries into ranges, which can be scanned
+independently, so work on a file can be spread over several processes.
+
+A record is read like Biopython does: the id is the first word of the
+header line and the sequence is the following lines joined, with trailing
+whitespace stripped from each line and any spaces or carriage returns left
+removed. Other whitespace within a line, like a tab, is kept.
+
+An IdIndex is a file next to a FASTA file, named like it with .ids added,
+of the id and byte range of every record sorted by id. It records the size
+and modification time of the FASTA file it was built from and is rebuilt
+whenever they change. Looking up ids is a binary search of the memory mapped
+index, so extracting a few records from a large file never reads all of it.
+It also lets records with the same id be merged while holding only one id's
+records at a time.
+
+Statistics of a file, like its N50 and GC content, are computed with numpy
+over each range of the raw bytes, so no Python code runs per base.
+"""
+
+import os
+import mmap
+import heapq
+import hashlib
+import tempfile
+import contextlib
+import operator as op
+import itertools as it
+import multiprocessing as mp
+
+from genome_mapping import grouping
+from genome_mapping import utils as ut
+
+np = ut.lazy('numpy')
+
+CHUNK_BYTES = 1 << 24
+"""The size of the ranges a file is split into for scanning in parallel."""
+
+WHITESPACE = ' \t\r\n\x0b\x0c'
+"""The characters Python, and so Biopython, strips from the end of a line."""
+
+STRIPPED = ' \r'
+"""The characters Biopython removes from anywhere in a sequence."""
+
+STATS_BYTES = 1 << 22
+"""The size of the ranges statistics are computed over at once, numpy needs
+about 20 bytes of memory for each byte of a range."""
+
+LENGTH_BINS = (0, 25, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 100000)
+"""The lower edge of each bin of the length histogram."""
+
+GC, AT, AMBIGUOUS = 1, 2, 3
+"""The classes of sequence characters, whitespace is 0."""
+
+
+def mapped(filename):
+    """Memory map a file for reading. Empty files cannot be mapped, so an
+    empty string, which supports the same searching, is used for them.
+    """
+
+    with open(filename, 'rb') as raw:
+        if not os.fstat(raw.fileno()).st_size:
+            return ''
+        return mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def boundary(buffer, position):
+    """Find the start of the first record at or after position.
+    """
+
+    if position <= 0 and buffer[:1] == '>':
+        return 0
+    start = buffer.find('\n>', max(position - 1, 0))
+    return len(buffer) if start == -1 else start + 1
+
+
+def split(buffer, size=CHUNK_BYTES):
+    """Split a buffer into (start, stop) ranges of about size bytes, each of
+    which starts at a record.
+    """
+
+    starts = []
+    position = 0
+    while position < len(buffer):
+        start = boundary(buffer, position)
+        if starts and start == starts[-1]:
+            break
+        starts.append(start)
+        position = start + size
+    starts.append(len(buffer))
+    return [(a, b) for (a, b) in zip(starts, starts[1:]) if a < b]
+
+
+def spans(buffer, start=0, stop=None):
+    """Yield the (start, header end, stop) offsets of each record starting in
+    a range of the buffer.
+    """
+
+    if stop is None:
+        stop = len(buffer)
+    position = boundary(buffer, start)
+    while position < stop:
+        line_end = buffer.find('\n', position)
+        if line_end == -1:
+            line_end = len(buffer)
+        following = buffer.find('\n>', line_end)
+        following = len(buffer) if following == -1 else following + 1
+        yield position, line_end, following
+        position = following
+
+
+def record_id(header):
+    return header.split(None, 1)[0] if header else ''
+
+
+def header_at(buffer, position):
+    line_end = buffer.find('\n', position)
+    if line_end == -1:
+        line_end = len(buffer)
+    return buffer[position + 1:line_end].rstrip()
+
+
+def sequence_of(text):
+    """Join the lines of the sequence of a record like Biopython does. Most
+    sequences have no whitespace but newlines, which translate detects
+    quickly.
+    """
+
+    joined = text.translate(None, '\n')
+    if len(joined.translate(None, WHITESPACE)) == len(joined):
+        return joined
+    lines = ''.join(line.rstrip() for line in text.split('\n'))
+    return lines.translate(None, STRIPPED)
+
+
+def records(buffer, start=0, stop=None):
+    """Yield the (id, header, sequence) of each record starting in a range of
+    the buffer.
+    """
+
+    for (position, line_end, following) in spans(buffer, start, stop):
+        header = buffer[position + 1:line_end].rstrip()
+        sequence = sequence_of(buffer[line_end:following])
+        yield record_id(header), header, sequence
+
+
+def md5_range(arguments):
+    """Hash the sequences in the (filename, start, stop) range of a file.
+    """
+
+    filename, start, stop = arguments
+    buffer = mapped(filename)
+    return [(i, hashlib.md5(s).hexdigest())
+            for (i, _, s) in records(buffer, start, stop)]
+
+
+def md5s(filename, processes=None, size=CHUNK_BYTES):
+    """Yield the (id, md5) of the sequence of each record in a FASTA file,
+    in file order. The file is split into ranges which are hashed in
+    parallel.
+
+    Parameters
+    ----------
+    filename : str
+        The FASTA file to hash.
+
+    processes : int
+        The number of processes to use, defaults to the number of CPU's.
+
+    size : int
+        The approximate number of bytes in each range.
+    """
+
+    ranges = [(filename, a, b) for (a, b) in split(mapped(filename), size)]
+    processes = min(processes or mp.cpu_count(), len(ranges))
+    if processes <= 1:
+        for arguments in ranges:
+            for entry in md5_range(arguments):
+                yield entry
+        return
+
+    pool = mp.Pool(processes)
+    try:
+        for entries in pool.imap(md5_range, ranges):
+            for entry in entries:
+                yield entry
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+@contextlib.contextmanager
+def replacing(path):
+    """Write to a temporary file in the same directory as path, which
+    replaces path only once it is complete, so an interrupted write never
+    leaves a partial file behind.
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    out = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+    try:
+        with out:
+            yield out
+        os.rename(out.name, path)
+    finally:
+        if os.path.exists(out.name):
+            os.remove(out.name)
+
+
+def describe(filename):
+    info = os.stat(filename)
+    return '#%i\t%r\n' % (info.st_size, info.st_mtime)
+
+
+class IdIndex(object):
+    """A persistent index of the byte range of each record in a FASTA file
+    by id.
+
+    Parameters
+    ----------
+    filename : str
+        The FASTA file to index, the index is built if it is missing or was
+        built from a different version of the file.
+
+    buffer_size : int
+        The number of ids to sort in memory when building the index.
+    """
+
+    def __init__(self, filename, buffer_size=grouping.BUFFER_SIZE):
+        self.filename = filename
+        self.path = filename + '.ids'
+        if not self.is_current():
+            self.build(buffer_size=buffer_size)
+        self.buffer = mapped(self.path)
+        self.first = self.buffer.find('\n') + 1
+
+    def is_current(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'rb') as raw:
+            return raw.readline() == describe(self.filename)
+
+    def entries(self):
+        buffer = mapped(self.filename)
+        for (start, line_end, stop) in spans(buffer):
+            yield record_id(buffer[start + 1:line_end]), start, stop
+
+    def build(self, buffer_size=grouping.BUFFER_SIZE):
+        signature = describe(self.filename)
+        runs = grouping.sorted_runs(self.entries(), op.itemgetter(0),
+                                    buffer_size=buffer_size)
+        with replacing(self.path) as out:
+            out.write(signature)
+            for (_, _, entry) in heapq.merge(*runs):
+                out.write('%s\t%i\t%i\n' % entry)
+
+    def _search(self, key):
+        """Find the offset of the first line of the index with an id that is
+        not less than key.
+        """
+
+        buffer = self.buffer
+        low = self.first
+        high = len(buffer)
+        while low < high:
+            middle = (low + high) // 2
+            start = buffer.rfind('\n', low, middle)
+            start = low if start == -1 else start + 1
+            end = buffer.find('\n', start)
+            if buffer[start:buffer.find('\t', start)] < key:
+                low = end + 1
+            else:
+                high = start
+        return low
+
+    def ranges(self, key):
+        """Get the (start, stop) byte ranges of all records with the given
+        id.
+        """
+
+        found = []
+        position = self._search(key)
+        while position < len(self.buffer):
+            end = self.buffer.find('\n', position)
+            name, start, stop = self.buffer[position:end].split('\t')
+            if name != key:
+                break
+            found.append((int(start), int(stop)))
+            position = end + 1
+        return found
+
+    def groups(self):
+        """Yield each id in the index with the starts of its records, in
+        file order.
+        """
+
+        lines = it.imap(lambda l: l.split('\t'), self.lines())
+        for (name, entries) in it.groupby(lines, op.itemgetter(0)):
+            yield name, [int(e[1]) for e in entries]
+
+    def lines(self):
+        position = self.first
+        while position < len(self.buffer):
+            end = self.buffer.find('\n', position)
+            yield self.buffer[position:end]
+            position = end + 1
+
+    def extract(self, ids, handle):
+        """Copy the records with any of the given ids to handle, in the
+        order they are in the FASTA file.
+        """
+
+        ranges = sorted(r for i in set(ids) for r in self.ranges(i))
+        buffer = mapped(self.filename)
+        for (start, stop) in ranges:
+            handle.write(buffer[start:stop])
+            if buffer[stop - 1:stop] != '\n':
+                handle.write('\n')
+
+
+def merged(filename, buffer_size=grouping.BUFFER_SIZE):
+    """Merge all records with the same id into one, using the IdIndex of the
+    file so memory use does not grow with the size of the file. Each merged
+    record has the sequence of the first record with its id and its header,
+    with the header of each later record, less the id, appended after a
+    comma.
+
+    Yields
+    ------
+    record : tuple
+        The (id, header, sequence) of each merged record, in the order each
+        id first appears.
+    """
+
+    index = IdIndex(filename, buffer_size=buffer_size)
+
+    # Only ids with several records need any work, each of their records
+    # gets an entry saying which others to merge into it or that it is
+    # skipped. These are sorted by position to be read along with the file.
+    def plans():
+        for (_, starts) in index.groups():
+            if len(starts) > 1:
+                yield starts[0], starts[1:]
+                for other in starts[1:]:
+                    yield other, None
+
+    runs = grouping.sorted_runs(plans(), op.itemgetter(0),
+                                buffer_size=buffer_size)
+    plan = heapq.merge(*runs)
+    following = next(plan, None)
+
+    buffer = mapped(filename)
+    for (start, line_end, stop) in spans(buffer):
+        header = buffer[start + 1:line_end].rstrip()
+        name = record_id(header)
+        others = ()
+        if following and following[0] == start:
+            others = following[2][1]
+            following = next(plan, None)
+            if others is None:
+                continue
+        parts = [header]
+        parts.extend(header_at(buffer, o).replace(name, '') for o in others)
+        sequence = sequence_of(buffer[line_end:stop])
+        yield name, ','.join(parts), sequence
+
+
+def character_classes():
+    """Build the table of the class of each character. Only newlines and
+    the characters Biopython removes anywhere are whitespace, any other
+    whitespace, even at the end of a line, is counted as ambiguous.
+    """
+
+    table = np.empty(256, dtype=np.uint8)
+    table.fill(AMBIGUOUS)
+    classes = [('\n' + STRIPPED, 0), ('GCgc', GC), ('ATUatu', AT)]
+    for characters, value in classes:
+        for character in characters:
+            table[ord(character)] = value
+    return table
+
+
+def range_stats(buffer, start, stop, table):
+    """Compute the length of each record, and the number of characters of
+    each class in all of them, in a range of a buffer which starts at a
+    record or at the start of the file.
+    """
+
+    data = np.frombuffer(buffer, dtype=np.uint8, count=stop - start,
+                         offset=start)
+    size = len(data)
+    follows_newline = np.empty(size, dtype=bool)
+    follows_newline[0] = True
+    np.equal(data[:-1], ord('\n'), out=follows_newline[1:])
+    starts = np.flatnonzero((data == ord('>')) & follows_newline)
+
+    newlines = np.flatnonzero(data == ord('\n'))
+    ends = np.append(newlines, size)[np.searchsorted(newlines, starts)]
+    following = np.append(starts[1:], size)
+
+    # The sequence of a record is everything between the end of its header
+    # and the start of the next one, less whitespace.
+    codes = table[data]
+    counted = np.concatenate(([0], np.cumsum(codes != 0, dtype=np.int64)))
+    lengths = counted[following] - counted[ends]
+
+    delta = np.zeros(size + 1, dtype=np.int8)
+    delta[ends] += 1
+    delta[following] -= 1
+    in_sequence = np.cumsum(delta[:-1], dtype=np.int8).astype(bool)
+    composition = np.bincount(codes[in_sequence], minlength=AMBIGUOUS + 1)
+    return lengths, composition
+
+
+def n50(lengths):
+    """The length such that records at least this long hold half of all
+    residues.
+    """
+
+    if not len(lengths):
+        return 0
+    ordered = np.sort(lengths)[::-1]
+    covered = np.cumsum(ordered)
+    return int(ordered[np.searchsorted(covered, covered[-1] / 2.0)])
+
+
+def stats(filename, short=25, bins=LENGTH_BINS, size=STATS_BYTES):
+    """Compute summary statistics of a FASTA file in one pass.
+
+    Parameters
+    ----------
+    filename : str
+        The FASTA file.
+
+    short : int
+        Records of at most this length are counted as too_short, this should
+        be the shortest sequence a Mapper will search.
+
+    bins : tuple
+        The lower edge of each bin of the length histogram.
+
+    size : int
+        The approximate number of bytes to process at once.
+
+    Returns
+    -------
+    stats : dict
+        The number of records, their total, minimum, maximum, mean and N50
+        lengths, a histogram of lengths, the GC content of the unambiguous
+        residues, the number and fraction of ambiguous residues and the
+        number of records which are too short.
+    """
+
+    buffer = mapped(filename)
+    table = character_classes()
+    lengths = []
+    composition = np.zeros(AMBIGUOUS + 1, dtype=np.int64)
+    for (start, stop) in split(buffer, size):
+        found, counts = range_stats(buffer, start, stop, table)
+        lengths.append(found.astype(np.uint32))
+        composition += counts
+
+    lengths = np.concatenate(lengths) if lengths else np.zeros(0, np.uint32)
+    total = int(lengths.sum(dtype=np.int64))
+    edges = np.array(bins)
+    counts = np.bincount(np.searchsorted(edges, lengths, side='right') - 1,
+                         minlength=len(edges))
+    upper = list(bins[1:]) + [None]
+    gc = int(composition[GC])
+    unambiguous = gc + int(composition[AT])
+    ambiguous = int(composition[AMBIGUOUS])
+
+    return {
+        'records': len(lengths),
+        'total_length': total,
+        'min_length': int(lengths.min()) if len(lengths) else None,
+        'max_length': int(lengths.max()) if len(lengths) else None,
+        'mean_length': float(total) / len(lengths) if len(lengths) else None,
+        'n50': n50(lengths),
+        'histogram': [{'min': low, 'max': high, 'records': int(count)}
+                      for (low, high, count) in zip(bins, upper, counts)],
+        'gc': float(gc) / unambiguous if unambiguous else None,
+        'ambiguous': ambiguous,
+        'ambiguous_fraction': float(ambiguous) / total if total else None,
+        'too_short': int((lengths <= short).sum()),
+        'short_length': short,
+    }
@@ -1,4 +1,5 @@
 import inspect
+import importlib
 
 import attr
 
@@ -23,7 +24,42 @@ def get_child(module, parent, name, ignore=set()):
     return get_children(module, parent, set([name]))[0]
 
 
+class LazyModule(object):
+    """A stand in for a module which is only imported when one of its
+    attributes is first used. This keeps heavy dependencies, like BioPython,
+    out of the startup of commands which never use them.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+def lazy(name):
+    return LazyModule(name)
+
+
+_children = {}
+
+
 def children_of(module, parent, ignore=set()):
+    """Find all subclasses of parent in the given module. The result is
+    computed once per module and parent, since the classes in a module do not
+    change.
+    """
+
+    key = (module.__name__, parent, frozenset(ignore or set()))
+    if key not in _children:
+        _children[key] = find_children(module, parent, ignore=ignore)
+    return set(_children[key])
+
+
+def find_children(module, parent, ignore=set()):
     ignore = ignore or set()
 
     def is_child(member):
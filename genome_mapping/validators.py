@@ -1,9 +1,219 @@
 """This module contains useful classes for detecting if matches of some
 RNA sequences are correct. See Validator for details.
+
+Searching a genome is by far the slowest step, so when comparing several
+ways of selecting hits the search is done once and the hits are reused. A
+Sweep evaluates a grid of matcher specs against one set of hits and one Tree
+of known locations, in parallel, and produces a Score for each spec. A grid
+is a matcher spec, or list of them, where any definition may be a list of
+values to try, like:
+
+    {
+        "matcher": "best-match",
+        "definitions": {"min": [95, 98, 99, 100], "completeness": [90, 100]}
+    }
+
+which is expanded into one spec for each combination of values.
 """
 
+import csv
+import cPickle
+import itertools as it
+import multiprocessing as mp
+
+import attr
+
+from genome_mapping import matchers
+from genome_mapping.data import IS_INT
+from genome_mapping.data import IS_STR
+from genome_mapping.data import IS_DICT
+from genome_mapping.data import RESULT_TYPE
 from genome_mapping.intervals import Tree
 
+_sweep = None
+"""The Sweep being run, which worker processes inherit when forked."""
+
+
+def expand_grid(grid):
+    """Expand a grid into the list of all matcher specs it describes.
+    """
+
+    if isinstance(grid, list):
+        return list(it.chain.from_iterable(expand_grid(g) for g in grid))
+
+    definitions = grid.get('definitions', {})
+    names = sorted(definitions)
+    values = []
+    for name in names:
+        value = definitions[name]
+        values.append(value if isinstance(value, list) else [value])
+
+    specs = []
+    for combination in it.product(*values):
+        spec = dict(grid)
+        spec['definitions'] = dict(zip(names, combination))
+        specs.append(spec)
+    return specs
+
+
+def spec_name(spec):
+    definitions = spec.get('definitions', {})
+    parts = ['%s=%s' % (k, definitions[k]) for k in sorted(definitions)]
+    return ' '.join([spec['matcher']] + parts)
+
+
+def load_hits(filename):
+    """Load all hits from a file of pickled hits, like the output of gm find.
+    """
+
+    hits = []
+    with open(filename, 'rb') as raw:
+        try:
+            while True:
+                hits.append(cPickle.load(raw))
+        except EOFError:
+            return hits
+
+
+@attr.s(frozen=True, slots=True)
+class Score(object):
+    """A summary of how well a matcher reproduces the known locations.
+    A selected hit is correct if it overlaps a known location of the same
+    sequence and exact if it also has the same endpoints. Selected hits on
+    chromosomes without any known location are never compared, but still
+    count as selected, so they lower the precision.
+    """
+
+    name = attr.ib(validator=IS_STR)
+    spec = attr.ib(validator=IS_DICT, hash=False)
+    selected = attr.ib(validator=IS_INT)
+    correct = attr.ib(validator=IS_INT)
+    exact = attr.ib(validator=IS_INT)
+    known = attr.ib(validator=IS_INT)
+    found = attr.ib(validator=IS_INT)
+    results = attr.ib(validator=IS_DICT, hash=False)
+
+    @classmethod
+    def build(cls, name, spec, selected, comparisons, known):
+        correct = set()
+        exact = set()
+        found = set()
+        results = {r: 0 for r in RESULT_TYPE}
+        for comparision in comparisons:
+            results[comparision.type.result] += 1
+            if not comparision.hit:
+                continue
+            if comparision.type.match == 'correct':
+                correct.add(id(comparision.hit))
+                found.add(comparision.feature)
+                if comparision.type.location == 'exact':
+                    exact.add(id(comparision.hit))
+
+        return cls(
+            name=name,
+            spec=spec,
+            selected=selected,
+            correct=len(correct),
+            exact=len(exact),
+            known=known,
+            found=len(found),
+            results=results,
+        )
+
+    @property
+    def precision(self):
+        if not self.selected:
+            return None
+        return float(self.correct) / self.selected
+
+    @property
+    def exact_precision(self):
+        if not self.selected:
+            return None
+        return float(self.exact) / self.selected
+
+    @property
+    def recall(self):
+        if not self.known:
+            return None
+        return float(self.found) / self.known
+
+
+def evaluate(tree, hits, spec):
+    """Select the hits with the matcher of the given spec and score them
+    against the known locations in the tree.
+    """
+
+    matcher = matchers.from_spec(spec)
+    selected = list(matcher.filter_matches(hits))
+    comparisons = tree.compare_to_known(selected)
+    return Score.build(spec_name(spec), spec, len(selected), comparisons,
+                       len(tree.features))
+
+
+def evaluate_shared(spec):
+    return evaluate(_sweep.tree, _sweep.hits, spec)
+
+
+class Sweep(object):
+    """Evaluate many matcher specs on the same hits and known locations.
+
+    Parameters
+    ----------
+    tree : Tree
+        The known locations.
+
+    hits : list
+        The hits to select from, these must be sorted by urs for matchers
+        like best-match, as the output of gm find is.
+
+    processes : int
+        The number of processes to evaluate specs in, defaults to the number
+        of CPU's. The tree and hits are shared with the processes by forking,
+        so they are never copied.
+    """
+
+    def __init__(self, tree, hits, processes=None):
+        self.tree = tree
+        self.hits = hits
+        self.processes = processes or mp.cpu_count()
+
+    def __call__(self, specs):
+        global _sweep
+
+        for spec in specs:
+            if spec.get('matcher') not in matchers.known():
+                raise ValueError("Unknown Matcher %s" % spec.get('matcher'))
+
+        if self.processes == 1 or len(specs) == 1:
+            return [evaluate(self.tree, self.hits, s) for s in specs]
+
+        _sweep = self
+        pool = mp.Pool(min(self.processes, len(specs)))
+        try:
+            return pool.map(evaluate_shared, specs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            _sweep = None
+
+
+def header():
+    return ['spec', 'selected', 'correct', 'exact', 'known', 'found',
+            'precision', 'exact_precision', 'recall'] + sorted(RESULT_TYPE)
+
+
+def row(score):
+    return [score.name, score.selected, score.correct, score.exact,
+            score.known, score.found, score.precision, score.exact_precision,
+            score.recall] + [score.results[r] for r in sorted(RESULT_TYPE)]
+
+
+def write(scores, stream):
+    writer = csv.writer(stream)
+    writer.writerow(header())
+    writer.writerows(row(s) for s in scores)
+
 
 class Validator(object):
     """
@@ -55,15 +265,14 @@ class Validator(object):
             Full path to the file containing the RNA sequences to query with.
             Must be a FASTA file.
 
-        given_expected : dict
-            This must be a dict which maps from accession number to a set of
-            Mapping objects. Each Mapping represents the correct location in
-            the genome for the given sequence.
+        given_expected : str
+            Full path to the GFF3 file of the correct locations in the genome
+            of the sequences.
 
         Returns
         -------
-        counts : SummaryCounts
-            A set of counts summarizing the overall matches.
+        score : Score
+            A summary of how many of the matches were correct.
         """
 
         mappings = self.mapper(genome_file, target_file)
@@ -71,4 +280,6 @@ class Validator(object):
             raise ValueError("No mappings produced")
         valid = list(self.matcher.filter_matches(mappings))
         tree = Tree(given_expected)
-        return tree.find_correct_overlaps(valid)
+        comparisons = tree.compare_to_known(valid)
+        return Score.build(self.matcher.name, {'matcher': self.matcher.name},
+                           len(valid), comparisons, len(tree.features))
@@ -0,0 +1,56 @@
+"""Small data sets shared by the tests."""
+
+from genome_mapping import mappers
+from genome_mapping.intervals import Tree
+
+QUERIES = """>URS0000000001_9606 plus
+ACGUACGUACGUACGUACGUACGUACGUACGUACGU
+>URS0000000002_9606 minus
+ACGUACGUACGUACGUACGUACGUACGUACGUACGU
+>URS0000000003_9606 spliced minus
+ACGUACGUACGUACGUACGUACGUACGUACGUACGU
+"""
+
+PSL = [
+    [36, 0, 0, 0, 0, 0, 0, 0, '+', 'URS0000000001_9606', 36, 0, 36,
+     'chr1', 1000, 100, 136, 1, '36,', '0,', '100,'],
+    [36, 0, 0, 0, 0, 0, 0, 0, '-', 'URS0000000002_9606', 36, 0, 36,
+     'chr1', 1000, 200, 236, 1, '36,', '0,', '200,'],
+    [36, 0, 0, 0, 0, 0, 1, 64, '-', 'URS0000000003_9606', 36, 0, 36,
+     'chr2', 1000, 300, 400, 2, '20,16,', '0,20,', '300,384,'],
+]
+
+
+def gff3_line(feature_type, start, stop, strand, attributes):
+    return '\t'.join(['chr1', 'RNAcentral', feature_type, str(start),
+                      str(stop), '.', strand, '.', attributes]) + '\n'
+
+
+KNOWN = '##gff-version 3\n' + ''.join([
+    gff3_line('transcript', 101, 136, '+', 'ID=t1;Name=URS0000000001'),
+    gff3_line('noncoding_exon', 101, 136, '+',
+              'ID=e1;Name=URS0000000001;Parent=t1'),
+    gff3_line('transcript', 201, 236, '-', 'ID=t2;Name=URS0000000002'),
+    gff3_line('noncoding_exon', 201, 236, '-',
+              'ID=e2;Name=URS0000000002;Parent=t2'),
+])
+
+
+def hits(tmpdir):
+    """Parse a small PSL file of hits on both strands."""
+
+    queries = tmpdir.join('queries.fasta')
+    queries.write(QUERIES)
+    results = tmpdir.join('results.psl')
+    results.write(''.join('\t'.join(str(v) for v in row) + '\n'
+                          for row in PSL))
+    mapper = mappers.fetch('blat')()
+    return list(mapper.parse_result_file(str(results), str(queries)))
+
+
+def known(tmpdir):
+    """Build a Tree of known features, one on each strand of chr1."""
+
+    path = tmpdir.join('known.gff3')
+    path.write(KNOWN)
+    return Tree(str(path))
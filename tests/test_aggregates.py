@@ -0,0 +1,92 @@
+import os
+import sys
+import cPickle
+import subprocess as sp
+
+import pytest
+
+from genome_mapping import aggregates
+from genome_mapping.data import RESULT_TYPE
+
+from tests.helpers import hits
+from tests.helpers import known
+
+GM = os.path.join(os.path.dirname(__file__), '..', 'bin', 'gm.py')
+
+
+def comparisons(tmpdir):
+    return list(known(tmpdir).compare_to_known(hits(tmpdir)))
+
+
+def test_distribution_summary():
+    distribution = aggregates.Distribution(digits=1)
+    for value in [0.5, 0.94, 0.96, float('nan'), None, 1.0]:
+        distribution.add(value)
+    assert distribution.count == 4
+    assert distribution.summary() == [0.5, 0.9, pytest.approx(0.85), 1.0]
+
+
+def test_merged_distributions_match_one_distribution():
+    first = aggregates.Distribution()
+    second = aggregates.Distribution()
+    whole = aggregates.Distribution()
+    for value in xrange(10):
+        (first if value % 3 else second).add(value)
+        whole.add(value)
+    first.merge(second)
+    assert first.summary() == whole.summary()
+    assert first.histogram == whole.histogram
+
+    with pytest.raises(ValueError):
+        first.merge(aggregates.Distribution(digits=1))
+
+
+def test_default_rows_list_every_result_type(tmpdir):
+    found = comparisons(tmpdir)
+    aggregate = aggregates.Aggregate().update(found)
+    rows = list(aggregate.rows())
+    assert aggregate.header() == ['type', 'count']
+    assert [r[0] for r in rows] == sorted(RESULT_TYPE) + ['total']
+    assert rows[-1] == ['total', len(found)]
+    assert sum(r[1] for r in rows[:-1]) == len(found)
+
+
+def test_merged_shards_match_one_pass(tmpdir):
+    found = comparisons(tmpdir)
+    by = ('type.pretty', 'hit.strand')
+    whole = aggregates.Aggregate(by=by, distributions=True).update(found)
+    merged = aggregates.Aggregate(by=by, distributions=True)
+    for shard in (found[:1], found[1:]):
+        part = aggregates.Aggregate(by=by, distributions=True).update(shard)
+        merged.merge(cPickle.loads(cPickle.dumps(part)))
+    assert list(merged.rows()) == list(whole.rows())
+    assert len(merged.header()) == len(list(merged.rows())[0])
+
+    with pytest.raises(ValueError):
+        merged.merge(aggregates.Aggregate(by=by))
+
+
+def test_gm_combine_merges_partials(tmpdir):
+    found = comparisons(tmpdir)
+    partials = []
+    for index, shard in enumerate((found[:1], found[1:])):
+        path = str(tmpdir.join('part-%i.pickle' % index))
+        with open(path, 'wb') as out:
+            cPickle.dump(aggregates.Aggregate().update(shard), out)
+        partials.append(path)
+
+    output = sp.check_output([sys.executable, '-W', 'ignore', GM,
+                              'comparisons', 'combine'] + partials + ['-'])
+    assert output.splitlines()[-1] == 'total,%i' % len(found)
+
+
+def test_gm_combine_rejects_empty_partials(tmpdir):
+    empty = tmpdir.join('empty.pickle')
+    empty.write('')
+    process = sp.Popen([sys.executable, '-W', 'ignore', GM, 'comparisons',
+                        'combine', str(empty), '-'],
+                       stdout=sp.PIPE, stderr=sp.PIPE)
+    out, err = process.communicate()
+    assert process.returncode == 1
+    assert out == ''
+    assert 'No partial summaries to combine' in err
@@ -0,0 +1,26 @@
+import collections as coll
+
+from genome_mapping import benchmarks
+
+
+def psl_strands(filename):
+    with open(filename, 'rb') as raw:
+        return coll.Counter(line.split('\t')[8] for line in raw)
+
+
+def test_parsed_hits_keep_the_strands_of_the_psl(tmpdir):
+    paths = benchmarks.synthetic('tiny', directory=str(tmpdir)).generate()
+    parse = dict(benchmarks.cases(paths))['create_mappings']
+    found = coll.Counter(h.strand for h in parse())
+    expected = psl_strands(paths['results'])
+    assert found == expected
+    assert expected['+'] and expected['-']
+
+
+def test_generated_data_is_reproducible(tmpdir):
+    first = benchmarks.synthetic('tiny', directory=str(tmpdir.join('a')))
+    second = benchmarks.synthetic('tiny', directory=str(tmpdir.join('b')))
+    first, second = first.generate(), second.generate()
+    for name in first:
+        with open(first[name], 'rb') as a, open(second[name], 'rb') as b:
+            assert a.read() == b.read()
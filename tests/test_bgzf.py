@@ -0,0 +1,87 @@
+import gzip
+import random
+
+from genome_mapping import bgzf
+
+
+def random_lines(count, seed=1):
+    rand = random.Random(seed)
+    return [''.join(rand.choice('ACGT') for _ in xrange(rand.randint(1, 200)))
+            for _ in xrange(count)]
+
+
+def test_reader_starts_at_any_virtual_offset(tmpdir):
+    lines = random_lines(2000)
+    path = str(tmpdir.join('lines.gz'))
+    offsets = []
+    with open(path, 'wb') as out:
+        writer = bgzf.Writer(out)
+        for line in lines:
+            offsets.append(writer.tell())
+            writer.write(line + '\n')
+        writer.close()
+
+    assert len(set(o >> 16 for o in offsets)) > 1
+    with open(path, 'rb') as raw:
+        reader = bgzf.Reader(raw)
+        assert list(reader.lines()) == lines
+        for index in (0, 1, 700, 1999):
+            found = reader.lines(offsets[index])
+            assert next(found) == lines[index]
+
+
+def test_written_files_are_plain_gzip(tmpdir):
+    lines = random_lines(1000)
+    path = str(tmpdir.join('lines.gz'))
+    with open(path, 'wb') as out:
+        writer = bgzf.Writer(out)
+        writer.write(''.join(l + '\n' for l in lines))
+        writer.close()
+
+    with open(path, 'rb') as raw:
+        assert raw.read()[-len(bgzf.EOF):] == bgzf.EOF
+    handle = gzip.open(path, 'rb')
+    try:
+        assert handle.read().splitlines() == lines
+    finally:
+        handle.close()
+
+
+def bed_lines(count, seed=1):
+    rand = random.Random(seed)
+    lines = []
+    for index in xrange(count):
+        chromosome = rand.choice(['chr1', 'chr2'])
+        start = rand.randint(0, 200000)
+        stop = start + rand.randint(1, 5000)
+        lines.append('%s\t%i\t%i\tname%i' % (chromosome, start, stop, index))
+    return lines
+
+
+def overlapping(lines, chromosome, start, stop):
+    found = []
+    for line in lines:
+        location = bgzf.bed_location(line)
+        if location[0] == chromosome and location[1] < stop and \
+                location[2] > start:
+            found.append(line)
+    return sorted(found)
+
+
+def test_fetch_finds_every_overlapping_line(tmpdir):
+    lines = bed_lines(3000)
+    path = str(tmpdir.join('features.bed.gz'))
+    with open(path, 'wb') as out, open(bgzf.index_path(path), 'wb') as index:
+        bgzf.write_sorted(iter(lines), 'bed', out, index, buffer_size=500)
+
+    regions = [('chr1', 0, 10), ('chr1', 50000, 52000),
+               ('chr2', 16380, 16390), ('chr2', 100000, 150000),
+               ('chr1', 300000, 400000), ('chr3', 0, 1000)]
+    for (chromosome, start, stop) in regions:
+        found = sorted(bgzf.fetch(path, chromosome, start, stop))
+        assert found == overlapping(lines, chromosome, start, stop)
+
+
+def test_gff3_locations_are_made_half_open():
+    line = 'chr1\tRNAcentral\tnoncoding_exon\t101\t136\t.\t+\t.\tID=e1'
+    assert bgzf.gff3_location(line) == ('chr1', 100, 136)
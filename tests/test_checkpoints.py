@@ -0,0 +1,79 @@
+import cPickle
+
+import pytest
+from Bio import SeqIO
+
+from genome_mapping import checkpoints
+
+QUERIES = ''.join('>URS000000000%i_9606\nACGUACGUACGUACGUACGUACGU\n' % i
+                  for i in range(5))
+
+
+class FakeMapper(object):
+    """Give one hit, the id and genome, for each query. The call with the
+    index fail_after is interrupted after its first hit.
+    """
+
+    name = 'fake'
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.searched = []
+
+    def __call__(self, genome_file, query_file):
+        ids = [r.id for r in SeqIO.parse(query_file, 'fasta')]
+        self.searched.append(ids)
+        for index, name in enumerate(ids):
+            if len(self.searched) - 1 == self.fail_after and index == 1:
+                raise KeyboardInterrupt()
+            yield (name, genome_file)
+
+
+def load(path):
+    found = []
+    with open(path, 'rb') as raw:
+        try:
+            while True:
+                found.append(cPickle.load(raw))
+        except EOFError:
+            return found
+
+
+@pytest.fixture
+def paths(tmpdir):
+    queries = tmpdir.join('queries.fasta')
+    queries.write(QUERIES)
+    genome = tmpdir.join('genome.2bit')
+    genome.write('genome')
+    return str(genome), str(queries), str(tmpdir.join('hits.pickle'))
+
+
+def test_resumed_run_skips_completed_chunks(paths):
+    genome, queries, output = paths
+    interrupted = FakeMapper(fail_after=1)
+    with pytest.raises(KeyboardInterrupt):
+        checkpoints.find(interrupted, genome, queries, output, chunk_size=2)
+    assert len(interrupted.searched) == 2
+    # The hit of the unfinished chunk was written but is not journaled.
+    assert len(load(output)) == 3
+
+    resumed = FakeMapper()
+    counts = checkpoints.find(resumed, genome, queries, output, chunk_size=2)
+    assert counts == (2, 1)
+    assert resumed.searched == [
+        ['URS0000000002_9606', 'URS0000000003_9606'],
+        ['URS0000000004_9606'],
+    ]
+    assert [h[0] for h in load(output)] == \
+        ['URS000000000%i_9606' % i for i in range(5)]
+
+    assert checkpoints.find(FakeMapper(), genome, queries, output,
+                            chunk_size=2) == (0, 3)
+    assert len(load(output)) == 5
+
+
+def test_journal_of_another_run_is_not_resumed(paths):
+    genome, queries, output = paths
+    checkpoints.find(FakeMapper(), genome, queries, output, chunk_size=2)
+    with pytest.raises(ValueError):
+        checkpoints.find(FakeMapper(), genome, queries, output, chunk_size=3)
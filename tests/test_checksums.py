@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from genome_mapping import checksums
+
+CORRECT = [
+    ('URS0000000003', '9e107d9d372bb6826bd81d3542a419d6'),
+    ('URS0000000001', 'e4d909c290d0fb1ca068ffaddf22cbd0'),
+    ('URS000000000A', 'd41d8cd98f00b204e9800998ecf8427e'),
+    ('URS0000000001', '0cc175b9c0f1b6a831c399e269772661'),
+]
+
+ROWS = [
+    ('URS0000000001', '0cc175b9c0f1b6a831c399e269772661'),
+    ('URS0000000003', 'd41d8cd98f00b204e9800998ecf8427e'),
+    ('URS0000000002', 'd41d8cd98f00b204e9800998ecf8427e'),
+    ('URS000000000A', 'D41D8CD98F00B204E9800998ECF8427E'),
+]
+
+EXPECTED = [
+    ('URS0000000001', checksums.OK),
+    ('URS0000000003', checksums.NOT_OK),
+    ('URS0000000002', checksums.MISSING),
+    ('URS000000000A', checksums.OK),
+]
+
+
+def write_tsv(tmpdir, rows):
+    path = tmpdir.join('md5.tsv')
+    path.write(''.join('%s\t%s\n' % row for row in rows))
+    return str(path)
+
+
+def test_validate_uses_the_last_md5_of_each_id(tmpdir):
+    table = checksums.Md5Table(write_tsv(tmpdir, CORRECT))
+    assert list(checksums.validate(ROWS, table)) == EXPECTED
+
+
+def test_sort_merge_matches_lookup(tmpdir):
+    table = checksums.Md5Table(write_tsv(tmpdir, CORRECT), buffer_size=2)
+    found = checksums.validate_sorted(iter(ROWS), table, buffer_size=2)
+    assert list(found) == EXPECTED
+
+
+def test_table_is_rebuilt_when_the_tsv_changes(tmpdir):
+    filename = write_tsv(tmpdir, CORRECT)
+    checksums.Md5Table(filename)
+    with open(filename, 'ab') as out:
+        out.write('URS0000000002\td41d8cd98f00b204e9800998ecf8427e\n')
+    os.utime(filename, (0, 0))
+    table = checksums.Md5Table(filename)
+    assert table.get('URS0000000002') == 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+@pytest.mark.parametrize('md5', ['deadbeef', 'not an md5 at all, not hex ok',
+                                 '9e107d9d372bb6826bd81d3542a419d6ff'])
+def test_invalid_md5s_are_rejected(tmpdir, md5):
+    filename = write_tsv(tmpdir, [('a', md5)] + CORRECT)
+    with pytest.raises(ValueError):
+        checksums.Md5Table(filename)
+    assert not os.path.exists(filename + '.bin')
@@ -0,0 +1,130 @@
+import json
+import StringIO
+
+import attr
+import pytest
+
+from genome_mapping import formatters
+
+from tests.helpers import hits
+from tests.helpers import known
+
+
+def formatted(data, name):
+    stream = StringIO.StringIO()
+    formatters.format(data, name, stream)
+    return stream.getvalue()
+
+
+def test_insertable_takes_the_taxid_from_the_query_id(tmpdir):
+    found = json.loads(formatted(hits(tmpdir), 'insertable'))
+    assert [(e['upi'], e['taxid']) for e in found] == [
+        ('URS0000000001', 9606),
+        ('URS0000000002', 9606),
+        ('URS0000000003', 9606),
+    ]
+    assert found[0]['exons'] == [{
+        'chromosome': 'chr1',
+        'primary_start': 101,
+        'primary_end': 136,
+        'strand': 1,
+    }]
+    assert sorted((e['primary_start'], e['primary_end'], e['strand'])
+                  for e in found[2]['exons']) == [(301, 320, -1),
+                                                  (385, 400, -1)]
+
+
+def test_insertable_lines_match_the_array(tmpdir):
+    found = formatted(hits(tmpdir), 'insertable-ndjson').splitlines()
+    assert [json.loads(l) for l in found] == \
+        json.loads(formatted(hits(tmpdir), 'insertable'))
+
+
+def test_insertable_needs_a_taxid(tmpdir):
+    hit = hits(tmpdir)[0]
+    sequence = attr.assoc(hit.input_sequence, id=hit.input_sequence.urs)
+    with pytest.raises(ValueError):
+        formatted([attr.assoc(hit, input_sequence=sequence)], 'insertable')
+
+
+def copy_rows(tmpdir, data, shard_size=2):
+    formatter = formatters.CopyRows()
+    formatter.shard_size = shard_size
+    path = tmpdir.join('inferred.json')
+    with open(str(path), 'wb') as out:
+        formatter(data, out)
+    return str(path), json.loads(path.read())
+
+
+def test_copy_rows_shards_one_row_per_exon(tmpdir):
+    path, manifest = copy_rows(tmpdir, hits(tmpdir))
+    assert manifest['columns'] == list(formatters.CopyRows.columns)
+    assert manifest['rows'] == 4
+    assert [s['rows'] for s in manifest['shards']] == [2, 2]
+    assert [s['path'] for s in manifest['shards']] == \
+        ['inferred-00000.tsv', 'inferred-00001.tsv']
+
+    rows = [l.split('\t') for s in manifest['shards']
+            for l in tmpdir.join(s['path']).read().splitlines()]
+    assert rows[0] == ['URS0000000001_9606@chr1/101-136:+', 'URS0000000001',
+                       '9606', 'chr1', '1', '1', '101', '136']
+    assert [r[5:] for r in rows[2:]] == [['1', '301', '320'],
+                                         ['2', '385', '400']]
+    assert rows[3][0] == 'URS0000000003_9606@chr2/301-320,385-400:-'
+
+
+def test_copy_rows_must_be_written_to_a_file(tmpdir):
+    with pytest.raises(ValueError):
+        formatted(hits(tmpdir), 'copy-tsv')
+
+
+def test_copy_escape():
+    assert formatters.copy_escape(None) == '\\N'
+    assert formatters.copy_escape('a\tb\\c\nd') == 'a\\tb\\\\c\\nd'
+    assert formatters.copy_escape(3) == '3'
+
+
+def test_escape_only_changes_unsafe_characters():
+    assert formatters.escape(formatters.GFF3_ATTRIBUTE, 'URS0000000001') == \
+        'URS0000000001'
+    assert formatters.escape(formatters.GFF3_ATTRIBUTE, 'a;b=c,d%e\tf') == \
+        'a%3Bb%3Dc%2Cd%25e%09f'
+    assert formatters.escape(formatters.GFF3_SEQID, 'chr 1>') == 'chr%201%3E'
+    assert formatters.escape(formatters.GFF3_COLUMN, 'a;b') == 'a;b'
+
+
+def test_gff3_row_escapes_each_column():
+    row = formatters.gff3_row('chr 1', None, 'exon', 1, 10, None, '+', None,
+                              {'Parent': 'p', 'ID': 'x;y', 'note': 'n',
+                               'Alias': ['a', 'b,c']})
+    assert row.split('\t') == [
+        'chr%201', '.', 'exon', '1', '10', '.', '+', '.',
+        'ID=x%3By;Alias=a,b%2Cc;Parent=p;note=n',
+    ]
+    assert formatters.gff3_row('chr1', 's', 'exon', 1, 2, 0.5, None, None,
+                               {}).split('\t')[5:] == ['0.5', '.', '.', '.']
+
+
+def test_bed12_writes_each_fragment_as_a_block(tmpdir):
+    rows = [r.split('\t') for r in
+            formatted(hits(tmpdir), 'bed12').splitlines()]
+    assert [r[:6] for r in rows] == [
+        ['chr1', '100', '136', 'URS0000000001', '1000', '+'],
+        ['chr1', '200', '236', 'URS0000000002', '1000', '-'],
+        ['chr2', '300', '400', 'URS0000000003', '1000', '-'],
+    ]
+    assert [r[6:] for r in rows] == [
+        ['100', '136', '0', '1', '36,', '0,'],
+        ['200', '236', '0', '1', '36,', '0,'],
+        ['300', '400', '0', '2', '20,16,', '0,84,'],
+    ]
+
+
+def test_bed12_writes_comparisons_as_hit_and_feature(tmpdir):
+    found = known(tmpdir).compare_to_known(hits(tmpdir))
+    rows = [r.split('\t')[:6] for r in
+            formatted(found, 'bed12').splitlines()]
+    assert rows[:2] == [
+        ['chr1', '100', '136', 'URS0000000001:correct_exact', '1000', '+'],
+        ['chr1', '100', '136', 'URS0000000001', '0', '+'],
+    ]
@@ -0,0 +1,79 @@
+import os
+import csv
+import sys
+import cPickle
+import itertools as it
+import subprocess as sp
+
+import pytest
+
+from genome_mapping import grouping
+
+from tests.helpers import hits
+from tests.helpers import known
+
+GM = os.path.join(os.path.dirname(__file__), '..', 'bin', 'gm.py')
+
+DATA = [('b', 1), ('a', 2), ('c', 3), ('a', 4), ('b', 5), ('a', 6), ('d', 7)]
+
+EXPECTED = [
+    ('a', [('a', 2), ('a', 4), ('a', 6)]),
+    ('b', [('b', 1), ('b', 5)]),
+    ('c', [('c', 3)]),
+    ('d', [('d', 7)]),
+]
+
+
+@pytest.mark.parametrize('buffer_size', [1, 2, 3, 100])
+def test_group_by_keeps_input_order_within_groups(buffer_size, tmpdir):
+    groups = grouping.group_by(iter(DATA), lambda d: d[0],
+                               buffer_size=buffer_size, directory=str(tmpdir))
+    assert [(k, list(e)) for (k, e) in groups] == EXPECTED
+
+
+def test_sorted_runs_spill_only_when_the_buffer_fills():
+    assert len(grouping.sorted_runs(DATA, lambda d: d[0])) == 1
+    assert len(grouping.sorted_runs(DATA, lambda d: d[0], buffer_size=3)) == 3
+
+
+def test_group_by_nothing():
+    assert list(grouping.group_by([], lambda d: d)) == []
+
+
+def test_groups_are_read_lazily():
+    data = it.chain([('a', 0)], (('b', i) for i in it.count()))
+    groups = grouping.group_by(it.islice(data, 10), lambda d: d[0])
+    assert [list(e) for (_, e) in groups] == \
+        [[('a', 0)], [('b', i) for i in xrange(9)]]
+
+    groups = grouping.group_by(DATA, lambda d: d[0])
+    key, entries = next(groups)
+    assert next(entries) == ('a', 2)
+
+
+def test_gm_groups_comparisons_by_hit_urs(tmpdir):
+    path = tmpdir.join('comparisons.pickle')
+    found = known(tmpdir).compare_to_known(hits(tmpdir), strand='opposite')
+    with open(str(path), 'wb') as out:
+        for comparison in found:
+            cPickle.dump(comparison, out)
+
+    grouped = str(tmpdir.join('grouped.pickle'))
+    sp.check_call([sys.executable, '-W', 'ignore', GM, 'comparisons', 'group',
+                   'by-hit-urs', str(path), grouped, '--buffer-size', '1'])
+    with open(grouped, 'rb') as raw:
+        entries = []
+        try:
+            while True:
+                entries.append(cPickle.load(raw))
+        except EOFError:
+            pass
+    assert [(u, len(c)) for (u, c) in entries] == \
+        [(None, 1), (None, 1), ('URS0000000001', 1), ('URS0000000002', 1)]
+
+    output = sp.check_output([sys.executable, '-W', 'ignore', GM,
+                              'comparisons', 'group', 'summarize-types',
+                              grouped, '-'])
+    rows = list(csv.DictReader(output.splitlines()))
+    assert [r['urs'] for r in rows] == ['', 'URS0000000001', 'URS0000000002']
+    assert rows[0]['missing'] == '2'
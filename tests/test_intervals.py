@@ -0,0 +1,82 @@
+import os
+import csv
+import sys
+import cPickle
+import subprocess as sp
+import collections as coll
+
+from genome_mapping.intervals import Tree
+
+from tests.helpers import hits
+from tests.helpers import known
+
+GM = os.path.join(os.path.dirname(__file__), '..', 'bin', 'gm.py')
+
+
+def exon(chromosome, start, stop, strand, name, parent):
+    attributes = 'ID=%s-exon;Name=%s;Parent=%s' % (parent, name, parent)
+    return '\t'.join([chromosome, 'RNAcentral', 'noncoding_exon', str(start),
+                      str(stop), '.', strand, '.', attributes]) + '\n'
+
+
+# URS0000000001 is known at several loci, the hit to it is at 100-136 on
+# chr1. URS0000000003 is only known on chr1 but the hit to it is on chr2.
+LOCI = '##gff-version 3\n' + ''.join([
+    exon('chr1', 50, 90, '+', 'URS0000000001', 'far'),
+    exon('chr1', 140, 160, '+', 'URS0000000001', 'close'),
+    exon('chr2', 100, 200, '+', 'URS0000000001', 'elsewhere'),
+    exon('chr1', 300, 400, '-', 'URS0000000003', 'other'),
+])
+
+
+def compared(tmpdir, strand):
+    tree = known(tmpdir)
+    found = hits(tmpdir)
+    return coll.Counter(c.type.pretty for c in
+                        tree.compare_to_known(found, strand=strand))
+
+
+def test_same_strand_finds_features_on_both_strands(tmpdir):
+    assert compared(tmpdir, 'same') == compared(tmpdir, 'both')
+
+
+def test_opposite_strand_finds_no_features(tmpdir):
+    types = compared(tmpdir, 'opposite')
+    assert not [t for t in types if t.startswith('correct')]
+
+
+def test_distance_to_expected_finds_the_closest_locus(tmpdir):
+    path = tmpdir.join('loci.gff3')
+    path.write(LOCI)
+    found = {hit.urs: (loci, neighbor) for (hit, loci, neighbor) in
+             Tree(str(path)).distance_to_expected(hits(tmpdir))}
+
+    loci, neighbor = found['URS0000000001']
+    assert len(loci) == 3
+    assert (neighbor.feature.start, neighbor.distance) == (140, -4)
+
+    assert found['URS0000000002'] == ([], None)
+
+    loci, neighbor = found['URS0000000003']
+    assert [l.chromosome for l in loci] == ['chr1']
+    assert neighbor is None
+
+
+def test_gm_distance_to_expected(tmpdir):
+    path = tmpdir.join('loci.gff3')
+    path.write(LOCI)
+    data = tmpdir.join('hits.pickle')
+    with open(str(data), 'wb') as out:
+        for hit in hits(tmpdir):
+            cPickle.dump(hit, out)
+
+    output = sp.check_output([sys.executable, '-W', 'ignore', GM, 'hits',
+                              'distance-to-expected', str(data), str(path),
+                              '-'])
+    rows = {r['urs']: r for r in csv.DictReader(output.splitlines())}
+    assert rows['URS0000000001']['expected_loci'] == '3'
+    assert rows['URS0000000001']['expected_start'] == '140'
+    assert rows['URS0000000001']['distance'] == '-4'
+    assert rows['URS0000000003']['expected_loci'] == '1'
+    assert rows['URS0000000003']['distance'] == ''
+    assert rows['URS0000000003']['overlap'] == ''
@@ -0,0 +1,58 @@
+import pytest
+
+from genome_mapping import joins
+
+from tests.helpers import hits
+from tests.helpers import known
+
+
+def joined(tmpdir, strand, **kwargs):
+    features = known(tmpdir).features
+    found = joins.nearest(features, hits(tmpdir), strand=strand, **kwargs)
+    return {(f.urs, f.strand): sorted(n.hit.urs for n in near)
+            for (f, near) in found}
+
+
+def test_hits_are_on_both_strands(tmpdir):
+    assert sorted(h.strand for h in hits(tmpdir)) == ['+', '-', '-']
+
+
+def test_both_strands_joins_every_nearby_hit(tmpdir):
+    assert joined(tmpdir, 'both', max_range=200) == {
+        ('URS0000000001', '+'): ['URS0000000001', 'URS0000000002'],
+        ('URS0000000002', '-'): ['URS0000000001', 'URS0000000002'],
+    }
+
+
+def test_same_strand_joins_hits_on_the_feature_strand(tmpdir):
+    assert joined(tmpdir, 'same', max_range=200) == {
+        ('URS0000000001', '+'): ['URS0000000001'],
+        ('URS0000000002', '-'): ['URS0000000002'],
+    }
+
+
+def test_opposite_strand_joins_hits_on_the_other_strand(tmpdir):
+    assert joined(tmpdir, 'opposite', max_range=200) == {
+        ('URS0000000001', '+'): ['URS0000000002'],
+        ('URS0000000002', '-'): ['URS0000000001'],
+    }
+
+
+def test_nearest_count_respects_strand(tmpdir):
+    assert joined(tmpdir, 'same', count=1) == {
+        ('URS0000000001', '+'): ['URS0000000001'],
+        ('URS0000000002', '-'): ['URS0000000002'],
+    }
+
+
+def test_partition_key_flips_the_strand(tmpdir):
+    hit = [h for h in hits(tmpdir) if h.urs == 'URS0000000002'][0]
+    assert joins.partition_key(hit, strand='same') == ('chr1', '-')
+    assert joins.partition_key(hit, strand='opposite', flip=True) == \
+        ('chr1', '+')
+    assert joins.partition_key(hit) == ('chr1',)
+
+
+def test_unknown_strand_restrictions_fail(tmpdir):
+    with pytest.raises(ValueError):
+        joined(tmpdir, 'sideways', max_range=1)
@@ -0,0 +1,68 @@
+import json
+import sqlite3
+
+import pytest
+
+from genome_mapping import loaders
+from genome_mapping import formatters
+
+from tests.test_formatters import copy_rows
+from tests.helpers import hits
+
+
+def loaded(database):
+    connection = sqlite3.connect(database)
+    try:
+        return connection.execute(
+            'SELECT upi, exon, primary_start, strand FROM %s '
+            'ORDER BY primary_start' % loaders.TABLE).fetchall()
+    finally:
+        connection.close()
+
+
+def test_unescape_reverses_copy_escape():
+    for value in [None, '', 'plain', 'a\tb\\c\nd\re', '\\N']:
+        escaped = formatters.copy_escape(value)
+        assert loaders.unescape(escaped) == value
+
+
+def test_load_every_shard(tmpdir):
+    manifest, _ = copy_rows(tmpdir, hits(tmpdir))
+    database = str(tmpdir.join('loaded.db'))
+    assert loaders.load_sqlite(manifest, database, batch_size=1) == 4
+    assert loaded(database) == [
+        (u'URS0000000001', 1, 101, 1),
+        (u'URS0000000002', 1, 201, -1),
+        (u'URS0000000003', 1, 301, -1),
+        (u'URS0000000003', 2, 385, -1),
+    ]
+
+
+def test_a_corrupt_shard_loads_nothing(tmpdir):
+    manifest, written = copy_rows(tmpdir, hits(tmpdir))
+    second = tmpdir.join(written['shards'][1]['path'])
+    second.write(second.read().replace('385', '386'))
+    database = str(tmpdir.join('loaded.db'))
+    with pytest.raises(ValueError):
+        loaders.load_sqlite(manifest, database, batch_size=1)
+    assert [r[0] for r in loaded(database)] == \
+        [u'URS0000000001', u'URS0000000002']
+
+
+def test_a_short_shard_loads_nothing(tmpdir):
+    manifest, written = copy_rows(tmpdir, hits(tmpdir))
+    first = tmpdir.join(written['shards'][0]['path'])
+    first.write(first.read().splitlines(True)[0])
+    written['shards'][0]['md5'] = None
+    tmpdir.join('inferred.json').write(json.dumps(written))
+    database = str(tmpdir.join('loaded.db'))
+    with pytest.raises(ValueError):
+        loaders.load_sqlite(manifest, database, batch_size=1)
+    assert loaded(database) == []
+
+
+def test_only_manifests_are_loaded(tmpdir):
+    path = tmpdir.join('other.json')
+    path.write('{"format": "json"}')
+    with pytest.raises(ValueError):
+        loaders.load_sqlite(str(path), str(tmpdir.join('loaded.db')))
@@ -0,0 +1,22 @@
+from tests.helpers import hits
+
+
+def test_blat_hits_have_the_strand_of_the_query(tmpdir):
+    found = {h.urs: h for h in hits(tmpdir)}
+    assert found['URS0000000001'].strand == '+'
+    assert found['URS0000000002'].strand == '-'
+    assert found['URS0000000003'].strand == '-'
+
+
+def test_blat_fragments_have_the_strand_of_their_hit(tmpdir):
+    for hit in hits(tmpdir):
+        assert {f.is_forward for f in hit.fragments} == {hit.is_forward}
+
+
+def test_blat_hits_have_their_locations(tmpdir):
+    found = {h.urs: h for h in hits(tmpdir)}
+    spliced = found['URS0000000003']
+    assert (spliced.chromosome, spliced.start, spliced.stop) == \
+        ('chr2', 300, 400)
+    assert [(f.start, f.stop) for f in spliced.fragments] == \
+        [(300, 320), (384, 400)]
@@ -0,0 +1,30 @@
+from genome_mapping import overlaps
+
+from tests.helpers import hits
+
+
+def test_merge_sorts_and_joins_touching_intervals():
+    merged = overlaps.merge([(50, 60), (0, 10), (5, 20), (20, 30), (55, 58)])
+    assert merged == [(0, 30), (50, 60)]
+
+
+def test_intersection_counts_shared_bases():
+    first = [(0, 10), (20, 30), (40, 50)]
+    second = [(5, 25), (45, 100)]
+    assert overlaps.intersection(first, second) == 15
+    assert overlaps.intersection(second, first) == 15
+    assert overlaps.intersection(first, []) == 0
+
+
+def test_size_and_introns():
+    blocks = [(0, 10), (20, 30), (40, 50)]
+    assert overlaps.size(blocks) == 30
+    assert overlaps.introns(blocks) == [(10, 20), (30, 40)]
+    assert overlaps.introns(blocks[:1]) == []
+
+
+def test_hit_blocks_are_the_exons_of_a_spliced_hit(tmpdir):
+    spliced = [h for h in hits(tmpdir) if h.chromosome == 'chr2'][0]
+    blocks = overlaps.hit_blocks(spliced)
+    assert blocks == [(300, 320), (384, 400)]
+    assert overlaps.size(blocks) == 36
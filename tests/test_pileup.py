@@ -0,0 +1,34 @@
+from genome_mapping import pileup
+
+from tests.helpers import hits
+
+
+def summary(clusters):
+    return [(c.chromosome, c.strand, c.start, c.stop, c.depth, c.urs)
+            for c in clusters]
+
+
+def test_stranded_clusters_keep_the_strand_of_their_fragments(tmpdir):
+    clusters = summary(pileup.clusters(hits(tmpdir), stranded=True))
+    assert clusters == [
+        ('chr1', '+', 100, 136, 1, ['URS0000000001']),
+        ('chr1', '-', 200, 236, 1, ['URS0000000002']),
+        ('chr2', '-', 300, 320, 1, ['URS0000000003']),
+        ('chr2', '-', 384, 400, 1, ['URS0000000003']),
+    ]
+
+
+def test_unstranded_clusters_have_no_strand(tmpdir):
+    clusters = summary(pileup.clusters(hits(tmpdir), max_gap=100))
+    assert [c[:4] for c in clusters] == [
+        ('chr1', None, 100, 236),
+        ('chr2', None, 300, 400),
+    ]
+    assert clusters[0][5] == ['URS0000000001', 'URS0000000002']
+
+
+def test_stranded_clusters_do_not_merge_across_strands(tmpdir):
+    clusters = summary(pileup.clusters(hits(tmpdir), max_gap=100,
+                                       stranded=True))
+    assert [(c[0], c[1]) for c in clusters] == \
+        [('chr1', '+'), ('chr1', '-'), ('chr2', '-')]
@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import StringIO
+import subprocess as sp
+
+import pytest
+
+from genome_mapping import pipeline
+from genome_mapping import formatters
+from genome_mapping import predicates
+
+from tests.helpers import hits
+from tests.helpers import known
+
+GM = os.path.join(os.path.dirname(__file__), '..', 'bin', 'gm.py')
+
+
+def formatted(data, name):
+    out = StringIO.StringIO()
+    formatters.format(data, name, out)
+    return out.getvalue()
+
+
+def test_broadcast_gives_every_consumer_all_entries():
+    seen = [[], [], []]
+    consumers = [lambda d, s=s: s.extend(d) for s in seen]
+    read = []
+
+    def data():
+        for value in xrange(25):
+            read.append(value)
+            yield value
+
+    pipeline.broadcast(data(), consumers, size=2)
+    assert read == range(25)
+    assert seen == [range(25)] * 3
+
+
+def test_broadcast_raises_the_error_of_a_consumer():
+    seen = []
+
+    def failing(data):
+        next(iter(data))
+        raise ValueError("bad output")
+
+    with pytest.raises(ValueError):
+        pipeline.broadcast(xrange(100), [failing, seen.extend], size=1)
+    assert seen == range(100)
+
+
+def test_gm_run_writes_all_outputs_in_one_pass(tmpdir):
+    found = list(known(tmpdir).compare_to_known(hits(tmpdir)))
+    spec = {
+        'input': {
+            'results': str(tmpdir.join('results.psl')),
+            'queries': str(tmpdir.join('queries.fasta')),
+            'format': 'blat-psl',
+        },
+        'compare': {'known': str(tmpdir.join('known.gff3'))},
+        'outputs': [
+            {'format': 'gff3', 'path': '{out}/compared.gff3'},
+            {'format': 'gff3', 'path': '{out}/selected.gff3',
+             'where': "hit.strand == '-'"},
+            {'format': 'summary', 'path': '{out}/summary.csv'},
+        ],
+    }
+    spec_file = tmpdir.join('spec.json')
+    spec_file.write(json.dumps(spec))
+
+    sp.check_call([sys.executable, '-W', 'ignore', GM, 'run',
+                   str(spec_file), '--define', 'out=%s' % tmpdir])
+
+    selected = list(predicates.compile("hit.strand == '-'").
+                    filter(found))
+    assert len(selected) == 1
+    assert tmpdir.join('compared.gff3').read() == formatted(found, 'gff3')
+    assert tmpdir.join('selected.gff3').read() == formatted(selected, 'gff3')
+    summary = tmpdir.join('summary.csv').read().splitlines()
+    assert summary[-1] == 'total,%i' % len(found)
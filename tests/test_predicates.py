@@ -0,0 +1,56 @@
+import pytest
+
+from genome_mapping import predicates
+
+from tests.helpers import hits
+from tests.helpers import known
+
+
+@pytest.mark.parametrize('text', [
+    'type.pretty is missing',
+    'type.match is correct and overlap.jaccard >= 0.9',
+    'hit.stats.length.query > 20',
+    'hit.input_sequence.urs == "URS0000000001"',
+    'hit.strand == "-"',
+    'shift.total > 10 or feature',
+    'not (hit.urs == "URS0000000001" or shift.total > 10)',
+])
+def test_valid_paths_parse(text):
+    predicates.compile(text)
+
+
+@pytest.mark.parametrize('text', [
+    'gene.urs is missing',
+    'hit.nope > 1',
+    'hit.stats.identity > 1',
+    'type.pretty.foo is missing',
+    'hit.strand.foo is missing',
+    'hit.stats.length.query.real > 1',
+    'hit.sequence_type.upper is spliced',
+    'overlap.build is None',
+])
+def test_invalid_paths_fail_at_parse_time(text):
+    with pytest.raises(predicates.InvalidExpression):
+        predicates.compile(text)
+
+
+@pytest.mark.parametrize('text', ['type.pretty is', 'hit.urs ==', '(hit',
+                                  'hit.urs == "a" "b"', ''])
+def test_malformed_expressions_fail(text):
+    with pytest.raises(predicates.InvalidExpression):
+        predicates.compile(text)
+
+
+def test_filter_selects_by_strand(tmpdir):
+    comparisons = list(known(tmpdir).compare_to_known(hits(tmpdir)))
+    selected = predicates.compile('hit.strand == "-" and type.match is '
+                                  'correct').filter(comparisons, size=1)
+    assert [c.hit.urs for c in selected] == ['URS0000000002']
+
+
+def test_missing_parts_of_a_path_are_none(tmpdir):
+    comparisons = list(known(tmpdir).compare_to_known(hits(tmpdir),
+                                                     strand='opposite'))
+    predicate = predicates.compile('hit.input_sequence.urs is None')
+    assert sorted(c.feature.urs for c in predicate.filter(comparisons)) == \
+        ['URS0000000001', 'URS0000000002']
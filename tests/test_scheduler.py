@@ -0,0 +1,75 @@
+import os
+import sys
+
+import pytest
+
+from genome_mapping import scheduler
+
+
+def touch(path, delay=0):
+    return [sys.executable, '-c',
+            'import time; time.sleep(%f); open(%r, "w").close()' %
+            (delay, path)]
+
+
+def spec(tmpdir):
+    return {
+        'organisms': ['a', 'b'],
+        'shared': [{
+            'name': 'md5',
+            'command': touch(str(tmpdir.join('md5.tsv'))),
+            'outputs': [str(tmpdir.join('md5.tsv'))],
+        }],
+        'stages': [{
+            'name': 'targets',
+            'command': touch(str(tmpdir.join('{organism}.fasta'))),
+            'inputs': [str(tmpdir.join('md5.tsv'))],
+            'outputs': [str(tmpdir.join('{organism}.fasta'))],
+        }],
+    }
+
+
+def test_shared_stages_run_once_before_the_organisms(tmpdir):
+    stages = scheduler.stages_from_spec(spec(tmpdir), organisms=['b'])
+    assert [s.key for s in stages] == ['shared/md5', 'b/targets']
+
+    runner = scheduler.Scheduler(stages, cpus=2, memory=1024,
+                                 state_file=str(tmpdir.join('state.json')))
+    assert runner.depends[stages[1]] == {stages[0]}
+    ran, skipped = runner.run()
+    assert [s.key for s in ran] == ['shared/md5', 'b/targets']
+    assert not skipped
+
+    runner = scheduler.Scheduler(stages, cpus=2, memory=1024,
+                                 state_file=str(tmpdir.join('state.json')))
+    ran, skipped = runner.run()
+    assert not ran
+    assert len(skipped) == 2
+
+
+def test_missing_inputs_wait_for_running_stages(tmpdir):
+    slow = str(tmpdir.join('slow'))
+    stages = [
+        scheduler.Stage(organism='a', name='slow',
+                        command=tuple(touch(slow, 1)), inputs=(),
+                        outputs=(slow,), cpus=1, memory=0, weight=10),
+        scheduler.Stage(organism='a', name='missing', command=('true',),
+                        inputs=(str(tmpdir.join('nope')),), outputs=(),
+                        cpus=1, memory=0, weight=1),
+    ]
+    runner = scheduler.Scheduler(stages, cpus=2, memory=1024,
+                                 state_file=str(tmpdir.join('state.json')))
+    with pytest.raises(scheduler.StageFailed) as error:
+        runner.run()
+    assert 'missing inputs' in str(error.value)
+    assert os.path.exists(slow)
+
+
+def test_failed_stages_stop_the_release(tmpdir):
+    stages = [scheduler.Stage(organism='a', name='fail', command=('false',),
+                              inputs=(), outputs=(), cpus=1, memory=0,
+                              weight=1)]
+    runner = scheduler.Scheduler(stages, cpus=1, memory=1024,
+                                 state_file=str(tmpdir.join('state.json')))
+    with pytest.raises(scheduler.StageFailed):
+        runner.run()
@@ -0,0 +1,121 @@
+import os
+import sys
+import hashlib
+import subprocess as sp
+
+import pytest
+from Bio import SeqIO
+
+from genome_mapping import sequences
+
+FASTA_SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'bin',
+                            'fasta.py')
+
+FASTA = """>b first
+ACGU
+ACG
+>a only a
+GGCC
+>b second
+NNAU
+>c
+AAAAAAAAAAAAAAAAAAAAAAAAAAAAAA
+"""
+
+
+@pytest.fixture
+def fasta(tmpdir):
+    path = tmpdir.join('sequences.fasta')
+    path.write(FASTA)
+    return str(path)
+
+
+def test_records_join_sequence_lines(fasta):
+    found = list(sequences.records(sequences.mapped(fasta)))
+    assert found == [
+        ('b', 'b first', 'ACGUACG'),
+        ('a', 'a only a', 'GGCC'),
+        ('b', 'b second', 'NNAU'),
+        ('c', 'c', 'A' * 30),
+    ]
+
+
+def test_records_keep_whitespace_like_biopython(tmpdir):
+    path = tmpdir.join('spaced.fasta')
+    path.write('>a\r\nAC GU\t\r\nTT\tA \n\n>b\nGG\x0b\n CC\n')
+    found = [(i, s) for (i, _, s) in
+             sequences.records(sequences.mapped(str(path)))]
+    with open(str(path), 'rb') as raw:
+        expected = [(r.id, str(r.seq)) for r in SeqIO.parse(raw, 'fasta')]
+    assert found == expected
+    assert found[0] == ('a', 'ACGUTT\tA')
+
+
+@pytest.mark.parametrize('size', [1, 10, 1 << 20])
+def test_split_ranges_cover_every_record_once(fasta, size):
+    buffer = sequences.mapped(fasta)
+    ranges = sequences.split(buffer, size=size)
+    found = [r for (a, b) in ranges for r in sequences.records(buffer, a, b)]
+    assert found == list(sequences.records(buffer))
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_md5s_are_in_file_order(fasta, processes):
+    found = list(sequences.md5s(fasta, processes=processes, size=10))
+    assert found == [
+        ('b', hashlib.md5('ACGUACG').hexdigest()),
+        ('a', hashlib.md5('GGCC').hexdigest()),
+        ('b', hashlib.md5('NNAU').hexdigest()),
+        ('c', hashlib.md5('A' * 30).hexdigest()),
+    ]
+
+
+def test_md5_display_reads_stdin(fasta):
+    command = [sys.executable, '-W', 'ignore', FASTA_SCRIPT, 'md5',
+               'display']
+    from_file = sp.check_output(command + [fasta, '-'])
+    with open(fasta, 'rb') as raw:
+        from_stdin = sp.check_output(command + ['-', '-'], stdin=raw)
+    assert from_stdin == from_file
+    assert from_file.splitlines()[0] == \
+        'b\t%s' % hashlib.md5('ACGUACG').hexdigest()
+
+
+def test_id_index_finds_every_record_of_an_id(fasta, tmpdir):
+    index = sequences.IdIndex(fasta, buffer_size=2)
+    assert len(index.ranges('b')) == 2
+    assert index.ranges('d') == []
+    assert index.ranges('') == []
+
+    out = tmpdir.join('extracted.fasta')
+    with open(str(out), 'wb') as handle:
+        index.extract(['c', 'b', 'missing'], handle)
+    assert out.read() == '>b first\nACGU\nACG\n>b second\nNNAU\n>c\n' + \
+        'A' * 30 + '\n'
+
+
+def test_merged_joins_headers_of_duplicate_ids(fasta):
+    found = list(sequences.merged(fasta, buffer_size=2))
+    assert found == [
+        ('b', 'b first, second', 'ACGUACG'),
+        ('a', 'a only a', 'GGCC'),
+        ('c', 'c', 'A' * 30),
+    ]
+
+
+def test_stats(fasta):
+    found = sequences.stats(fasta, short=5, size=10)
+    assert found['records'] == 4
+    assert found['total_length'] == 45
+    assert found['min_length'] == 4
+    assert found['max_length'] == 30
+    assert found['n50'] == 30
+    assert found['ambiguous'] == 2
+    assert found['gc'] == pytest.approx(8.0 / 43)
+    assert found['too_short'] == 2
+    assert sum(b['records'] for b in found['histogram']) == 4
+
+
+def test_n50():
+    assert sequences.n50([]) == 0
+    assert sequences.n50([2, 3, 4, 5, 6]) == 5
@@ -0,0 +1,78 @@
+import os
+import csv
+import sys
+import json
+import cPickle
+import subprocess as sp
+
+import pytest
+
+from genome_mapping import validators
+
+from tests.helpers import hits
+from tests.helpers import known
+
+GM = os.path.join(os.path.dirname(__file__), '..', 'bin', 'gm.py')
+
+GRID = [
+    {'matcher': 'passthrough'},
+    {'matcher': 'identity', 'definitions': {'min': [90, 100], 'max': 100,
+                                            'completeness': [50, 100]}},
+]
+
+
+def test_expand_grid_tries_every_combination():
+    specs = validators.expand_grid(GRID)
+    assert [validators.spec_name(s) for s in specs] == [
+        'passthrough',
+        'identity completeness=50 max=100 min=90',
+        'identity completeness=50 max=100 min=100',
+        'identity completeness=100 max=100 min=90',
+        'identity completeness=100 max=100 min=100',
+    ]
+    assert validators.expand_grid({'matcher': 'exact'}) == \
+        [{'matcher': 'exact', 'definitions': {}}]
+
+
+def test_hits_on_unknown_chromosomes_count_as_selected(tmpdir):
+    # The chr2 hit has no known locations to compare with, it is selected
+    # but can never be correct.
+    score = validators.evaluate(known(tmpdir), hits(tmpdir),
+                                {'matcher': 'passthrough'})
+    assert score.selected == 3
+    assert score.correct == 2
+    assert score.exact == 2
+    assert score.precision == pytest.approx(2.0 / 3)
+    assert score.recall == 1.0
+
+
+def test_sweeps_in_processes_match_one_process(tmpdir):
+    specs = validators.expand_grid(GRID)
+    tree = known(tmpdir)
+    found = hits(tmpdir)
+    serial = validators.Sweep(tree, found, processes=1)(specs)
+    parallel = validators.Sweep(tree, found, processes=2)(specs)
+    assert [validators.row(s) for s in parallel] == \
+        [validators.row(s) for s in serial]
+
+    with pytest.raises(ValueError):
+        validators.Sweep(tree, found, processes=1)([{'matcher': 'nope'}])
+
+
+def test_gm_validate_writes_a_score_per_spec(tmpdir):
+    path = tmpdir.join('hits.pickle')
+    with open(str(path), 'wb') as out:
+        for hit in hits(tmpdir):
+            cPickle.dump(hit, out)
+    known(tmpdir)
+    grid = tmpdir.join('grid.json')
+    grid.write(json.dumps(GRID))
+
+    output = sp.check_output([sys.executable, '-W', 'ignore', GM, 'validate',
+                              str(path), str(tmpdir.join('known.gff3')),
+                              str(grid), '-', '--processes', '1'])
+    rows = list(csv.DictReader(output.splitlines()))
+    assert [r['spec'] for r in rows] == \
+        [validators.spec_name(s) for s in validators.expand_grid(GRID)]
+    assert rows[0]['selected'] == '3'
+    assert rows[0]['correct'] == '2'